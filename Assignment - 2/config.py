@@ -2,6 +2,8 @@ import random
 from dataclasses import dataclass
 from typing import Callable, Dict
 
+from tracer import TRACER
+
 @dataclass
 class Config:
     # Capacities
@@ -34,9 +36,8 @@ class Config:
             }
 
         # Initial configuration debug
-        print("[Config] Initialized with parameters:")
-        print(f"  P={self.P}, R={self.R}, OP={self.OP}, sim_time={self.sim_time}, monitor_dt={self.monitor_dt}, seed={self.seed}")
-        print("  Distributions: interarrival=Exp(25), prep=Exp(40), op=Exp(20), rec=Exp(40)")
+        TRACER.record('Config', None, 'initialized', P=self.P, R=self.R, OP=self.OP,
+                      sim_time=self.sim_time, monitor_dt=self.monitor_dt, seed=self.seed)
 
     # Helper to create new patients carrying personal service times by type
     def sample_patient_times(self, ptype: str = 'base') -> Dict[str, float]:
@@ -47,5 +48,6 @@ class Config:
             'rec':  f['rec'](),
         }
         # Debug: show sampled times assigned to the patient
-        print(f"[Config] Assigned times for patient type '{ptype}': prep={times['prep']:.2f}, op={times['op']:.2f}, rec={times['rec']:.2f}")
+        if TRACER.enabled:
+            TRACER.record('Config', None, 'assigned times', ptype=ptype, **times)
         return times
@@ -1,8 +1,17 @@
 import sys
+import argparse
 from config import Config
 from simulation import run_once
+from tracer import TRACER
 
 def main():
+    parser = argparse.ArgumentParser(description="Hospital operating theatre simulation")
+    parser.add_argument('--trace', type=int, default=0, metavar='N',
+                        help='keep the last N trace events in memory and dump them at the end (default: off)')
+    args = parser.parse_args()
+    if args.trace > 0:
+        TRACER.enable(capacity=args.trace)
+
     # Redirect all output to simulation_output.txt
     log_file = open("simulation_output.txt", "w", encoding="utf-8")
     sys.stdout = log_file
@@ -31,8 +40,13 @@ def main():
     print(init_text)
     console.write(init_text + "\n")
 
-    # Run simulation
-    results = run_once(cfg)
+    # Run simulation (on failure, dump the last trace events before re-raising)
+    try:
+        results = run_once(cfg)
+    except Exception:
+        TRACER.dump(file=log_file)
+        TRACER.dump(file=sys.__stderr__)
+        raise
 
     # Final debug (printed to file and console)
     end_text = (
@@ -47,6 +61,10 @@ def main():
     print(end_text)
     console.write(end_text + "\n")
 
+    # Dump trace events on request
+    if TRACER.enabled:
+        TRACER.dump(file=log_file)
+
     log_file.close()
 
 if __name__ == '__main__':
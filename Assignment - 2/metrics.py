@@ -1,3 +1,6 @@
+from tracer import TRACER
+
+
 class Metrics:
     def __init__(self):
         # Counts and times
@@ -14,7 +17,7 @@ class Metrics:
         self.prep_queue_samples_sum = 0.0
         self.prep_queue_samples_n = 0
 
-        print("[Metrics] Metrics initialized.")
+        TRACER.record('Metrics', None, 'initialized')
 
     def set_theatre_state(self, now: float, new_state: str):
         # Accumulate time in the previous state
@@ -24,7 +27,9 @@ class Metrics:
                 self.theatre_busy_time += dur
             elif self.theatre_state == 'blocked':
                 self.theatre_blocked_time += dur
-        print(f"[Metrics] t={now:.1f}: theatre state change {self.theatre_state} -> {new_state} (previous duration={dur:.1f})")
+        if TRACER.enabled:
+            TRACER.record('Metrics', now, 'theatre state change', old=self.theatre_state,
+                          new=new_state, previous_duration=dur)
         self.theatre_state = new_state
         self.last_state_change = now
 
@@ -32,19 +37,23 @@ class Metrics:
         self.n_done += 1
         throughput = t_exit - t_arrival
         self.throughput_sum += throughput
-        print(f"[Metrics] Patient completed at t={t_exit:.1f}, throughput={throughput:.1f}, total patients={self.n_done}")
+        if TRACER.enabled:
+            TRACER.record('Metrics', t_exit, 'patient completed', throughput=throughput,
+                          total_patients=self.n_done)
 
     def record_prep_queue_sample(self, qlen: int):
         self.prep_queue_samples_sum += qlen
         self.prep_queue_samples_n += 1
-        print(f"[Metrics] Preparation queue sample: length={qlen}, samples={self.prep_queue_samples_n}")
+        if TRACER.enabled:
+            TRACER.record('Metrics', None, 'preparation queue sample', length=qlen,
+                          samples=self.prep_queue_samples_n)
 
     def summarize(self, total_time: float):
         util = self.theatre_busy_time / total_time
         block = self.theatre_blocked_time / total_time
         avg_thr = (self.throughput_sum / self.n_done) if self.n_done else float('nan')
         avg_prep_queue = (self.prep_queue_samples_sum / self.prep_queue_samples_n) if self.prep_queue_samples_n else float('nan')
-        print("[Metrics] Final summary calculated.")
+        TRACER.record('Metrics', None, 'final summary calculated')
         return {
             'patients_done': self.n_done,
             'theatre_utilization': util,
@@ -1,22 +1,58 @@
-from dataclasses import dataclass
-
-@dataclass
-class Patient:
-    pid: int
-    ptype: str
-    t_arrival: float
-    prep_time: float
-    op_time: float
-    rec_time: float
-    t_exit: float = None
-
-    def __post_init__(self):
-        # Debug: show patient data when created
-        print(f"[Patient] Patient {self.pid} created (type={self.ptype}) "
-              f"arrival={self.t_arrival:.1f}, prep={self.prep_time:.1f}, "
-              f"op={self.op_time:.1f}, rec={self.rec_time:.1f}")
-
-    def debug_exit(self):
-        if self.t_exit is not None:
-            print(f"[Patient] Patient {self.pid} has left the system "
-                  f"at t={self.t_exit:.1f}, throughput={self.t_exit - self.t_arrival:.1f}")
+from array import array
+
+from tracer import TRACER
+
+NAN = float('nan')
+
+
+class PatientTable:
+    """
+    Structure-of-arrays record of all patients of a run: one slot (row) per
+    arrival, in arrival order, with pid = slot. The simulation passes slot
+    indices instead of patient objects and fills in the time of each stage
+    as it happens (NaN until then); block_time is the time the theatre was
+    held after the operation, waiting for a recovery bed.
+
+    The patient type is stored as an integer code, an index into ptype_names
+    (types get codes in order of first arrival). to_numpy gives the columns as
+    NumPy arrays for vectorized analysis.
+    """
+    COLUMNS = ('ptype', 't_arrival', 'prep_time', 'op_time', 'rec_time',
+               't_prep_start', 't_op_start', 'block_time', 't_exit')
+
+    def __init__(self):
+        self.ptype = array('b')  # codes into ptype_names
+        self.ptype_names = []
+        self._codes = {}
+        for name in self.COLUMNS[1:]:
+            setattr(self, name, array('d'))
+
+    def add(self, t_arrival: float, ptype: str, prep_time: float, op_time: float,
+            rec_time: float) -> int:
+        """Append an arriving patient; returns its slot."""
+        slot = len(self.ptype)
+        code = self._codes.get(ptype)
+        if code is None:
+            code = self._codes[ptype] = len(self.ptype_names)
+            self.ptype_names.append(ptype)
+        self.ptype.append(code)
+        self.t_arrival.append(t_arrival)
+        self.prep_time.append(prep_time)
+        self.op_time.append(op_time)
+        self.rec_time.append(rec_time)
+        for col in (self.t_prep_start, self.t_op_start, self.block_time, self.t_exit):
+            col.append(NAN)
+        # Debug: record patient data when created
+        if TRACER.enabled:
+            TRACER.record('Patient', t_arrival, 'created', pid=slot, ptype=ptype,
+                          prep=prep_time, op=op_time, rec=rec_time)
+        return slot
+
+    def __len__(self):
+        return len(self.ptype)
+
+    def to_numpy(self):
+        """Copy of every column as a NumPy array (NumPy is only needed here)."""
+        import numpy as np
+        return {name: np.array(getattr(self, name)) for name in self.COLUMNS}
+
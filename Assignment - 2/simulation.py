@@ -1,21 +1,23 @@
 import simpy
 from config import Config
-from patient import Patient
+from patient import PatientTable
 from metrics import Metrics
 from monitor import Monitor
 
-def patient_process(env, pat: Patient, prep_res: simpy.Resource, theatre_res: simpy.Resource, rec_res: simpy.Resource, metrics: Metrics):
+def patient_process(env, slot: int, patients: PatientTable, prep_res: simpy.Resource, theatre_res: simpy.Resource, rec_res: simpy.Resource, metrics: Metrics):
     # PREPARATION
     with prep_res.request() as req_prep:
         yield req_prep
-        yield env.timeout(pat.prep_time)
+        patients.t_prep_start[slot] = env.now
+        yield env.timeout(patients.prep_time[slot])
 
     # OPERATION
     with theatre_res.request() as req_op:
         yield req_op
+        patients.t_op_start[slot] = env.now
         # operating theatre busy
         metrics.set_theatre_state(env.now, 'busy')
-        yield env.timeout(pat.op_time)
+        yield env.timeout(patients.op_time[slot])
         # try recovery before releasing the theatre
         rec_req = rec_res.request()
         blocked_start = env.now
@@ -23,38 +25,34 @@ def patient_process(env, pat: Patient, prep_res: simpy.Resource, theatre_res: si
         # explicitly change the state to blocked at the end of the operation
         metrics.set_theatre_state(blocked_start, 'blocked')
         yield rec_req
+        patients.block_time[slot] = env.now - blocked_start
         # recovery bed granted: theatre returns to 'idle'
         metrics.set_theatre_state(env.now, 'idle')
 
     # RECOVERY
-    yield env.timeout(pat.rec_time)
+    yield env.timeout(patients.rec_time[slot])
     rec_res.release(rec_req)
 
     # TERMINATION
-    pat.t_exit = env.now
-    metrics.record_patient_departure(pat.t_exit, pat.t_arrival)
+    patients.t_exit[slot] = env.now
+    metrics.record_patient_departure(env.now, patients.t_arrival[slot])
 
-def generator(env, cfg: Config, prep_res: simpy.Resource, theatre_res: simpy.Resource, rec_res: simpy.Resource, metrics: Metrics):
-    pid = 0
+def generator(env, cfg: Config, patients: PatientTable, prep_res: simpy.Resource, theatre_res: simpy.Resource, rec_res: simpy.Resource, metrics: Metrics):
     while True:
         # wait for the next interarrival
         ia = cfg.interarrival_fn()
         yield env.timeout(ia)
 
-        # create patient with personal service times (carries their times)
+        # new patient slot with personal service times
         times = cfg.sample_patient_times('base')  # future: use different ptypes
-        pat = Patient(
-            pid=pid,
-            ptype='base',
-            t_arrival=env.now,
-            prep_time=times['prep'],
-            op_time=times['op'],
-            rec_time=times['rec'],
-        )
-        env.process(patient_process(env, pat, prep_res, theatre_res, rec_res, metrics))
-        pid += 1
+        slot = patients.add(env.now, 'base', times['prep'], times['op'], times['rec'])
+        env.process(patient_process(env, slot, patients, prep_res, theatre_res, rec_res, metrics))
 
-def run_once(cfg: Config):
+def run_once(cfg: Config, patients: PatientTable = None):
+    """
+    Run one replication and return the metrics summary. An empty PatientTable
+    passed as 'patients' is filled with the records of every patient.
+    """
     env = simpy.Environment()
 
     # Resources (pools)
@@ -66,8 +64,12 @@ def run_once(cfg: Config):
     metrics = Metrics()
     monitor = Monitor(env, prep_res, metrics, cfg.monitor_dt)
 
+    # Per-patient records of the run
+    if patients is None:
+        patients = PatientTable()
+
     # Main processes
-    env.process(generator(env, cfg, prep_res, theatre_res, rec_res, metrics))
+    env.process(generator(env, cfg, patients, prep_res, theatre_res, rec_res, metrics))
 
     # Run
     env.run(until=cfg.sim_time)
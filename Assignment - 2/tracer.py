@@ -0,0 +1,43 @@
+import sys
+from collections import deque
+
+
+class RingTracer:
+    """
+    In-memory ring buffer of structured trace events.
+    - Off by default: record() returns immediately and nothing is stored.
+    - When enabled, only the last `capacity` events are kept, so memory and I/O
+      stay bounded however long the simulation runs.
+    - dump() writes the buffered events on request (or from an exception handler).
+    """
+    def __init__(self, capacity: int = 1000, enabled: bool = False):
+        self.enabled = enabled
+        self.events = deque(maxlen=capacity)
+
+    def enable(self, capacity: int = None):
+        if capacity is not None:
+            self.events = deque(self.events, maxlen=capacity)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def record(self, source: str, t, event: str, **data):
+        # Each event: (source, simulation time or None, event name, fields)
+        if self.enabled:
+            self.events.append((source, t, event, data))
+
+    def dump(self, file=None):
+        file = file if file is not None else sys.stdout
+        print(f"=== Last {len(self.events)} trace events ===", file=file)
+        for source, t, event, data in self.events:
+            when = f"t={t:.1f}: " if t is not None else ""
+            fields = ", ".join(
+                f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                for k, v in data.items()
+            )
+            print(f"[{source}] {when}{event} {fields}".rstrip(), file=file)
+
+
+# Shared tracer used by all simulation modules
+TRACER = RingTracer()
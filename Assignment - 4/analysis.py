@@ -1,100 +1,39 @@
-import simpy, random, math
+import math
 import logging
 import numpy as np
-from typing import Dict, List
+from dataclasses import replace
+from typing import Dict, List, Union
 
 from config import Config
-from metrics import Metrics
-from model import Monitor, source_process
+from runner import (
+    run_once, run_replications, accumulate_replications, antithetic_jobs, pair_averages,
+    get_checkpoint
+)
+from checkpoint import Checkpoint
+from stats import RunningStats, PairedStats, control_variates
+from model import CONTROL_KEYS, PTYPE_NAMES, PatientTable, expected_input_means
+from metrics import QUANTILES
+from warmup import resolve_warmups
+from selection import kn_select
+from optimize import CapacitySearch
+from splitting import restart_estimate
+from design import Effect, FactorialDesign, fit_effects, fractional_design
 
 logger = logging.getLogger("hospital_sim")
 
 
-def run_once(cfg: Config) -> Dict[str, float]:
-    logger.debug(
-        "Running one replication: P=%d, R=%d, OP=%d, sim_time=%.3f, warmup=%.3f, seed=%d, scenario=%s",
-        cfg.P, cfg.R, cfg.OP, cfg.sim_time, cfg.warmup, cfg.seed, cfg.scenario
-    )
-
-    # Separate RNGs to maintain CRN across configurations
-    rng_arr = random.Random(cfg.seed + 100)  # arrivals
-    rng_prep = random.Random(cfg.seed + 200)  # preparation
-    rng_op = random.Random(cfg.seed + 300)    # operation
-    rng_rec = random.Random(cfg.seed + 400)   # recovery
-
-    env = simpy.Environment()
-
-    prep_res = simpy.Resource(env, capacity=cfg.P)
-    theatre_res = simpy.Resource(env, capacity=cfg.OP)
-    rec_res = simpy.Resource(env, capacity=cfg.R)
-
-    metrics = Metrics(rec_capacity=cfg.R, verbose=cfg.verbose)
-
-    Monitor(env, prep_res, metrics, cfg.monitor_dt)
-
-    # Pass separate RNGs to the arrival process
-    env.process(source_process(
-        env, cfg, prep_res, theatre_res, rec_res, metrics,
-        rng_arr, rng_prep, rng_op, rng_rec
-    ))
-
-    def do_warmup(env: simpy.Environment, metrics: Metrics, warmup: float):
-        logger.debug("Starting warm-up period of length %.3f", warmup)
-        yield env.timeout(warmup)
-        logger.debug("Warm-up finished at time %.3f, starting observation", env.now)
-        metrics.start_observation(env.now)
-
-        # --- Synchronize real state after warm-up ---
-        metrics.rec_count = rec_res.count
-        if theatre_res.count > 0:
-            metrics.theatre_state = "busy"
-            metrics.last_state_change = env.now
-        else:
-            metrics.theatre_state = "idle"
-
-        logger.debug(
-            "Post-warmup sync: theatre_state=%s, rec_count=%d (cap=%d)",
-            metrics.theatre_state, metrics.rec_count, metrics.rec_capacity
-        )
-
-    env.process(do_warmup(env, metrics, cfg.warmup))
-    env.run(until=cfg.warmup + cfg.sim_time)
-
-    res = metrics.summarize(env.now)
-    res.update({"P": cfg.P, "R": cfg.R, "scenario": cfg.scenario})
-
-    logger.debug(
-        "Replication finished: P=%d, R=%d, scenario=%s, block_rate=%.6f, avg_qprep=%.6f, avg_prep_idle=%.6f, prob_rec_full=%.6f, avg_rec_wait=%.6f",
-        cfg.P, cfg.R, cfg.scenario,
-        res["theatre_block_rate"],
-        res["avg_prep_queue_length"],
-        res["avg_prep_idle_capacity"],
-        res["prob_recovery_all_busy"],
-        res["avg_rec_wait"]
-    )
-
-    return res
-
-
-def mean_ci_95(samples: List[float]):
-    """Compute mean and 95% CI using fixed t_crit=2.093 (df=19)."""
-    n = len(samples)
-    if n == 0:
-        return float("nan"), float("nan"), (float("nan"), float("nan"))
-
-    mean = sum(samples) / n
-    if n == 1:
-        return mean, float("nan"), (mean, mean)
-
-    var = sum((x - mean) ** 2 for x in samples) / (n - 1)
-    s = math.sqrt(var)
-    t_crit = 2.093  # critical t-value for df=19
-    half = t_crit * s / math.sqrt(n)
-
-    return mean, half, (mean - half, mean + half)
+def mean_ci_95(samples: Union[List[float], RunningStats, PairedStats]):
+    """
+    Compute mean and 95% CI with the Student-t quantile for df=n-1.
+    Accepts a list of samples or an online accumulator (RunningStats, or
+    PairedStats for the mean difference).
+    """
+    if isinstance(samples, (RunningStats, PairedStats)):
+        return samples.ci(0.95)
+    return RunningStats.from_samples(samples).ci(0.95)
 
 
-def print_metric(label: str, samples: List[float]):
+def print_metric(label: str, samples: Union[List[float], RunningStats]):
     """Print mean, 95% CI and relative half-width for a metric."""
     m, h, (lo, hi) = mean_ci_95(samples)
 
@@ -118,6 +57,29 @@ def print_metric(label: str, samples: List[float]):
             label, m, lo, hi
         )
 
+def compare_backends(cfg: Config, seeds: List[int]) -> Dict[str, float]:
+    """
+    Run cfg with the SimPy and heap backends on the same seeds and return the
+    largest absolute difference per metric (0.0 means identical results).
+    """
+    jobs = [(replace(cfg, backend=backend), seed) for seed in seeds for backend in ("simpy", "heap")]
+    all_res = run_replications(jobs)
+
+    max_diff = {}
+    for res_s, res_h in zip(all_res[0::2], all_res[1::2]):
+        for key, val in res_s.items():
+            if not isinstance(val, (int, float)):
+                continue
+            if math.isnan(val) and math.isnan(res_h[key]):
+                diff = 0.0
+            else:
+                diff = abs(val - res_h[key])
+            max_diff[key] = max(max_diff.get(key, 0.0), diff)
+
+    logger.info("Backend comparison over %d seeds: %s", len(seeds), max_diff)
+    return max_diff
+
+
 def run_independent_experiments():
     print("=== Independent experiments (different seeds) ===")
     logger.info("Starting independent experiments with different seeds")
@@ -136,15 +98,18 @@ def run_independent_experiments():
         for name in configs.keys()
     }
 
-    for idx, (name, cfg) in enumerate(configs.items()):
-        print(f"\n--- Config {name} ---")
-        logger.info("Running config %s with %d replications", name, n_rep)
+    jobs = [
+        (cfg, base_seed + 1000 * idx + r)
+        for idx, cfg in enumerate(configs.values())
+        for r in range(n_rep)
+    ]
+    all_res = run_replications(jobs)
 
-        for r in range(n_rep):
-            cfg.seed = base_seed + 1000 * idx + r
-            logger.debug("Replication %d for config %s with seed %d", r + 1, name, cfg.seed)
+    for idx, name in enumerate(configs.keys()):
+        print(f"\n--- Config {name} ---")
+        logger.info("Config %s: %d replications", name, n_rep)
 
-            res = run_once(cfg)
+        for res in all_res[idx * n_rep:(idx + 1) * n_rep]:
             results[name]["block"].append(res["theatre_block_rate"])
             results[name]["qprep"].append(res["avg_prep_queue_length"])
             results[name]["recfull"].append(res["prob_recovery_all_busy"])
@@ -169,29 +134,27 @@ def run_crn_experiments():
     cfg_3P5R = Config(P=3, R=5)
     cfg_4P5R = Config(P=4, R=5)
 
-    diff_block_3P5R_4P5R = []
-    diff_block_3P5R_3P4R = []
-    diff_q_3P5R_4P5R = []
-    diff_q_3P5R_3P4R = []
+    diff_block_3P5R_4P5R = PairedStats()
+    diff_block_3P5R_3P4R = PairedStats()
+    diff_q_3P5R_4P5R = PairedStats()
+    diff_q_3P5R_3P4R = PairedStats()
 
+    # The three configs share the seed of each replication (CRN)
+    jobs = []
     for r in range(n_rep):
         seed = base_seed + r
-        cfg_3P4R.seed = seed
-        cfg_3P5R.seed = seed
-        cfg_4P5R.seed = seed
-
-        logger.debug("CRN replication %d with shared seed %d", r + 1, seed)
+        jobs += [(cfg_3P4R, seed), (cfg_3P5R, seed), (cfg_4P5R, seed)]
+    all_res = run_replications(jobs)
 
-        res_3P4R = run_once(cfg_3P4R)
-        res_3P5R = run_once(cfg_3P5R)
-        res_4P5R = run_once(cfg_4P5R)
+    for r in range(n_rep):
+        res_3P4R, res_3P5R, res_4P5R = all_res[3 * r:3 * r + 3]
 
-        diff_block_3P5R_4P5R.append(res_3P5R["theatre_block_rate"] - res_4P5R["theatre_block_rate"])
-        diff_block_3P5R_3P4R.append(res_3P5R["theatre_block_rate"] - res_3P4R["theatre_block_rate"])
-        diff_q_3P5R_4P5R.append(res_3P5R["avg_prep_queue_length"] - res_4P5R["avg_prep_queue_length"])
-        diff_q_3P5R_3P4R.append(res_3P5R["avg_prep_queue_length"] - res_3P4R["avg_prep_queue_length"])
+        diff_block_3P5R_4P5R.add(res_3P5R["theatre_block_rate"], res_4P5R["theatre_block_rate"])
+        diff_block_3P5R_3P4R.add(res_3P5R["theatre_block_rate"], res_3P4R["theatre_block_rate"])
+        diff_q_3P5R_4P5R.add(res_3P5R["avg_prep_queue_length"], res_4P5R["avg_prep_queue_length"])
+        diff_q_3P5R_3P4R.add(res_3P5R["avg_prep_queue_length"], res_3P4R["avg_prep_queue_length"])
 
-    def print_diff(label: str, diffs: List[float]):
+    def print_diff(label: str, diffs: PairedStats):
         m, h, (lo, hi) = mean_ci_95(diffs)
         print(f"{label}: mean diff={m:.6f}, 95%CI=({lo:.6f},{hi:.6f})")
         logger.info("%s: mean_diff=%.6f, 95%%CI=(%.6f,%.6f)", label, m, lo, hi)
@@ -218,17 +181,20 @@ def compare_block_vs_recfull_ci():
         "4P5R": Config(P=4, R=5),
     }
 
-    for idx, (name, cfg) in enumerate(configs.items()):
+    jobs = [
+        (cfg, base_seed + 1000 * idx + r)
+        for idx, cfg in enumerate(configs.values())
+        for r in range(n_rep)
+    ]
+    all_res = run_replications(jobs)
+
+    for idx, name in enumerate(configs.keys()):
         blocks = []
         recfulls = []
 
         logger.info("Config %s: computing CI for block and recovery-full", name)
 
-        for r in range(n_rep):
-            cfg.seed = base_seed + 1000 * idx + r
-            logger.debug("CI replication %d for config %s with seed %d", r + 1, name, cfg.seed)
-
-            res = run_once(cfg)
+        for res in all_res[idx * n_rep:(idx + 1) * n_rep]:
             blocks.append(res["theatre_block_rate"])
             recfulls.append(res["prob_recovery_all_busy"])
 
@@ -273,25 +239,24 @@ def twisted_scenario_experiment():
         mild_op_mean=15.0
     )
 
-    diff_block = []
-    diff_qprep = []
-    diff_recfull = []
+    diff_block = PairedStats()
+    diff_qprep = PairedStats()
+    diff_recfull = PairedStats()
 
+    jobs = []
     for r in range(n_rep):
         seed = base_seed + r
-        cfg_orig.seed = seed
-        cfg_twist.seed = seed
-
-        logger.debug("Twisted replication %d with shared seed %d", r + 1, seed)
+        jobs += [(cfg_orig, seed), (cfg_twist, seed)]
+    all_res = run_replications(jobs)
 
-        res_o = run_once(cfg_orig)
-        res_t = run_once(cfg_twist)
+    for r in range(n_rep):
+        res_o, res_t = all_res[2 * r:2 * r + 2]
 
-        diff_block.append(res_t["theatre_block_rate"] - res_o["theatre_block_rate"])
-        diff_qprep.append(res_t["avg_prep_queue_length"] - res_o["avg_prep_queue_length"])
-        diff_recfull.append(res_t["prob_recovery_all_busy"] - res_o["prob_recovery_all_busy"])
+        diff_block.add(res_t["theatre_block_rate"], res_o["theatre_block_rate"])
+        diff_qprep.add(res_t["avg_prep_queue_length"], res_o["avg_prep_queue_length"])
+        diff_recfull.add(res_t["prob_recovery_all_busy"], res_o["prob_recovery_all_busy"])
 
-    def print_diff(label: str, diffs: List[float]):
+    def print_diff(label: str, diffs: PairedStats):
         m, h, (lo, hi) = mean_ci_95(diffs)
         print(f"{label}: mean diff={m:.6f}, 95%CI=({lo:.6f},{hi:.6f})")
         logger.info("%s: mean_diff=%.6f, 95%%CI=(%.6f,%.6f)", label, m, lo, hi)
@@ -301,6 +266,472 @@ def twisted_scenario_experiment():
     print_diff("avg queue before prep", diff_qprep)
     print_diff("P(all recovery busy)", diff_recfull)
 
+def relative_half_width(samples: Union[List[float], RunningStats]) -> float:
+    """Relative half-width h/mean of the 95% CI (0 if h=0, inf if undefined)."""
+    m, h, _ = mean_ci_95(samples)
+    if h == 0:
+        return 0.0
+    if m > 0 and not math.isnan(h):
+        return h / m
+    return float("inf")
+
+
+def run_until_precision(cfg: Config, targets: Dict[str, float], base_seed: int,
+                        min_rep: int = 10, batch_size: int = 10, max_rep: int = 500):
+    """
+    Sequential replications: add replications of cfg in batches until every
+    metric in 'targets' (result key -> target relative half-width) is precise
+    enough, or max_rep replications have been run.
+
+    The size of each new batch is estimated from the least precise metric
+    (half-width shrinks like 1/sqrt(n)), but is at least batch_size.
+    Replication r uses seed base_seed + r. Returns (RunningStats per metric, n).
+    """
+    samples = {key: RunningStats() for key in targets}
+    n = 0
+    n_next = min_rep
+
+    while True:
+        batch = accumulate_replications(
+            ((cfg, base_seed + r) for r in range(n, n + n_next)), targets.keys()
+        )
+        for key in samples:
+            samples[key].merge(batch[key])
+        n += n_next
+
+        n_needed = n
+        for key, target in targets.items():
+            rel = relative_half_width(samples[key])
+            if rel > target:
+                n_needed = max(n_needed, math.ceil(n * (rel / target) ** 2))
+
+        if n_needed <= n or n >= max_rep:
+            break
+        n_next = min(max(n_needed - n, batch_size), max_rep - n)
+
+    logger.info(
+        "Sequential replications for P=%d, R=%d: %d replications (budget %d)",
+        cfg.P, cfg.R, n, max_rep
+    )
+    return samples, n
+
+
+def run_adaptive_experiments():
+    print("\n\n=== Sequential replications (target relative half-width 10%) ===")
+    logger.info("Starting sequential replication experiments")
+
+    base_seed = 60_000
+    target = 0.10
+    max_rep = 400
+
+    configs = {
+        "3P4R": Config(P=3, R=4),
+        "3P5R": Config(P=3, R=5),
+        "4P5R": Config(P=4, R=5),
+    }
+
+    labels = {
+        "theatre_block_rate": "P(block OR)",
+        "avg_prep_queue_length": "avg queue before prep",
+        "avg_prep_idle_capacity": "avg idle capacity in prep",
+        "prob_recovery_all_busy": "P(all recovery busy)",
+    }
+    targets = {key: target for key in labels}
+
+    for idx, (name, cfg) in enumerate(configs.items()):
+        samples, n = run_until_precision(cfg, targets, base_seed + 1000 * idx, max_rep=max_rep)
+
+        met = all(relative_half_width(samples[key]) <= target for key in targets)
+        status = "all targets met" if met else "budget reached"
+        print(f"\n--- Config {name}: {n} replications ({status}) ---")
+
+        for key, label in labels.items():
+            print_metric(label, samples[key])
+
+
+def lag1_autocorrelation(values: List[float]) -> float:
+    """Lag-1 autocorrelation of a series (nan if undefined)."""
+    x = np.asarray(values, dtype=float)
+    if len(x) < 3:
+        return float("nan")
+    x = x - x.mean()
+    denom = float(np.dot(x, x))
+    return float(np.dot(x[:-1], x[1:]) / denom) if denom > 0 else float("nan")
+
+
+def run_batch_means_experiments():
+    print("\n\n=== Batch means: one long run per config (20 batches of 1000) ===")
+    logger.info("Starting batch-means experiments")
+
+    base_seed = 70_000
+    n_batches = 20
+    batch_len = 1000.0
+
+    configs = {
+        "3P4R": Config(P=3, R=4),
+        "3P5R": Config(P=3, R=5),
+        "4P5R": Config(P=4, R=5),
+    }
+
+    labels = {
+        "theatre_block_rate": "P(block OR)",
+        "avg_prep_queue_length": "avg queue before prep",
+        "avg_prep_idle_capacity": "avg idle capacity in prep",
+        "prob_recovery_all_busy": "P(all recovery busy)",
+    }
+
+    # A single warm-up per config instead of one per replication
+    jobs = [
+        (replace(cfg, sim_time=n_batches * batch_len, batches=n_batches), base_seed + idx)
+        for idx, cfg in enumerate(configs.values())
+    ]
+    all_res = run_replications(jobs)
+
+    for name, res in zip(configs.keys(), all_res):
+        print(f"\n--- Config {name}: {n_batches} batches ---")
+        logger.info("Config %s: batch means over %d batches", name, n_batches)
+
+        for key, label in labels.items():
+            values = [b[key] for b in res["batches"]]
+            print_metric(label, values)
+            print(f" lag-1 autocorrelation of batch means = {lag1_autocorrelation(values):.3f}")
+
+
+def run_antithetic_experiment():
+    print("\n\n=== Antithetic variates: pairs driven by U and 1-U ===")
+    logger.info("Starting antithetic variates experiment")
+
+    base_seed = 110_000
+    n_pairs = 50
+
+    configs = {
+        "3P4R": Config(P=3, R=4),
+        "4P5R": Config(P=4, R=5),
+    }
+    keys = {
+        "avg_throughput_time": "avg throughput time",
+        "avg_prep_queue_length": "avg queue before prep",
+        "theatre_block_rate": "P(block OR)",
+    }
+
+    # Same budget: 2 * n_pairs independent replications vs n_pairs antithetic pairs
+    for name, cfg in configs.items():
+        indep = run_replications([(cfg, base_seed + 1000 + r) for r in range(2 * n_pairs)])
+        runs = run_replications(antithetic_jobs([(cfg, base_seed + r) for r in range(n_pairs)]))
+        pairs = pair_averages(runs)
+
+        print(f"\n--- Config {name}: {2 * n_pairs} independent replications "
+              f"vs {n_pairs} antithetic pairs ---")
+        for key, label in keys.items():
+            _, h_ind, _ = mean_ci_95([res[key] for res in indep])
+            m, h_anti, _ = mean_ci_95([res[key] for res in pairs])
+            # Var(pair average) = Var(X) / 2 * (1 + rho): reduction factor 1 / (1 + rho)
+            rho = float(np.corrcoef([res[key] for res in runs[0::2]],
+                                    [res[key] for res in runs[1::2]])[0, 1])
+            print(f"{label}: antithetic mean={m:.4f}, half-width={h_anti:.4f} "
+                  f"(independent {h_ind:.4f}), pair correlation={rho:+.3f}, "
+                  f"variance reduction factor={1 / (1 + rho):.2f}")
+            logger.info("%s %s: antithetic pair correlation %.3f", name, key, rho)
+
+
+def run_control_variates_experiment():
+    print("\n\n=== Control variates: regression on the input sample means ===")
+    logger.info("Starting control variates experiment")
+
+    base_seed = 120_000
+    n_rep = 50
+
+    configs = {
+        "3P4R": Config(P=3, R=4, controls=True),
+        "3P5R twisted": Config(P=3, R=5, scenario="twisted", controls=True),
+    }
+    keys = {
+        "avg_throughput_time": "avg throughput time",
+        "avg_prep_queue_length": "avg queue before prep",
+        "theatre_block_rate": "P(block OR)",
+        "prob_recovery_all_busy": "P(all recovery busy)",
+    }
+
+    print(f"Controls: sample means of {', '.join(k[3:] for k in CONTROL_KEYS)} times "
+          f"(known expectations from Config); {n_rep} replications per config")
+
+    for name, cfg in configs.items():
+        all_res = run_replications([(cfg, base_seed + r) for r in range(n_rep)])
+        mu = expected_input_means(cfg)
+        controls = [[res[k] for k in CONTROL_KEYS] for res in all_res]
+
+        print(f"\n--- Config {name} ---")
+        for key, label in keys.items():
+            y = [res[key] for res in all_res]
+            m, h, _ = mean_ci_95(y)
+            cv = control_variates(y, controls, [mu[k] for k in CONTROL_KEYS])
+            print(f"{label}: plain mean={m:.4f} ± {h:.4f}, "
+                  f"control-variate mean={cv['mean']:.4f} ± {cv['half']:.4f}, "
+                  f"variance reduction factor={cv['vrf']:.2f}")
+            logger.info("%s %s: control variates reduce the variance by a factor %.2f", name, key, cv["vrf"])
+
+
+def run_patient_experiment():
+    print("\n\n=== Per-patient records: waits by patient type (one long run) ===")
+    logger.info("Starting per-patient experiment")
+
+    base_seed = 140_000
+    configs = {
+        "3P4R": Config(P=3, R=4, sim_time=100_000.0),
+        "3P4R twisted": Config(P=3, R=4, sim_time=100_000.0, scenario="twisted"),
+    }
+
+    for name, cfg in configs.items():
+        patients = PatientTable()
+        res = run_once(replace(cfg, seed=base_seed), patients)
+        col = patients.to_numpy()
+        end = cfg.warmup + cfg.sim_time
+
+        # Departures during the observation period are those Metrics averages over
+        departed = (col["t_exit"] >= cfg.warmup) & (col["t_exit"] <= end)
+        throughput = col["t_exit"] - col["t_arrival"]
+        prep_wait = col["t_prep_start"] - col["t_arrival"]
+        theatre_wait = col["t_op_start"] - (col["t_prep_start"] + col["prep_time"])
+
+        print(f"\n--- Config {name}: {len(patients)} patients, {int(departed.sum())} departures observed ---")
+        print(f"avg throughput time from the records={throughput[departed].mean():.4f} "
+              f"(Metrics: {res['avg_throughput_time']:.4f})")
+        print(f"{'type':>7} {'n':>6} {'throughput':>11} {'prep wait':>10} {'theatre wait':>13} "
+              f"{'block':>8} {'P(blocked)':>11}")
+        for code, ptype in enumerate(PTYPE_NAMES):
+            sel = departed & (col["ptype"] == code)
+            n = int(sel.sum())
+            if n == 0:
+                continue
+            print(f"{ptype:>7} {n:6d} {throughput[sel].mean():11.4f} {prep_wait[sel].mean():10.4f} "
+                  f"{theatre_wait[sel].mean():13.4f} {col['block_time'][sel].mean():8.4f} "
+                  f"{(col['block_time'][sel] > 0).mean():11.4f}")
+        logger.info("%s: per-patient records of %d patients", name, len(patients))
+
+
+def run_quantile_experiment():
+    print("\n\n=== Tail quantiles: throughput time and recovery wait ===")
+    logger.info("Starting quantile experiment")
+
+    base_seed = 150_000
+    n_rep = 50
+    quantities = {"throughput_time": "throughput time", "rec_wait": "recovery wait"}
+    keys = [f"p{round(100 * q)}_{name}" for name in quantities for q in QUANTILES]
+
+    print(f"Streaming quantile sketches, {n_rep} replications per config: mean of the "
+          f"per-replication quantiles with 95% CI, and the quantile of all replications "
+          f"pooled by merging their sketches")
+
+    for name, cfg in {"3P4R": Config(P=3, R=4), "3P5R": Config(P=3, R=5),
+                      "4P5R": Config(P=4, R=5)}.items():
+        acc = accumulate_replications(
+            [(cfg, base_seed + r) for r in range(n_rep)], keys, sketches=quantities
+        )
+        print(f"\n--- Config {name} ---")
+        for quantity, label in quantities.items():
+            sketch = acc[quantity]
+            for q in QUANTILES:
+                m, h, _ = acc[f"p{round(100 * q)}_{quantity}"].ci(0.95)
+                print(f"{label} p{round(100 * q)}: per-replication mean={m:.4f} ± {h:.4f}, "
+                      f"pooled={sketch.quantile(q):.4f}")
+            print(f"{label}: {len(sketch)} observations pooled in {len(sketch.means)} centroids")
+
+    # Accuracy of the sketches against the exact quantiles of one long run
+    cfg = Config(P=3, R=4, sim_time=1_000_000.0, seed=base_seed)
+    patients = PatientTable()
+    res = run_once(cfg, patients)
+    col = patients.to_numpy()
+    end = cfg.warmup + cfg.sim_time
+    # Observations recorded during the observation period, as in Metrics
+    rec_start = col["t_op_start"] + col["op_time"] + col["block_time"]
+    exact = {
+        "throughput_time": (col["t_exit"] - col["t_arrival"])[(col["t_exit"] >= cfg.warmup) & (col["t_exit"] <= end)],
+        "rec_wait": col["block_time"][(rec_start >= cfg.warmup) & (rec_start <= end)],
+    }
+    print(f"\nOne long run of 3P4R ({len(patients)} patients), sketch vs exact quantile:")
+    for quantity, label in quantities.items():
+        for q in QUANTILES:
+            key = f"p{round(100 * q)}_{quantity}"
+            print(f"{label} p{round(100 * q)}: sketch={res[key]:.4f}, "
+                  f"exact={float(np.quantile(exact[quantity], q)):.4f}")
+        logger.info("%s quantiles from %d observations", quantity, len(exact[quantity]))
+
+
+def run_splitting_experiment():
+    print("\n\n=== Rare-event splitting (RESTART) for P(block OR) ===")
+    logger.info("Starting splitting experiment")
+
+    base_seed = 130_000
+    n_restart = 400
+    n_crude = 1000
+
+    configs = {
+        "4P7R": Config(P=4, R=7),
+        "4P8R": Config(P=4, R=8),
+    }
+
+    for name, cfg in configs.items():
+        rs = restart_estimate(cfg, n_restart, base_seed)
+        crude = run_replications([(cfg, base_seed + 10_000 + r) for r in range(n_crude)])
+        crude_stats = RunningStats.from_samples(res["theatre_block_rate"] for res in crude)
+        crude_time = n_crude * (cfg.warmup + cfg.sim_time)
+
+        print(f"\n--- Config {name}: occupancy thresholds {rs['thresholds']}, "
+              f"splitting factors {rs['splits']} ---")
+        m, h, (lo, hi) = rs["stats"].ci(0.95)
+        print(f"RESTART: P(block OR)={m:.3e}, 95%CI=({lo:.3e},{hi:.3e}), "
+              f"relative half-width={h / m:.2%}, {n_restart} replications, "
+              f"{rs['trajectories']} trajectories, simulated time {rs['simulated_time']:.0f}")
+        mc, hc, (loc, hic) = crude_stats.ci(0.95)
+        rel_c = f"{hc / mc:.2%}" if mc > 0 else "n/a (never blocked)"
+        print(f"Crude MC: P(block OR)={mc:.3e}, 95%CI=({loc:.3e},{hic:.3e}), "
+              f"relative half-width={rel_c}, {n_crude} replications, simulated time {crude_time:.0f}")
+        if mc > 0:
+            # Work-normalized: relative variance x simulated time
+            gain = ((hc / mc) ** 2 * crude_time) / ((h / m) ** 2 * rs["simulated_time"])
+            print(f"Efficiency gain of RESTART (work-normalized relative variance): {gain:.1f}x")
+
+
+def run_design(design: FactorialDesign, base_cfg: Config, n_rep: int, base_seed: int,
+               keys: List[str], name: str) -> List[Dict]:
+    """
+    Run n_rep replications of every cell of a two-level design and return, per
+    cell: factor levels, config, warm-up, the mean of each result key and the
+    replication values of each key (under "reps").
+
+    All cells are dispatched as one parallel batch (after one batch of pilot
+    runs for warm-up detection). Cell i (from 1) uses seeds
+    base_seed + 1000 * i + r. Finished cells are recorded in the checkpoint
+    under 'name' and are not run again when resuming.
+    """
+    cfgs = design.configs(base_cfg)
+
+    # Cells finished in an earlier, interrupted run come from the checkpoint
+    ckpt = get_checkpoint()
+    cell_keys = [
+        Checkpoint.cell_key(name, [
+            replace(cfg, seed=base_seed + 1000 * (i + 1) + r) for r in range(n_rep)
+        ])
+        for i, cfg in enumerate(cfgs)
+    ]
+    done = {}
+    if ckpt is not None:
+        for key in cell_keys:
+            data = ckpt.get_cell(key)
+            if data is not None and all(k in data.get("reps", {}) for k in keys):
+                done[key] = data
+    todo = [i for i, key in enumerate(cell_keys) if key not in done]
+
+    todo_cfgs = resolve_warmups([cfgs[i] for i in todo])
+    jobs = [
+        (cfg, base_seed + 1000 * (i + 1) + r)
+        for i, cfg in zip(todo, todo_cfgs)
+        for r in range(n_rep)
+    ]
+    all_res = run_replications(jobs)
+
+    for k, (i, cfg) in enumerate(zip(todo, todo_cfgs)):
+        cell_res = all_res[k * n_rep:(k + 1) * n_rep]
+        data = {"warmup": cfg.warmup, "reps": {}}
+        for key in keys:
+            data["reps"][key] = [res[key] for res in cell_res]
+            data[key] = sum(data["reps"][key]) / n_rep
+        done[cell_keys[i]] = data
+        if ckpt is not None:
+            ckpt.add_cell(cell_keys[i], data)
+
+    return [
+        dict(done[key], levels=design.levels(i), cfg=cfg)
+        for i, (key, cfg) in enumerate(zip(cell_keys, cfgs))
+    ]
+
+
+def run_selection_experiment():
+    print("\n\n=== Ranking and selection (KN, CRN): best capacity configuration ===")
+    logger.info("Starting ranking-and-selection experiment")
+
+    base_seed = 90_000
+
+    configs = {
+        "3P4R": Config(P=3, R=4),
+        "3P5R": Config(P=3, R=5),
+        "4P4R": Config(P=4, R=4),
+        "4P5R": Config(P=4, R=5),
+        "4P4R2OP": Config(P=4, R=4, OP=2),
+    }
+
+    problems = [
+        ("avg_throughput_time", "avg throughput time", 1.0),
+        ("avg_prep_queue_length", "avg queue before prep", 0.05),
+    ]
+
+    for metric, label, delta in problems:
+        sel = kn_select(configs, metric, delta, base_seed)
+
+        print(f"\nMinimize {label}, indifference zone delta={delta}, PCS >= 95%:")
+        for name in configs:
+            if name in sel["duplicates"]:
+                when = f"identical to {sel['duplicates'][name]}, dropped"
+            elif name in sel["eliminated"]:
+                when = f"eliminated after {sel['eliminated'][name]} replications"
+            else:
+                when = "selected"
+            print(f" {name:8s}: mean={sel['means'][name]:.4f}, "
+                  f"{sel['n_rep'][name]} replications, {when}")
+        status = "" if sel["guaranteed"] else " (replication budget reached, no PCS guarantee)"
+        print(f"Selected: {sel['best']}{status}; {sel['total_rep']} replications in total")
+
+
+def run_optimization_experiment():
+    print("\n\n=== Capacity optimization: stochastic search over (P, R, OP) ===")
+    logger.info("Starting capacity optimization experiment")
+
+    base_seed = 100_000
+    base_cfg = Config(P=3, R=4)
+
+    def print_result(opt):
+        P, R, OP = opt["point"]
+        path = " -> ".join(f"{p}/{r}/{op}" for p, r, op in opt["path"])
+        print(f" Result: P={P}, R={R}, OP={OP}, cost={opt['cost']:.0f}, "
+              f"mean={opt['mean']:.4f} ± {opt['half']:.4f}")
+        print(f" Path (P/R/OP): {path}")
+        print(f" {opt['evaluated']} of {grid} points evaluated, {opt['replications']} replications")
+
+    search = CapacitySearch(base_cfg, "avg_throughput_time", base_seed)
+    grid = math.prod(hi - lo + 1 for lo, hi in search.bounds.values())
+    costs = ", ".join(f"{k}={v:g}" for k, v in search.costs.items())
+    bounds = ", ".join(f"{k} in {lo}..{hi}" for k, (lo, hi) in search.bounds.items())
+    print(f"Unit costs: {costs}; bounds: {bounds}; {search.n_rep} CRN replications per point")
+
+    budget = 14
+    print(f"\nMinimize avg throughput time subject to cost <= {budget}:")
+    print_result(search.minimize(budget))
+
+    # Same search object: points evaluated above are reused
+    target = 120.0
+    print(f"\nCheapest configuration with avg throughput time <= {target:g} (upper 95% CI bound):")
+    opt = search.cheapest(target)
+    if not opt["met"]:
+        print(" Target not reachable within the bounds")
+    print_result(opt)
+
+
+# Factors of the 2^4 factorial: (low, high) Config overrides
+FACTORIAL_FACTORS = {
+    # F1: Arrival rate
+    "A": ({"interarrival_dist": "exp", "interarrival_mean": 25.0,
+           "interarrival_low": 20.0, "interarrival_high": 30.0},
+          {"interarrival_dist": "exp", "interarrival_mean": 22.5,
+           "interarrival_low": 20.0, "interarrival_high": 25.0}),
+    # F2: Preparation distribution
+    "B": ({"prep_dist": "exp"}, {"prep_dist": "unif"}),
+    # F3: Recovery distribution
+    "C": ({"rec_dist": "exp"}, {"rec_dist": "unif"}),
+    # F4: Number of preparation rooms
+    "D": ({"P": 4}, {"P": 5}),
+}
+
+
 def run_factorial_experiments():
     print("\n\n=== Factorial experiment: effects on avg prep queue ===")
     logger.info("Starting factorial experiment")
@@ -308,144 +739,125 @@ def run_factorial_experiments():
     n_rep = 20
     base_seed = 50_000
 
-    # Factor levels: -1 and +1
-    levels = [-1, +1]
+    design = FactorialDesign(FACTORIAL_FACTORS)
+
+    # Recovery rooms fixed (simplifies design); warm-up detected per cell
+    base_cfg = Config(P=4, R=4, warmup=None)
+
+    cells = run_design(design, base_cfg, n_rep, base_seed, ["avg_prep_queue_length"], "factorial")
 
     results = []
-    exp_index = 0
-
-    for A in levels:   # Arrival rate/type
-        for B in levels:  # Prep distribution
-            for C in levels:  # Recovery distribution
-                for D in levels:  # Number of prep rooms P
-                    exp_index += 1
-
-                    # -------------------------
-                    # Map factor levels to actual config values
-                    # -------------------------
-
-                    # F1: Arrival distribution
-                    if A == -1:
-                        interarrival_dist = "exp"
-                        interarrival_mean = 25.0
-                        interarrival_low = 20.0
-                        interarrival_high = 30.0
-                    else:
-                        interarrival_dist = "exp"
-                        interarrival_mean = 22.5
-                        interarrival_low = 20.0
-                        interarrival_high = 25.0
-
-                    # F2: Preparation distribution
-                    if B == -1:
-                        prep_dist = "exp"
-                        prep_mean = 40.0
-                        prep_low = 30.0
-                        prep_high = 50.0
-                    else:
-                        prep_dist = "unif"
-                        prep_mean = 40.0
-                        prep_low = 30.0
-                        prep_high = 50.0
-
-                    # F3: Recovery distribution
-                    if C == -1:
-                        rec_dist = "exp"
-                        rec_mean = 40.0
-                        rec_low = 30.0
-                        rec_high = 50.0
-                    else:
-                        rec_dist = "unif"
-                        rec_mean = 40.0
-                        rec_low = 30.0
-                        rec_high = 50.0
-
-                    # F4: Number of preparation rooms
-                    P = 4 if D == -1 else 5
-
-                    # Recovery rooms fixed (simplifies design)
-                    R = 4
-
-                    cfg = Config(
-                        P=P,
-                        R=R,
-                        interarrival_dist=interarrival_dist,
-                        interarrival_mean=interarrival_mean,
-                        interarrival_low=interarrival_low,
-                        interarrival_high=interarrival_high,
-                        prep_dist=prep_dist,
-                        prep_mean=prep_mean,
-                        prep_low=prep_low,
-                        prep_high=prep_high,
-                        rec_dist=rec_dist,
-                        rec_mean=rec_mean,
-                        rec_low=rec_low,
-                        rec_high=rec_high,
-                    )
-
-                    queues = []
-                    for r in range(n_rep):
-                        cfg.seed = base_seed + 1000 * exp_index + r
-                        res = run_once(cfg)
-                        queues.append(res["avg_prep_queue_length"])
-
-                    avg_q = sum(queues) / len(queues)
-
-                    print(
-                        f"Exp {exp_index:2d}: "
-                        f"A={A:+d}, B={B:+d}, C={C:+d}, D={D:+d}, "
-                        f"P={P}, R={R}, avg_q={avg_q:.4f}"
-                    )
-
-                    results.append({
-                        "A": A,
-                        "B": B,
-                        "C": C,
-                        "D": D,
-                        "avg_q": avg_q,
-                    })
+    for exp_index, cell in enumerate(cells, start=1):
+        lv = cell["levels"]
+        cfg = cell["cfg"]
+        avg_q = cell["avg_prep_queue_length"]
+
+        print(
+            f"Exp {exp_index:2d}: "
+            f"A={lv['A']:+d}, B={lv['B']:+d}, C={lv['C']:+d}, D={lv['D']:+d}, "
+            f"P={cfg.P}, R={cfg.R}, warmup={cell['warmup']:5.0f}, avg_q={avg_q:.4f}"
+        )
+
+        results.append(dict(lv, avg_q=avg_q, reps=cell["reps"]["avg_prep_queue_length"]))
 
     return results
 
+
+# Factors screened with a fractional design: (low, high) Config overrides
+SCREENING_FACTORS = {
+    "A": ({"interarrival_mean": 25.0}, {"interarrival_mean": 22.5}),   # arrival rate
+    "B": ({"prep_dist": "exp"}, {"prep_dist": "unif"}),                # prep distribution
+    "C": ({"rec_dist": "exp"}, {"rec_dist": "unif"}),                  # recovery distribution
+    "D": ({"P": 3}, {"P": 4}),                                         # preparation rooms
+    "E": ({"R": 4}, {"R": 5}),                                         # recovery rooms
+    "F": ({"OP": 1}, {"OP": 2}),                                       # operating theatres
+    "G": ({"scenario": "original"}, {"scenario": "twisted"}),          # operation time model
+    "H": ({"severe_prob": 0.2}, {"severe_prob": 0.4}),                 # severe cases (twisted only)
+}
+
+
+def run_screening_experiment():
+    print("\n\n=== Screening experiment: 8 factors in a resolution IV fraction ===")
+    logger.info("Starting screening experiment")
+
+    n_rep = 20
+    base_seed = 80_000
+
+    design = fractional_design(SCREENING_FACTORS, resolution=4)
+    keys = {
+        "avg_prep_queue_length": "avg queue before prep",
+        "theatre_block_rate": "P(block OR)",
+    }
+
+    gens = ", ".join(f"{f}={''.join(word)}" for f, word in design.generators.items())
+    print(f"2^({len(design.names)}-{len(design.generators)}) design, {design.n_runs} cells, "
+          f"resolution {design.resolution}, generators: {gens}")
+    print("Alias structure (up to 2-factor interactions):")
+    for line in design.alias_structure(max_order=2):
+        print(f" {line}")
+
+    cells = run_design(design, Config(P=3, R=4), n_rep, base_seed, list(keys), "screening")
+
+    print()
+    for i, cell in enumerate(cells, start=1):
+        lv = " ".join(f"{f}={level:+d}" for f, level in cell["levels"].items())
+        print(f"Cell {i:2d}: {lv}, avg_q={cell['avg_prep_queue_length']:.4f}, "
+              f"block={cell['theatre_block_rate']:.4f}")
+
+    # Replication-level metamodel: one coefficient per alias chain
+    for key, label in keys.items():
+        y = np.array([cell["reps"][key] for cell in cells])
+        fit = fit_effects(design, y)
+        print(f"\nMetamodel for {label} (error df={fit['df']}):")
+        print_effects(fit["effects"], width=18)
+        kept = ", ".join(e.label for e in fit["pruned"][1:]) or "none"
+        print(f"Significant after pruning: {kept}")
+
+
+def print_effects(effects: List[Effect], width: int = 6):
+    """Print a coefficient table: estimate, standard error, t, p-value and 95% CI."""
+    print(f"{'term':{width}s} {'coef':>10s} {'se':>9s} {'t':>7s} {'p':>7s}   95% CI")
+    for e in effects:
+        print(
+            f"{e.label:{width}s} {e.coef:10.6f} {e.se:9.6f} {e.t:7.2f} {e.p:7.4f}"
+            f"   ({e.ci[0]:.6f},{e.ci[1]:.6f})"
+        )
+
+
 def regression_from_factorial(results):
     """
     Build a linear regression model:
         avg_q = b0 + bA*A + bB*B + bC*C + bD*D + interactions...
-    using least squares: beta = (X^T X)^(-1) X^T y
+    fitted on the replication-level responses of every cell, so the pooled
+    within-cell variance gives standard errors, t-statistics and CIs. The
+    design is orthogonal, so the coefficients come from the Yates contrasts
+    (see design.fit_effects), followed by automatic pruning of the
+    non-significant terms.
     """
+    design = FactorialDesign(FACTORIAL_FACTORS)
+    for run, r in enumerate(results):
+        if any(r[f] != level for f, level in design.levels(run).items()):
+            raise ValueError("Factorial results are not in the design's run order")
 
+    y = np.array([r["reps"] for r in results])
+    fit = fit_effects(design, y)
 
-    # Extract factors and response
-    A = np.array([r["A"] for r in results])
-    B = np.array([r["B"] for r in results])
-    C = np.array([r["C"] for r in results])
-    D = np.array([r["D"] for r in results])
-    y = np.array([r["avg_q"] for r in results])
-
-    # Build design matrix with interactions
-    X = np.column_stack([
-        np.ones(len(results)),   # b0
-        A, B, C, D,              # main effects
-        A*B, A*C, A*D,           # 2-way interactions
-        B*C, B*D, C*D,
-        A*B*C, A*B*D, A*C*D, B*C*D,   # 3-way
-        A*B*C*D                     # 4-way
-    ])
-
-    # Solve least squares
-    beta, *_ = np.linalg.lstsq(X, y, rcond=None)
-
-    # Print results
     print("\n=== Regression model coefficients ===")
-    labels = [
-        "b0", "bA", "bB", "bC", "bD",
-        "bAB", "bAC", "bAD", "bBC", "bBD", "bCD",
-        "bABC", "bABD", "bACD", "bBCD",
-        "bABCD"
-    ]
-
-    for name, val in zip(labels, beta):
-        print(f"{name:6s} = {val:.6f}")
+    print(f"(fitted on {y.size} replications, error df={fit['df']}, MSE={fit['mse']:.6f})")
+    labels = ["b0" if e.label == "I" else "b" + e.label for e in fit["effects"]]
+    for name, e in zip(labels, fit["effects"]):
+        e.label = name
+    print_effects(fit["effects"])
+
+    print("\n--- Pruned model (terms with p <= 0.05, dropped terms pooled into error) ---")
+    for e in fit["pruned"]:
+        e.label = "b0" if e.label == "I" else "b" + e.label
+    print_effects(fit["pruned"])
+
+    logger.info(
+        "Factorial metamodel: %d of %d terms kept after pruning",
+        len(fit["pruned"]), len(fit["effects"])
+    )
 
     # Also return them for writing to results.txt
-    return dict(zip(labels, beta))
+    return {name: e.coef for name, e in zip(labels, fit["effects"])}
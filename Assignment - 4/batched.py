@@ -0,0 +1,434 @@
+import logging
+import math
+from dataclasses import replace
+from typing import Dict, List
+
+import numpy as np
+
+from config import Config
+from engine import batch_ends
+from metrics import QUANTILES
+from model import BASE, dist_transform, input_means, patient_transform
+from stats import QuantileSketch, RunningStats
+from variates import PATIENT_DRAWS, antithetic_uniforms
+import warmup
+
+logger = logging.getLogger("hospital_sim")
+
+INF = np.inf
+
+
+# -------------------------
+# Per-replication input streams
+# -------------------------
+
+class _Inputs:
+    """
+    Interarrival times and per-patient service times of every replication,
+    one row per replication, read from the same streams as model.make_streams:
+    row r draws its arrivals from the generator of seed_r + 100 and patient
+    pid reads Philox counter block pid of key seed_r + 200, so replication r
+    sees exactly the inputs of run_once with seed seed_r (CRN and antithetic
+    variates included). Columns are generated in blocks as the run needs them.
+    """
+
+    def __init__(self, cfg: Config, seeds: List[int], capacity: int):
+        self.cfg = cfg
+        self.seeds = seeds
+        self.antithetic = cfg.antithetic
+        self.ia_transform = dist_transform(cfg.interarrival_dist, cfg.interarrival_mean,
+                                           cfg.interarrival_low, cfg.interarrival_high)
+        self.patient_transform = patient_transform(cfg)
+        self.arr_gens = [np.random.default_rng(seed + 100) for seed in seeds]
+
+        n = len(seeds)
+        self.n = 0
+        self.interarrival = np.empty((n, 0))
+        self.prep_time = np.empty((n, 0))
+        self.op_time = np.empty((n, 0))
+        self.rec_time = np.empty((n, 0))
+        self.ptype = np.empty((n, 0), dtype=np.int8)
+        self.grow(capacity)
+
+    def _uniforms(self, u: np.ndarray) -> np.ndarray:
+        return antithetic_uniforms(u) if self.antithetic else u
+
+    def grow(self, capacity: int):
+        """Make columns 0..capacity-1 (patients 1..capacity) available."""
+        m = capacity - self.n
+        if m <= 0:
+            return
+        ia, prep, op, rec, ptype = [], [], [], [], []
+        for seed, gen in zip(self.seeds, self.arr_gens):
+            ia.append(self.ia_transform(self._uniforms(gen.random(m))))
+            # Patient pid reads counter block pid (see variates.PatientStream)
+            philox = np.random.Generator(np.random.Philox(key=seed + 200, counter=self.n + 1))
+            records = self.patient_transform(self._uniforms(philox.random((m, PATIENT_DRAWS))))
+            prep.append([r[0] for r in records])
+            op.append([r[1][0] for r in records])
+            ptype.append([r[1][1] for r in records])
+            rec.append([r[2] for r in records])
+        self.interarrival = np.hstack([self.interarrival, np.array(ia)])
+        self.prep_time = np.hstack([self.prep_time, np.array(prep)])
+        self.op_time = np.hstack([self.op_time, np.array(op)])
+        self.rec_time = np.hstack([self.rec_time, np.array(rec)])
+        self.ptype = np.hstack([self.ptype, np.array(ptype, dtype=np.int8)])
+        self.n = capacity
+
+
+class _Fifo:
+    """One FIFO queue of integers per replication, stored as a growable ring buffer."""
+
+    def __init__(self, n: int, capacity: int = 16):
+        self.buf = np.empty((n, capacity), dtype=np.int64)
+        self.head = np.zeros(n, dtype=np.int64)
+        self.size = np.zeros(n, dtype=np.int64)
+
+    def push(self, idx: np.ndarray, values: np.ndarray):
+        if (self.size[idx] >= self.buf.shape[1]).any():
+            self._grow()
+        cap = self.buf.shape[1]
+        self.buf[idx, (self.head[idx] + self.size[idx]) % cap] = values
+        self.size[idx] += 1
+
+    def pop(self, idx: np.ndarray) -> np.ndarray:
+        values = self.buf[idx, self.head[idx]]
+        self.head[idx] = (self.head[idx] + 1) % self.buf.shape[1]
+        self.size[idx] -= 1
+        return values
+
+    def _grow(self):
+        n, cap = self.buf.shape
+        order = (self.head[:, None] + np.arange(cap)) % cap
+        buf = np.empty((n, 2 * cap), dtype=np.int64)
+        buf[:, :cap] = np.take_along_axis(self.buf, order, axis=1)
+        self.buf = buf
+        self.head[:] = 0
+
+
+# -------------------------
+# Lockstep simulation
+# -------------------------
+
+class BatchSimulation:
+    """
+    Vectorized simulation of one replication per seed of the same Config.
+
+    Every replication is the same small state machine (busy servers, queues,
+    blocked theatres), so the state is held as arrays with one row per
+    replication and each step processes the next event of every replication
+    with a handful of NumPy operations. The semantics are those of
+    engine.HeapSimulation: FIFO queues, a theatre held until a recovery bed
+    frees up (beds go to the theatre blocked the longest), the warm-up and
+    the cfg.batches batches of the observation period, with the statistics of
+    Metrics as exact time averages per batch. Patients are column indices
+    (pid - 1) into the _Inputs arrays.
+    """
+
+    def __init__(self, cfg: Config, seeds: List[int]):
+        self.cfg = cfg
+        self.n = n = len(seeds)
+        P, OP, R = cfg.P, cfg.OP, cfg.R
+
+        # Columns for about 1.5 times the expected number of arrivals to start with
+        expected = (cfg.warmup + cfg.sim_time) / (
+            cfg.interarrival_mean if cfg.interarrival_dist == "exp"
+            else 0.5 * (cfg.interarrival_low + cfg.interarrival_high))
+        self.inputs = _Inputs(cfg, seeds, int(1.5 * expected) + 16)
+
+        rows = np.arange(n)
+        self.rows = rows
+        self.t = np.zeros(n)
+        self.n_arrived = np.zeros(n, dtype=np.int64)
+        self.t_arrival = np.zeros((n, self.inputs.n))
+        self.next_arr = self.inputs.interarrival[:, 0].copy()
+
+        # Servers: completion time (inf if free) and the patient served
+        self.prep_end = np.full((n, P), INF)
+        self.prep_pat = np.zeros((n, P), dtype=np.int64)
+        self.op_end = np.full((n, OP), INF)      # inf while free or blocked
+        self.op_pat = np.zeros((n, OP), dtype=np.int64)
+        self.op_held = np.zeros((n, OP), dtype=bool)
+        self.op_blocked = np.zeros((n, OP), dtype=bool)
+        self.block_start = np.zeros((n, OP))
+        self.rec_end = np.full((n, R), INF)
+        self.rec_pat = np.zeros((n, R), dtype=np.int64)
+
+        self.prep_queue = _Fifo(n)
+        self.theatre_queue = _Fifo(n)
+
+        # Boundaries: end of warm-up, then the end of every batch
+        self.bounds = np.array([cfg.warmup] + batch_ends(cfg))
+        self.stage = np.zeros(n, dtype=np.int64)  # index of the next boundary
+        self.batches: List[Dict[str, np.ndarray]] = []
+        self._reset_stats(rows)
+
+    # -------------------------
+    # Statistics of the current batch
+    # -------------------------
+
+    def _reset_stats(self, idx: np.ndarray):
+        n = self.n
+        if not hasattr(self, "area_busy"):
+            for name in ("area_prep_queue", "area_prep_idle", "area_theatre_queue", "area_rec",
+                         "area_busy", "area_blocked", "time_rec_full", "throughput_sum",
+                         "rec_wait_sum"):
+                setattr(self, name, np.zeros(n))
+            self.n_done = np.zeros(n, dtype=np.int64)
+            self.rec_wait_n = np.zeros(n, dtype=np.int64)
+            self.throughput_q = [QuantileSketch() for _ in range(n)]
+            self.rec_wait_q = [QuantileSketch() for _ in range(n)]
+            return
+        for name in ("area_prep_queue", "area_prep_idle", "area_theatre_queue", "area_rec",
+                     "area_busy", "area_blocked", "time_rec_full", "throughput_sum",
+                     "rec_wait_sum", "n_done", "rec_wait_n"):
+            getattr(self, name)[idx] = 0
+        for i in idx.tolist():
+            self.throughput_q[i] = QuantileSketch()
+            self.rec_wait_q[i] = QuantileSketch()
+
+    def _end_batch(self, idx: np.ndarray, k: int):
+        """Store the summary of batch k of rows idx (as Metrics.summarize)."""
+        if len(self.batches) <= k:
+            self.batches.append({key: np.full(self.n, np.nan) for key in _RESULT_KEYS})
+        cfg = self.cfg
+        T = self.bounds[k + 1] - self.bounds[k]
+        out = self.batches[k]
+        done = self.n_done[idx]
+        waits = self.rec_wait_n[idx]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["patients_done"][idx] = done
+            out["theatre_utilization"][idx] = self.area_busy[idx] / (T * cfg.OP)
+            out["theatre_block_rate"][idx] = self.area_blocked[idx] / (T * cfg.OP)
+            out["avg_throughput_time"][idx] = np.where(done > 0, self.throughput_sum[idx] / done, np.nan)
+            out["avg_prep_queue_length"][idx] = self.area_prep_queue[idx] / T
+            out["avg_prep_idle_capacity"][idx] = self.area_prep_idle[idx] / T
+            out["avg_theatre_queue_length"][idx] = self.area_theatre_queue[idx] / T
+            out["avg_recovery_occupancy"][idx] = self.area_rec[idx] / T
+            out["prob_recovery_all_busy"][idx] = self.time_rec_full[idx] / T
+            out["avg_rec_wait"][idx] = np.where(waits > 0, self.rec_wait_sum[idx] / waits, np.nan)
+        for i in idx.tolist():
+            for q in QUANTILES:
+                out[f"p{round(100 * q)}_throughput_time"][i] = self.throughput_q[i].quantile(q)
+                out[f"p{round(100 * q)}_rec_wait"][i] = self.rec_wait_q[i].quantile(q)
+
+    # -------------------------
+    # Main loop
+    # -------------------------
+
+    def run(self):
+        cfg = self.cfg
+        rows = self.rows
+        n_bounds = len(self.bounds)
+        handlers = (self._arrival, self._prep_end, self._op_end, self._rec_end)
+
+        while True:
+            live = self.stage < n_bounds
+            if not live.any():
+                break
+
+            cand = np.stack([
+                self.next_arr,
+                self.prep_end.min(axis=1),
+                self.op_end.min(axis=1),
+                self.rec_end.min(axis=1),
+            ], axis=1)
+            kind = cand.argmin(axis=1)
+            t_ev = cand[rows, kind]
+            bound = self.bounds[np.minimum(self.stage, n_bounds - 1)]
+
+            # Events strictly before a boundary run first (as HeapSimulation.run)
+            at_bound = live & (bound <= t_ev)
+            t_new = np.where(at_bound, bound, t_ev)
+
+            # Accumulate the levels of observing rows up to t_new
+            obs = live & (self.stage > 0)
+            dt = np.where(obs, t_new - self.t, 0.0)
+            prep_busy = (self.prep_end < INF).sum(axis=1)
+            n_held = self.op_held.sum(axis=1)
+            n_blocked = self.op_blocked.sum(axis=1)
+            n_rec = (self.rec_end < INF).sum(axis=1)
+            self.area_prep_queue += dt * self.prep_queue.size
+            self.area_prep_idle += dt * (cfg.P - prep_busy)
+            self.area_theatre_queue += dt * self.theatre_queue.size
+            self.area_rec += dt * n_rec
+            self.area_busy += dt * (n_held - n_blocked)
+            self.area_blocked += dt * n_blocked
+            self.time_rec_full += dt * (n_rec == cfg.R)
+            self.t = np.where(live, t_new, self.t)
+
+            # Boundaries: start observing after the warm-up, then close batches
+            idx = np.nonzero(at_bound)[0]
+            if idx.size:
+                for k in np.unique(self.stage[idx]).tolist():
+                    sel = idx[self.stage[idx] == k]
+                    if k > 0:
+                        self._end_batch(sel, k - 1)
+                    self._reset_stats(sel)
+                self.stage[idx] += 1
+
+            active = live & ~at_bound
+            for k, handler in enumerate(handlers):
+                idx = np.nonzero(active & (kind == k))[0]
+                if idx.size:
+                    handler(idx)
+
+    # -------------------------
+    # Event handlers (idx: replications whose next event is of this kind)
+    # -------------------------
+
+    def _arrival(self, idx: np.ndarray):
+        now = self.t[idx]
+        pat = self.n_arrived[idx]
+        self.n_arrived[idx] += 1
+        if self.n_arrived.max() >= self.inputs.n:
+            self.inputs.grow(2 * self.inputs.n)
+            self.t_arrival = np.hstack([self.t_arrival, np.zeros_like(self.t_arrival)])
+        self.t_arrival[idx, pat] = now
+        self.next_arr[idx] = now + self.inputs.interarrival[idx, pat + 1]
+
+        # ---- Preparation ----
+        free = self.prep_end[idx] == INF
+        has_free = free.any(axis=1)
+        i, col, p = idx[has_free], free[has_free].argmax(axis=1), pat[has_free]
+        self.prep_pat[i, col] = p
+        self.prep_end[i, col] = self.t[i] + self.inputs.prep_time[i, p]
+        self.prep_queue.push(idx[~has_free], pat[~has_free])
+
+    def _prep_end(self, idx: np.ndarray):
+        col = self.prep_end[idx].argmin(axis=1)
+        pat = self.prep_pat[idx, col]
+        self.prep_end[idx, col] = INF
+
+        # Prep room goes to the next queued patient, if any
+        queued = self.prep_queue.size[idx] > 0
+        i, c = idx[queued], col[queued]
+        p = self.prep_queue.pop(i)
+        self.prep_pat[i, c] = p
+        self.prep_end[i, c] = self.t[i] + self.inputs.prep_time[i, p]
+
+        # ---- Operation ----
+        has_free = ~self.op_held[idx].all(axis=1)
+        i = idx[has_free]
+        self._start_op(i, (~self.op_held[i]).argmax(axis=1), pat[has_free])
+        self.theatre_queue.push(idx[~has_free], pat[~has_free])
+
+    def _start_op(self, i: np.ndarray, col: np.ndarray, pat: np.ndarray):
+        self.op_held[i, col] = True
+        self.op_pat[i, col] = pat
+        self.op_end[i, col] = self.t[i] + self.inputs.op_time[i, pat]
+
+    def _release_theatre(self, i: np.ndarray, col: np.ndarray):
+        """Free theatre col of rows i, or hand it to the next queued patient."""
+        queued = self.theatre_queue.size[i] > 0
+        self._start_op(i[queued], col[queued], self.theatre_queue.pop(i[queued]))
+        self.op_held[i[~queued], col[~queued]] = False
+
+    def _op_end(self, idx: np.ndarray):
+        col = self.op_end[idx].argmin(axis=1)
+        self.op_end[idx, col] = INF
+
+        # Move to recovery if a bed is free, otherwise block the theatre
+        has_bed = (self.rec_end[idx] == INF).any(axis=1)
+        i, c = idx[has_bed], col[has_bed]
+        self._to_recovery(i, self.op_pat[i, c], self.t[i])
+        self._release_theatre(i, c)
+
+        i, c = idx[~has_bed], col[~has_bed]
+        self.op_blocked[i, c] = True
+        self.block_start[i, c] = self.t[i]
+
+    def _to_recovery(self, i: np.ndarray, pat: np.ndarray, t_block: np.ndarray):
+        bed = (self.rec_end[i] == INF).argmax(axis=1)
+        self.rec_pat[i, bed] = pat
+        self.rec_end[i, bed] = self.t[i] + self.inputs.rec_time[i, pat]
+
+        obs = self.stage[i] > 0
+        j = i[obs]
+        waits = self.t[j] - t_block[obs]
+        self.rec_wait_sum[j] += waits
+        self.rec_wait_n[j] += 1
+        for r, w in zip(j.tolist(), waits.tolist()):
+            self.rec_wait_q[r].add(w)
+
+    def _rec_end(self, idx: np.ndarray):
+        col = self.rec_end[idx].argmin(axis=1)
+        pat = self.rec_pat[idx, col]
+        self.rec_end[idx, col] = INF
+
+        # ---- Departure ----
+        obs = self.stage[idx] > 0
+        j = idx[obs]
+        times = self.t[j] - self.t_arrival[j, pat[obs]]
+        self.n_done[j] += 1
+        self.throughput_sum[j] += times
+        for r, x in zip(j.tolist(), times.tolist()):
+            self.throughput_q[r].add(x)
+
+        # Bed goes to the patient blocking a theatre the longest, if any
+        blocked = self.op_blocked[idx].any(axis=1)
+        i = idx[blocked]
+        c = np.where(self.op_blocked[i], self.block_start[i], INF).argmin(axis=1)
+        self.op_blocked[i, c] = False
+        self._to_recovery(i, self.op_pat[i, c], self.block_start[i, c])
+        self._release_theatre(i, c)
+
+    # -------------------------
+    # Results
+    # -------------------------
+
+    def summarize(self) -> Dict[str, np.ndarray]:
+        """
+        Per-replication metrics with the scalar keys of runner.run_once: the
+        batch-means estimate over cfg.batches batches (mean over the batches
+        where a metric is defined, patients_done summed).
+        """
+        if len(self.batches) == 1:
+            return dict(self.batches[0])
+        res = {"patients_done": sum(b["patients_done"] for b in self.batches)}
+        for key in _RESULT_KEYS[1:]:
+            values = np.array([b[key] for b in self.batches])
+            res[key] = np.array([
+                RunningStats.from_samples(v for v in col if not math.isnan(v)).mean
+                if not np.isnan(col).all() else np.nan
+                for col in values.T
+            ])
+        return res
+
+
+# Scalar result keys of Metrics.summarize, in the same order
+_RESULT_KEYS = (
+    "patients_done", "theatre_utilization", "theatre_block_rate", "avg_throughput_time",
+    "avg_prep_queue_length", "avg_prep_idle_capacity", "avg_theatre_queue_length",
+    "avg_recovery_occupancy", "prob_recovery_all_busy", "avg_rec_wait",
+    *(f"p{round(100 * q)}_throughput_time" for q in QUANTILES),
+    *(f"p{round(100 * q)}_rec_wait" for q in QUANTILES),
+)
+
+
+def run_batch(cfg: Config, n_rep: int) -> Dict[str, np.ndarray]:
+    """
+    Simulate n_rep replications of cfg in lockstep, replication r with seed
+    cfg.seed + r, and return one array of n_rep values per metric (same keys
+    as run_once, ready for mean_ci_95 / print_metric). Replication r uses the
+    streams of run_once(replace(cfg, seed=cfg.seed + r)), so the results
+    agree with it up to rounding, and configs share CRN as in run_once. A
+    warmup of None is detected first (see warmup.py); with cfg.controls the
+    input sample means are added as well. Quantile sketches are not returned.
+    """
+    if cfg.warmup is None:
+        cfg = warmup.resolve_warmups([cfg])[0]
+
+    logger.debug(
+        "Running %d lockstep replications: P=%d, R=%d, OP=%d, sim_time=%.3f, warmup=%.3f, seed=%d, scenario=%s",
+        n_rep, cfg.P, cfg.R, cfg.OP, cfg.sim_time, cfg.warmup, cfg.seed, cfg.scenario
+    )
+    seeds = [cfg.seed + r for r in range(n_rep)]
+    sim = BatchSimulation(cfg, seeds)
+    sim.run()
+    res = sim.summarize()
+
+    if cfg.controls:
+        means = [input_means(replace(cfg, seed=seed)) for seed in seeds]
+        res.update({key: np.array([m[key] for m in means]) for key in means[0]})
+    return res
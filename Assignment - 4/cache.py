@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import logging
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger("hospital_sim")
+
+# Part of every cache key: bump it whenever a change to the model, metrics or
+# random number streams changes simulation results, so stale entries are ignored
+MODEL_VERSION = "5"
+
+# SQLite limits the number of parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def result_key(cfg: Config) -> str:
+    """
+    Stable hash of the Config fields (seed included) and the model version.
+    The backend is left out: the SimPy and heap engines give identical
+    results, so either one can reuse the other's entries.
+    """
+    fields = asdict(cfg)
+    del fields["backend"]
+    payload = json.dumps([MODEL_VERSION, fields], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent cache of run_once results in a single SQLite file.
+
+    Entries are keyed by result_key(cfg) and stored pickled. When the stored
+    results exceed max_bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(path)
+        # Let the file shrink again when entries are evicted (new files only)
+        self.conn.execute("PRAGMA auto_vacuum = FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.conn.commit()
+        self.evict()
+
+    def get_many(self, cfgs: List[Config]) -> List[Optional[Dict]]:
+        """Cached result for each config (None where not cached)."""
+        keys = [result_key(cfg) for cfg in cfgs]
+        found = {}
+        for i in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[i:i + _LOOKUP_CHUNK]
+            rows = self.conn.execute(
+                f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            found.update(rows)
+
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE results SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self.conn.commit()
+
+        return [pickle.loads(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, items: Iterable[Tuple[Config, Dict]]):
+        """Store results and evict old entries if the cache grew too large."""
+        now = time.time()
+        rows = []
+        for cfg, res in items:
+            blob = pickle.dumps(res, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((result_key(cfg), blob, len(blob), now))
+        if not rows:
+            return
+
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        self.conn.commit()
+        self.evict()
+
+    def size(self) -> int:
+        """Total size of the stored results in bytes."""
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY last_used"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+        self.conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+        self.conn.commit()
+        logger.debug("Evicted %d cached results from %s", len(doomed), self.path)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from config import Config
+from cache import result_key
+
+logger = logging.getLogger("hospital_sim")
+
+
+def _restore_result(res: Dict) -> Dict:
+    """Turn the batch CIs of a result back into (mean, half, (lo, hi)) tuples (JSON stores lists)."""
+    if "batch_ci" in res:
+        res["batch_ci"] = {
+            key: (mean, half, tuple(bounds)) for key, (mean, half, bounds) in res["batch_ci"].items()
+        }
+    return res
+
+
+class Checkpoint:
+    """
+    Append-only checkpoint of finished work, one JSON record per line:
+    - {"kind": "rep", "key": ..., "result": {...}}  one finished replication
+    - {"kind": "cell", "key": ..., "data": {...}}   one finished experiment cell
+
+    Every record is flushed as soon as it is written, so an interrupted run
+    loses at most the replications in progress. Reopening the file restores
+    all records; a partially written last line is discarded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reps: Dict[str, Dict] = {}
+        self.cells: Dict[str, Dict] = {}
+
+        if os.path.exists(path):
+            self._load()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        # Drop a record cut off by an interruption
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+
+        for line in data[:end].splitlines():
+            rec = json.loads(line)
+            if rec["kind"] == "rep":
+                self.reps[rec["key"]] = _restore_result(rec["result"])
+            else:
+                self.cells[rec["key"]] = rec["data"]
+
+        logger.info(
+            "Resuming from checkpoint %s: %d replications, %d cells",
+            self.path, len(self.reps), len(self.cells)
+        )
+
+    def _append(self, rec: Dict):
+        self.file.write(json.dumps(rec) + "\n")
+        self.file.flush()
+
+    # -------------------------
+    # Replications
+    # -------------------------
+
+    def get_many(self, cfgs: List[Config]) -> List[Optional[Dict]]:
+        """Checkpointed result for each config (None where not finished)."""
+        return [self.reps.get(result_key(cfg)) for cfg in cfgs]
+
+    def add_replication(self, cfg: Config, res: Dict):
+        key = result_key(cfg)
+        if key not in self.reps:
+            self.reps[key] = res
+            self._append({"kind": "rep", "key": key, "result": res})
+
+    # -------------------------
+    # Experiment cells
+    # -------------------------
+
+    @staticmethod
+    def cell_key(name: str, cfgs: List[Config]) -> str:
+        """Key of a cell: experiment name plus the keys of all its replications."""
+        payload = json.dumps([name] + [result_key(cfg) for cfg in cfgs])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_cell(self, key: str) -> Optional[Dict]:
+        return self.cells.get(key)
+
+    def add_cell(self, key: str, data: Dict):
+        if key not in self.cells:
+            self.cells[key] = data
+            self._append({"kind": "cell", "key": key, "data": data})
+
+    def close(self):
+        self.file.close()
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class Config:
@@ -20,12 +21,30 @@ class Config:
     # Simulation time (observation length after warm-up)
     sim_time: float = 1000.0
     # Warm-up period before starting observation
-    warmup: float = 200.0
+    # (None -> detected from pilot runs, see warmup.resolve_warmups)
+    warmup: Optional[float] = 200.0
+    # Batch means: split the observation period into this many equal batches
+    # (1 = a single batch, i.e. one observation per replication)
+    batches: int = 1
     # Monitoring interval for periodic sampling
+    # (unused by the model: queue/bed statistics are event-driven time averages)
     monitor_dt: float = 1.0
 
     # Random seed for reproducibility
     seed: int = 123
+    # Antithetic variates: drive every random stream with 1 - U instead of U,
+    # giving the antithetic partner of the replication with the same seed
+    antithetic: bool = False
+    # Control variates: also record the input sample means of the replication
+    # (see model.input_means); costs extra draws, so only set where used
+    controls: bool = False
+    # Quantile sketches: also return the throughput-time and recovery-wait
+    # sketches under "sketches" (set by runner.accumulate_replications)
+    sketches: bool = False
+
+    # Simulation backend: "simpy" (process model) or "heap" (dedicated
+    # heapq event engine); None uses the runner default (see runner.set_backend)
+    backend: Optional[str] = None
 
     # -------------------------
     # Interarrival time distribution
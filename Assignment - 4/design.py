@@ -0,0 +1,291 @@
+import math
+import itertools
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import Config
+from stats import t_cdf, t_quantile
+
+# A factor maps to the Config overrides of its low (-1) and high (+1) level
+FactorSpec = Dict[str, Tuple[Dict, Dict]]
+
+Word = FrozenSet[str]
+
+
+# -------------------------
+# Standard fractional designs
+# -------------------------
+# Generators of minimum-aberration 2^(k-p) designs (Montgomery, Design and
+# Analysis of Experiments, Table 8.14), keyed by (k, p). Letters refer to the
+# k-p basic factors in spec order (A = first factor, B = second, ...); the
+# j-th word defines the (k-p+j)-th factor as the product of those columns.
+
+STANDARD_GENERATORS = {
+    (3, 1): ["AB"],
+    (4, 1): ["ABC"],
+    (5, 1): ["ABCD"],
+    (5, 2): ["AB", "AC"],
+    (6, 1): ["ABCDE"],
+    (6, 2): ["ABC", "BCD"],
+    (6, 3): ["AB", "AC", "BC"],
+    (7, 1): ["ABCDEF"],
+    (7, 2): ["ABCD", "ABDE"],
+    (7, 3): ["ABC", "BCD", "ACD"],
+    (7, 4): ["AB", "AC", "BC", "ABC"],
+    (8, 1): ["ABCDEFG"],
+    (8, 2): ["ABCD", "ABEF"],
+    (8, 3): ["ABC", "ABD", "BCDE"],
+    (8, 4): ["BCD", "ACD", "ABC", "ABD"],
+    (9, 2): ["ACDFG", "BCEFG"],
+    (9, 3): ["ABCD", "ACEF", "CDEF"],
+    (9, 4): ["BCDE", "ACDE", "ABDE", "ABCE"],
+    (9, 5): ["ABC", "BCD", "ACD", "ABD", "ABCD"],
+    (10, 3): ["ABCG", "BCDE", "ACDF"],
+    (10, 4): ["BCDF", "ACDF", "ABDE", "ABCE"],
+    (10, 5): ["ABCD", "ABCE", "ABDE", "ACDE", "BCDE"],
+    (10, 6): ["ABC", "BCD", "ACD", "ABD", "ABCD", "AB"],
+}
+
+_BASE_LETTERS = "ABCDEFG"
+
+
+class FactorialDesign:
+    """
+    Two-level full or fractional factorial design.
+
+    factors: factor name -> (low overrides, high overrides) of Config fields.
+    generators: generated factor -> names of the basic factors whose product
+    defines its column (e.g. {"E": ("A", "B", "C", "D")} for E = ABCD). All
+    other factors are basic and form a full factorial.
+
+    Runs are in standard order with the first basic factor changing slowest,
+    as in nested for loops over the factors.
+    """
+
+    def __init__(self, factors: FactorSpec, generators: Optional[Dict[str, Sequence[str]]] = None):
+        self.factors = dict(factors)
+        self.names = list(self.factors)
+        self.generators = {name: tuple(word) for name, word in (generators or {}).items()}
+        self.basic = [name for name in self.names if name not in self.generators]
+
+        for name, word in self.generators.items():
+            if name not in self.factors:
+                raise ValueError(f"Generator for unknown factor {name!r}")
+            unknown = [f for f in word if f not in self.basic]
+            if unknown:
+                raise ValueError(f"Generator {name}={''.join(word)} uses non-basic factors {unknown}")
+
+        # Design matrix of levels (-1/+1), one column per factor in spec order
+        base = np.array(list(itertools.product((-1, 1), repeat=len(self.basic))), dtype=int)
+        cols = dict(zip(self.basic, base.T))
+        for name, word in self.generators.items():
+            cols[name] = np.prod([cols[f] for f in word], axis=0)
+        self.matrix = np.column_stack([cols[name] for name in self.names])
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.matrix)
+
+    # -------------------------
+    # Alias structure
+    # -------------------------
+
+    def defining_relation(self) -> List[Word]:
+        """Words of the defining relation I = ... (all products of the generator words)."""
+        gen_words = [frozenset(word) ^ {name} for name, word in self.generators.items()]
+        words = set()
+        for r in range(1, len(gen_words) + 1):
+            for combo in itertools.combinations(gen_words, r):
+                word = frozenset()
+                for w in combo:
+                    word = word ^ w
+                words.add(word)
+        return sorted(words, key=lambda w: (len(w), self._sorted(w)))
+
+    @property
+    def resolution(self) -> Optional[int]:
+        """Length of the shortest defining word (None for a full factorial)."""
+        words = self.defining_relation()
+        return min(len(w) for w in words) if words else None
+
+    def aliases(self, effect: Sequence[str]) -> List[Word]:
+        """Effects aliased with 'effect' (e.g. ("A", "B") for the AB interaction)."""
+        effect = frozenset(effect)
+        return sorted(
+            (effect ^ word for word in self.defining_relation()),
+            key=lambda w: (len(w), self._sorted(w)),
+        )
+
+    def alias_structure(self, max_order: int = 2) -> List[str]:
+        """
+        Alias chains of all main effects and interactions up to max_order,
+        listing aliases up to order max_order + 1, e.g. "A = BCD" or "AB = CD".
+        """
+        lines = []
+        seen = set()
+        for order in range(1, max_order + 1):
+            for effect in itertools.combinations(self.names, order):
+                effect = frozenset(effect)
+                if effect in seen:
+                    continue
+                chain = [w for w in self.aliases(effect) if len(w) <= max_order + 1]
+                seen.update(chain)
+                line = self.label(effect)
+                if chain:
+                    line += " = " + " = ".join(self.label(w) for w in chain)
+                lines.append(line)
+        return lines
+
+    def _sorted(self, word: Word) -> List[str]:
+        return sorted(word, key=self.names.index)
+
+    def label(self, word: Word) -> str:
+        return "".join(self._sorted(word)) if word else "I"
+
+    # -------------------------
+    # Configs of the runs
+    # -------------------------
+
+    def levels(self, run: int) -> Dict[str, int]:
+        return {name: int(level) for name, level in zip(self.names, self.matrix[run])}
+
+    def config(self, base: Config, run: int) -> Config:
+        """base with the overrides of every factor at its level in 'run'."""
+        overrides = {}
+        for name, level in self.levels(run).items():
+            low, high = self.factors[name]
+            for field, value in (high if level > 0 else low).items():
+                if field in overrides and overrides[field] != value:
+                    raise ValueError(f"Factors set conflicting values for Config.{field}")
+                overrides[field] = value
+        return replace(base, **overrides)
+
+    def configs(self, base: Config) -> List[Config]:
+        return [self.config(base, run) for run in range(self.n_runs)]
+
+
+def fractional_design(factors: FactorSpec, resolution: int = 4) -> FactorialDesign:
+    """
+    Smallest standard 2^(k-p) design of at least the given resolution
+    (3, 4 or 5 = III, IV, V) for the factors; the full factorial if no
+    tabulated fraction reaches it.
+    """
+    names = list(factors)
+    k = len(names)
+
+    best = FactorialDesign(factors)
+    for p in range(1, k):
+        words = STANDARD_GENERATORS.get((k, p))
+        if words is None:
+            continue
+        generators = {
+            names[k - p + j]: [names[_BASE_LETTERS.index(c)] for c in word]
+            for j, word in enumerate(words)
+        }
+        design = FactorialDesign(factors, generators)
+        if design.resolution >= resolution and design.n_runs < best.n_runs:
+            best = design
+    return best
+
+
+# -------------------------
+# Effect estimation
+# -------------------------
+
+@dataclass
+class Effect:
+    """One coefficient of the two-level regression metamodel (+-1 coding)."""
+    label: str                  # effect (with its aliases in a fraction), "I" = intercept
+    word: Word
+    coef: float                 # regression coefficient = half the effect
+    se: float = float("nan")
+    t: float = float("nan")
+    p: float = float("nan")
+    ci: Tuple[float, float] = (float("nan"), float("nan"))
+
+
+def yates(values: np.ndarray) -> np.ndarray:
+    """
+    Yates algorithm: contrasts of a 2^m table given in standard order with the
+    first factor changing slowest. Entry t of the result is the contrast of the
+    interaction of the factors whose bits are set in t (most significant bit =
+    first factor); entry 0 is the total.
+    """
+    x = np.asarray(values, dtype=float)
+    m = int(round(math.log2(len(x))))
+    for _ in range(m):
+        pairs = x.reshape(-1, 2, *x.shape[1:])
+        x = np.concatenate([pairs[:, 0] + pairs[:, 1], pairs[:, 1] - pairs[:, 0]])
+    return x
+
+
+def _fill_stats(effects: List[Effect], mse: float, df: int, n_obs: int, level: float):
+    se = math.sqrt(mse / n_obs) if df > 0 else float("nan")
+    t_crit = t_quantile(0.5 + level / 2, df) if df > 0 else float("nan")
+    for e in effects:
+        e.se = se
+        e.t = e.coef / se if se > 0 else float("nan")
+        e.p = 2.0 * (1.0 - t_cdf(abs(e.t), df)) if se > 0 else float("nan")
+        e.ci = (e.coef - t_crit * se, e.coef + t_crit * se)
+
+
+def fit_effects(design: FactorialDesign, y: np.ndarray, alpha: float = 0.05,
+                level: float = 0.95) -> Dict:
+    """
+    Regression metamodel of a two-level design fitted on replication-level
+    responses y (shape: runs x replications, equal replications per run).
+
+    The columns of a two-level design are orthogonal, so every coefficient is
+    its contrast over the cell means divided by the number of runs (computed
+    with the Yates algorithm on the basic factors, one coefficient per alias
+    chain in a fraction). The error variance is the pooled within-cell
+    variance, giving standard errors, t-statistics, p-values and CIs.
+
+    Pruning drops the least significant term (p > alpha) one at a time and
+    pools its sum of squares into the error, until all terms are significant;
+    orthogonality leaves the remaining coefficients unchanged.
+
+    Returns {"effects": full model, "pruned": kept terms, "mse", "df"} where
+    mse/df refer to the full model.
+    """
+    y = np.asarray(y, dtype=float)
+    n_runs, n_rep = y.shape
+    n_obs = n_runs * n_rep
+
+    contrasts = yates(y.mean(axis=1))
+    m = len(design.basic)
+
+    effects = []
+    for t, contrast in enumerate(contrasts):
+        word = frozenset(f for j, f in enumerate(design.basic) if t >> (m - 1 - j) & 1)
+        chain = [word] + [w for w in design.aliases(word) if w != word]
+        shortest = min(len(w) for w in chain)
+        shown = [w for w in chain if len(w) <= max(shortest, 2)]
+        shown.sort(key=lambda w: (len(w), design._sorted(w)))
+        label = " = ".join(design.label(w) for w in shown)
+        effects.append(Effect(label, shown[0], contrast / n_runs))
+
+    # Intercept, main effects, two-factor interactions, ... in factor order
+    effects.sort(key=lambda e: (len(e.word), [design.names.index(f) for f in design._sorted(e.word)]))
+
+    # Pooled within-cell (pure) error
+    ss_err = float(((y - y.mean(axis=1, keepdims=True)) ** 2).sum())
+    df = n_obs - n_runs
+    mse = ss_err / df if df > 0 else float("nan")
+    _fill_stats(effects, mse, df, n_obs, level)
+
+    kept = [Effect(e.label, e.word, e.coef) for e in effects]
+    while True:
+        _fill_stats(kept, ss_err / df if df > 0 else float("nan"), df, n_obs, level)
+        terms = [e for e in kept[1:] if not e.p <= alpha]
+        if not terms:
+            break
+        # Without error df (one replication) the smallest coefficient goes first
+        worst = max(terms, key=lambda e: (e.p if not math.isnan(e.p) else math.inf, -abs(e.coef)))
+        kept.remove(worst)
+        ss_err += n_obs * worst.coef ** 2
+        df += 1
+
+    return {"effects": effects, "pruned": kept, "mse": mse, "df": n_obs - n_runs}
@@ -0,0 +1,231 @@
+import copy
+import heapq
+import logging
+from collections import deque
+from dataclasses import replace
+from typing import Dict, List
+
+from config import Config
+from metrics import Metrics
+from model import PatientTable, make_streams, new_patient
+from series import SeriesRecorder
+import tracing
+from tracing import EventTrace
+
+logger = logging.getLogger("hospital_sim")
+
+
+# -------------------------
+# Event kinds
+# -------------------------
+
+ARRIVAL = 0
+PREP_END = 1
+OP_END = 2
+REC_END = 3
+WARMUP_END = 4
+
+
+class HeapSimulation:
+    """
+    Dedicated discrete-event engine for the prep -> theatre -> recovery network.
+
+    Uses a binary-heap event list of (time, seq, kind, slot) tuples and
+    integer server counters instead of SimPy processes; patients are slots of
+    a model.PatientTable. Semantics follow model.patient_process: FIFO queues
+    in front of prep and theatre, blocking after service (a theatre holds its
+    patient until a recovery bed frees up) and the same Metrics calls in the
+    same order, so both backends produce the same results (and patient
+    tables) for the same Config and seed.
+    """
+
+    def __init__(self, cfg: Config, trace: EventTrace = None, series: SeriesRecorder = None,
+                 patients: PatientTable = None):
+        self.cfg = cfg
+        self.trace = trace  # per-event trace, only at the "full" tracing level
+        self.now = 0.0
+        self.events = []
+        self.seq = 0  # tie-breaker: simultaneous events run in scheduling order
+
+        self.arr_stream, self.patient_stream = make_streams(cfg)
+        self.metrics = Metrics(rec_capacity=cfg.R, prep_capacity=cfg.P, theatre_capacity=cfg.OP,
+                               verbose=cfg.verbose, series=series, sketches=cfg.sketches)
+        self.patients = patients if patients is not None else PatientTable()
+
+        # Busy servers and FIFO queues (of slots) per stage
+        self.prep_busy = 0
+        self.prep_queue = deque()
+        self.theatre_busy = 0        # theatres held, operating or blocked
+        self.theatre_queue = deque()
+        self.rec_busy = 0
+        self.rec_queue = deque()     # (slot, block start) blocking a theatre
+
+        self.handlers = (
+            self._arrival, self._prep_end, self._op_end, self._rec_end, self._warmup_end
+        )
+
+        self.schedule(self.arr_stream.next(), ARRIVAL)
+        self.schedule(cfg.warmup, WARMUP_END)
+
+    def schedule(self, delay: float, kind: int, slot: int = -1):
+        heapq.heappush(self.events, (self.now + delay, self.seq, kind, slot))
+        self.seq += 1
+
+    def run(self, until: float):
+        """Process all events strictly before 'until' and advance the clock to it."""
+        events = self.events
+        handlers = self.handlers
+        while events and events[0][0] < until:
+            t, _, kind, slot = heapq.heappop(events)
+            self.now = t
+            handlers[kind](slot)
+        self.now = until
+
+    def fork(self, seed: int) -> "HeapSimulation":
+        """
+        Copy of the current state (clock, events, queues, patients in the
+        system, metrics) whose future arrivals and new patients are drawn from
+        the streams of 'seed', so the copy evolves independently from here on.
+        """
+        clone = copy.copy(self)
+        clone.events = list(self.events)
+        clone.prep_queue = deque(self.prep_queue)
+        clone.theatre_queue = deque(self.theatre_queue)
+        clone.rec_queue = deque(self.rec_queue)
+        clone.patients = self.patients.copy()
+        clone.metrics = self.metrics.clone()
+        clone.handlers = (
+            clone._arrival, clone._prep_end, clone._op_end, clone._rec_end, clone._warmup_end
+        )
+        clone.cfg = replace(self.cfg, seed=seed)
+        clone.arr_stream, clone.patient_stream = make_streams(clone.cfg)
+        return clone
+
+    # -------------------------
+    # Event handlers
+    # -------------------------
+
+    def _arrival(self, _):
+        cfg = self.cfg
+        s = new_patient(self.patients, self.now, self.patient_stream)
+        self.schedule(self.arr_stream.next(), ARRIVAL)
+        if self.trace is not None:
+            self.trace.emit(tracing.ARRIVAL, s + 1, self.now)
+
+        # ---- Preparation ----
+        if self.prep_busy < cfg.P:
+            self.prep_busy += 1
+            self._start_prep(s)
+        else:
+            self.prep_queue.append(s)
+        self.metrics.prep_changed(self.now, len(self.prep_queue), self.prep_busy)
+
+    def _start_prep(self, s: int):
+        self.patients.t_prep_start[s] = self.now
+        if self.trace is not None:
+            self.trace.emit(tracing.PREP_START, s + 1, self.now, tracing.PREP)
+        self.schedule(self.patients.prep_time[s], PREP_END, s)
+
+    def _prep_end(self, s: int):
+        if self.trace is not None:
+            self.trace.emit(tracing.PREP_END, s + 1, self.now, tracing.PREP)
+
+        # Prep room goes to the next queued patient, if any
+        if self.prep_queue:
+            self._start_prep(self.prep_queue.popleft())
+        else:
+            self.prep_busy -= 1
+        self.metrics.prep_changed(self.now, len(self.prep_queue), self.prep_busy)
+
+        # ---- Operation ----
+        if self.theatre_busy < self.cfg.OP:
+            self.theatre_busy += 1
+            self._start_op(s)
+        else:
+            self.theatre_queue.append(s)
+        self.metrics.theatre_changed(self.now, len(self.theatre_queue), self.theatre_busy)
+
+    def _start_op(self, s: int):
+        patients = self.patients
+        patients.t_op_start[s] = self.now
+        patients.theatre[s] = self.metrics.theatre_start(self.now)
+        if self.trace is not None:
+            self.trace.emit(tracing.OP_START, s + 1, self.now, tracing.THEATRE)
+        self.schedule(patients.op_time[s], OP_END, s)
+
+    def _op_end(self, s: int):
+        # --- Operating room blocked while waiting for recovery bed ---
+        self.metrics.theatre_blocked(self.now, self.patients.theatre[s])
+        if self.trace is not None:
+            self.trace.emit(tracing.OP_END, s + 1, self.now, tracing.THEATRE)
+            if self.rec_busy >= self.cfg.R:
+                self.trace.emit(tracing.BLOCK, s + 1, self.now, tracing.THEATRE)
+        if self.rec_busy < self.cfg.R:
+            self.rec_busy += 1
+            self.metrics.rec_changed(self.now, len(self.rec_queue), self.rec_busy)
+            self._enter_recovery(s, self.now)
+        else:
+            self.rec_queue.append((s, self.now))
+            self.metrics.rec_changed(self.now, len(self.rec_queue), self.rec_busy)
+
+    def _enter_recovery(self, s: int, t_block: float):
+        m = self.metrics
+        patients = self.patients
+        wait = patients.block_time[s] = self.now - t_block
+        m.record_rec_wait(wait)
+        patients.bed[s] = m.rec_enter(self.now)
+
+        # Once bed is obtained, the theatre is released to the next patient
+        m.theatre_release(self.now, patients.theatre[s])
+        if self.theatre_queue:
+            self._start_op(self.theatre_queue.popleft())
+        else:
+            self.theatre_busy -= 1
+        m.theatre_changed(self.now, len(self.theatre_queue), self.theatre_busy)
+
+        # ---- Recovery ----
+        if self.trace is not None:
+            self.trace.emit(tracing.REC_START, s + 1, self.now, tracing.RECOVERY)
+        self.schedule(patients.rec_time[s], REC_END, s)
+
+    def _rec_end(self, s: int):
+        m = self.metrics
+        patients = self.patients
+        m.rec_leave(self.now, patients.bed[s])
+
+        # ---- Departure ----
+        patients.t_exit[s] = self.now
+        m.record_patient_departure(self.now, patients.t_arrival[s])
+        if self.trace is not None:
+            self.trace.emit(tracing.REC_END, s + 1, self.now, tracing.RECOVERY)
+            self.trace.emit(tracing.DEPARTURE, s + 1, self.now)
+
+        # Bed goes to the patient blocking a theatre the longest, if any
+        if self.rec_queue:
+            q, t_block = self.rec_queue.popleft()
+            m.rec_changed(self.now, len(self.rec_queue), self.rec_busy)
+            self._enter_recovery(q, t_block)
+        else:
+            self.rec_busy -= 1
+            m.rec_changed(self.now, len(self.rec_queue), self.rec_busy)
+
+    def _warmup_end(self, _):
+        # Theatre and bed states carry over; only the accumulated times restart
+        self.metrics.start_observation(self.now)
+
+
+def batch_ends(cfg: Config) -> List[float]:
+    """End times of the cfg.batches equal batches of the observation period."""
+    ends = [cfg.warmup + cfg.sim_time * k / cfg.batches for k in range(1, cfg.batches)]
+    return ends + [cfg.warmup + cfg.sim_time]
+
+
+def simulate(cfg: Config, trace: EventTrace = None, series: SeriesRecorder = None,
+             patients: PatientTable = None) -> List[Dict[str, float]]:
+    """Run one replication with the heap engine and return the summary of each batch."""
+    sim = HeapSimulation(cfg, trace, series, patients)
+    batches = []
+    for end in batch_ends(cfg):
+        sim.run(end)
+        batches.append(sim.metrics.end_batch(sim.now))
+    return batches
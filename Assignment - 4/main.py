@@ -1,30 +1,43 @@
+import argparse
 import logging
 import sys
 
+from runner import set_backend, set_cache, set_checkpoint, set_workers
+import series
+import tracing
 from analysis import (
     run_independent_experiments,
     run_crn_experiments,
     compare_block_vs_recfull_ci,
     twisted_scenario_experiment,
+    run_adaptive_experiments,
+    run_batch_means_experiments,
+    run_antithetic_experiment,
+    run_control_variates_experiment,
+    run_patient_experiment,
+    run_quantile_experiment,
+    run_splitting_experiment,
+    run_selection_experiment,
+    run_optimization_experiment,
     run_factorial_experiments,
+    run_screening_experiment,
     regression_from_factorial
 )
 
-# Redirect all printed output to a text file
-sys.stdout = open("results.txt", "w", encoding="utf-8")
-
 logger = logging.getLogger("hospital_sim")
 
 
-def setup_logging():
+def setup_logging(trace_level: str = tracing.SUMMARY):
     """Configure logging to both file and console."""
-    logger.setLevel(logging.DEBUG)
+    # Per-replication DEBUG records only when tracing is enabled
+    file_level = logging.INFO if trace_level == tracing.OFF else logging.DEBUG
+    logger.setLevel(file_level)
 
     formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
 
     # File handler (writes detailed logs to simulation.log)
     fh = logging.FileHandler("simulation.log", mode="w", encoding="utf-8")
-    fh.setLevel(logging.DEBUG)
+    fh.setLevel(file_level)
     fh.setFormatter(formatter)
 
     # Console handler (prints INFO level and above to console)
@@ -38,15 +51,84 @@ def setup_logging():
     logger.addHandler(ch)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hospital operating theatre simulation experiments")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="number of worker processes for replications (default: one per CPU core)"
+    )
+    parser.add_argument(
+        "--backend", choices=["simpy", "heap"], default="simpy",
+        help="simulation engine: SimPy process model or the dedicated heapq engine"
+    )
+    parser.add_argument(
+        "--trace", choices=list(tracing.LEVELS), default=tracing.SUMMARY,
+        help="off: no per-event tracing; summary: one log record per replication; "
+             "full: summary + binary event trace per replication"
+    )
+    parser.add_argument(
+        "--trace-dir", default="traces",
+        help="directory for binary event traces (with --trace full)"
+    )
+    parser.add_argument(
+        "--series-dir", default=None,
+        help="record the prep queue, theatre and recovery levels of every replication "
+             "as memory-mapped .npy time series in this directory (bypasses the cache)"
+    )
+    parser.add_argument(
+        "--cache", default="results_cache.sqlite",
+        help="SQLite file caching replication results across runs"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="simulate every replication, without reading or writing the cache"
+    )
+    parser.add_argument(
+        "--checkpoint", default=None,
+        help="append-only checkpoint file; an interrupted run restarted with the same file resumes from it"
+    )
+    parser.add_argument(
+        "--cache-size", type=float, default=256.0,
+        help="maximum size of the cached results in MB (least recently used are evicted)"
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    setup_logging()
+    args = parse_args()
+
+    # Redirect all printed output to a text file
+    # (done here so that worker processes never truncate it on import)
+    sys.stdout = open("results.txt", "w", encoding="utf-8")
+
+    setup_logging(args.trace)
+    tracing.set_level(args.trace, args.trace_dir)
+    series.set_dir(args.series_dir)
+    set_workers(args.workers)
+    set_backend(args.backend)
+    set_cache(None if args.no_cache else args.cache, args.cache_size)
+    set_checkpoint(args.checkpoint)
     logger.info("Starting hospital simulation experiments")
 
-    run_independent_experiments()
-    run_crn_experiments()
-    compare_block_vs_recfull_ci()
-    twisted_scenario_experiment()
-    results = run_factorial_experiments()
-    betas = regression_from_factorial(results)
+    try:
+        run_independent_experiments()
+        run_crn_experiments()
+        compare_block_vs_recfull_ci()
+        twisted_scenario_experiment()
+        run_adaptive_experiments()
+        run_batch_means_experiments()
+        run_antithetic_experiment()
+        run_control_variates_experiment()
+        run_patient_experiment()
+        run_quantile_experiment()
+        run_splitting_experiment()
+        run_selection_experiment()
+        run_optimization_experiment()
+        results = run_factorial_experiments()
+        betas = regression_from_factorial(results)
+        run_screening_experiment()
+    finally:
+        # Close the checkpoint file (also when a run is interrupted)
+        set_checkpoint(None)
 
     logger.info("All experiments completed")
@@ -1,12 +1,154 @@
+import copy
 import logging
+from array import array
+
+from stats import QuantileSketch
 
 logger = logging.getLogger("hospital_sim")
 
+# Quantiles reported for throughput time and recovery wait (as p90_..., p95_...)
+QUANTILES = (0.90, 0.95)
+
+
+class TimeWeighted:
+    """
+    Exact time-average of a piecewise-constant level (queue length, busy servers).
+    The level is updated only when it changes, so no periodic sampling is needed.
+    """
+    __slots__ = ("level", "area", "last_time", "start_time")
+
+    def __init__(self, level: float = 0.0, now: float = 0.0):
+        self.level = level
+        self.area = 0.0
+        self.last_time = now
+        self.start_time = now
+
+    def update(self, now: float, level: float):
+        """Accumulate the area under the current level up to 'now' and switch level."""
+        self.area += self.level * (now - self.last_time)
+        self.level = level
+        self.last_time = now
+
+    def reset(self, now: float):
+        """Discard the accumulated area and start a new averaging window at 'now'."""
+        self.area = 0.0
+        self.last_time = now
+        self.start_time = now
+
+    def mean(self, now: float) -> float:
+        """Time-average of the level over [start_time, now]."""
+        total = now - self.start_time
+        if total <= 0:
+            return float("nan")
+        return (self.area + self.level * (now - self.last_time)) / total
+
+
+# Server states of ServerStates
+IDLE, BUSY, BLOCKED = 0, 1, 2
+
+
+class ServerStates:
+    """
+    State (IDLE / BUSY / BLOCKED) of every server of a station, kept in compact
+    per-server arrays with the time each server spent busy and blocked.
+
+    A state change flushes only the server concerned, so every event costs
+    O(1) however many servers there are; the totals over all servers are only
+    summed when a summary is made. Servers are handed out from a free list
+    (lowest index first). The time during which all servers are in use is
+    accumulated as well.
+    """
+    __slots__ = ("n", "state", "since", "busy_time", "blocked_time", "free",
+                 "in_use", "n_blocked", "full_time", "full_since")
+
+    def __init__(self, n: int, now: float = 0.0):
+        self.n = n
+        self.state = array("b", bytes(n))
+        self.since = array("d", [now]) * n
+        self.busy_time = array("d", [0.0]) * n
+        self.blocked_time = array("d", [0.0]) * n
+        self.free = list(range(n - 1, -1, -1))
+        self.in_use = 0
+        self.n_blocked = 0
+        self.full_time = 0.0
+        self.full_since = now
+
+    def _flush(self, now: float, i: int):
+        state = self.state[i]
+        if state == BUSY:
+            self.busy_time[i] += now - self.since[i]
+        elif state == BLOCKED:
+            self.blocked_time[i] += now - self.since[i]
+            self.n_blocked -= 1
+        self.since[i] = now
+
+    def acquire(self, now: float, state: int = BUSY) -> int:
+        """Take a free server into 'state' and return its index."""
+        i = self.free.pop()
+        self._flush(now, i)
+        self.state[i] = state
+        if state == BLOCKED:
+            self.n_blocked += 1
+        self.in_use += 1
+        if self.in_use == self.n:
+            self.full_since = now
+        return i
+
+    def set(self, now: float, i: int, state: int):
+        """Change the state of server i (which stays in use)."""
+        self._flush(now, i)
+        self.state[i] = state
+        if state == BLOCKED:
+            self.n_blocked += 1
+
+    def release(self, now: float, i: int):
+        """Return server i to the free list."""
+        self._flush(now, i)
+        self.state[i] = IDLE
+        if self.in_use == self.n:
+            self.full_time += now - self.full_since
+        self.in_use -= 1
+        self.free.append(i)
+
+    def reset(self, now: float):
+        """Discard the accumulated times (states carry over) and restart at 'now'."""
+        for i in range(self.n):
+            self.since[i] = now
+            self.busy_time[i] = 0.0
+            self.blocked_time[i] = 0.0
+        self.full_time = 0.0
+        self.full_since = now
+
+    def totals(self, now: float):
+        """(busy, blocked, all-in-use) time up to 'now', summed over the servers."""
+        busy = sum(self.busy_time)
+        blocked = sum(self.blocked_time)
+        for i, state in enumerate(self.state):
+            if state == BUSY:
+                busy += now - self.since[i]
+            elif state == BLOCKED:
+                blocked += now - self.since[i]
+        full = self.full_time + (now - self.full_since if self.in_use == self.n else 0.0)
+        return busy, blocked, full
+
+    def copy(self) -> "ServerStates":
+        other = copy.copy(self)
+        for name in ("state", "since", "busy_time", "blocked_time", "free"):
+            setattr(other, name, copy.copy(getattr(self, name)))
+        return other
+
 
 class Metrics:
-    def __init__(self, rec_capacity: int, verbose: bool = False):
+    def __init__(self, rec_capacity: int, prep_capacity: int, theatre_capacity: int = 1,
+                 verbose: bool = False, series=None, sketches: bool = False):
         self.verbose = verbose
 
+        # Return the quantile sketches with every batch summary (see end_batch)
+        self.return_sketches = sketches
+
+        # Optional series.SeriesRecorder of the piecewise-constant levels
+        self.series = series
+
         # Observation state
         self.observing = False
         self.obs_start_time = 0.0
@@ -14,30 +156,43 @@ class Metrics:
         # Throughput & departures
         self.n_done = 0
         self.throughput_sum = 0.0
+        self.throughput_q = QuantileSketch()
 
-        # Operating theatre state
-        self.theatre_state = "idle"  # idle / busy / blocked
-        self.last_state_change = 0.0
-        self.theatre_busy_time = 0.0
-        self.theatre_blocked_time = 0.0
-
-        # Preparation queue samples
-        self.prep_queue_samples_sum = 0.0
-        self.prep_queue_samples_n = 0
+        # Operating theatres: idle / busy / blocked per theatre
+        self.theatres = ServerStates(theatre_capacity)
 
-        # Preparation idle capacity samples
-        self.prep_idle_samples_sum = 0.0
-        self.prep_idle_samples_n = 0
+        # Time-weighted levels, updated on resource request/release events
+        self.prep_capacity = prep_capacity
+        self.prep_queue = TimeWeighted()
+        self.prep_idle = TimeWeighted(level=prep_capacity)
+        self.theatre_queue = TimeWeighted()
+        self.rec_occupancy = TimeWeighted()
 
-        # Recovery beds
+        # Recovery beds: idle / busy per bed
         self.rec_capacity = rec_capacity
-        self.rec_count = 0
-        self.rec_last_change = 0.0
-        self.rec_full_time = 0.0
+        self.beds = ServerStates(rec_capacity)
 
         # --- New metric: waiting time for recovery bed ---
         self.rec_wait_sum = 0.0
         self.rec_wait_n = 0
+        self.rec_wait_q = QuantileSketch()
+
+    @property
+    def rec_count(self) -> int:
+        """Occupied recovery beds."""
+        return self.beds.in_use
+
+    def clone(self) -> "Metrics":
+        """Independent copy of the current statistics (for forked simulations)."""
+        other = copy.copy(self)
+        for name in ("prep_queue", "prep_idle", "theatre_queue", "rec_occupancy"):
+            setattr(other, name, copy.copy(getattr(self, name)))
+        other.theatres = self.theatres.copy()
+        other.beds = self.beds.copy()
+        other.throughput_q = self.throughput_q.copy()
+        other.rec_wait_q = self.rec_wait_q.copy()
+        other.series = None  # forks are not recorded
+        return other
 
     # -------------------------
     # Observation control
@@ -48,99 +203,82 @@ class Metrics:
         self.observing = True
         self.obs_start_time = now
 
-        # Reset counters
+        # Reset counters (server states carry over from the warm-up)
         self.n_done = 0
         self.throughput_sum = 0.0
-        self.theatre_busy_time = 0.0
-        self.theatre_blocked_time = 0.0
+        self.throughput_q = QuantileSketch()
+        self.theatres.reset(now)
+        self.beds.reset(now)
 
-        self.prep_queue_samples_sum = 0.0
-        self.prep_queue_samples_n = 0
-        self.prep_idle_samples_sum = 0.0
-        self.prep_idle_samples_n = 0
+        self.prep_queue.reset(now)
+        self.prep_idle.reset(now)
+        self.theatre_queue.reset(now)
+        self.rec_occupancy.reset(now)
 
-        self.rec_full_time = 0.0
         self.rec_wait_sum = 0.0
         self.rec_wait_n = 0
-
-        self.last_state_change = now
-        self.rec_last_change = now
+        self.rec_wait_q = QuantileSketch()
 
     # -------------------------
     # Operating theatre tracking
     # -------------------------
 
-    def _flush_theatre(self, now: float):
-        """Update accumulated times for theatre states up to 'now'."""
-        if not self.observing:
-            self.last_state_change = now
-            return
-
-        dur = now - self.last_state_change
-        if dur > 0:
-            if self.theatre_state == "busy":
-                self.theatre_busy_time += dur
-            elif self.theatre_state == "blocked":
-                self.theatre_blocked_time += dur
-
-        self.last_state_change = now
-
-    def set_theatre_state(self, now: float, new_state: str):
-        """Change theatre state and flush previous duration."""
-        self._flush_theatre(now)
-        self.theatre_state = new_state
+    def theatre_start(self, now: float) -> int:
+        """A free theatre starts operating; returns its index."""
+        theatre = self.theatres.acquire(now, BUSY)
+        if self.series is not None:
+            self._record_theatres(now)
+        return theatre
+
+    def theatre_blocked(self, now: float, theatre: int):
+        """Operation finished; the theatre is held until a recovery bed is free."""
+        self.theatres.set(now, theatre, BLOCKED)
+        if self.series is not None:
+            self._record_theatres(now)
+
+    def theatre_release(self, now: float, theatre: int):
+        """The patient left for recovery; the theatre is idle."""
+        self.theatres.release(now, theatre)
+        if self.series is not None:
+            self._record_theatres(now)
+
+    def _record_theatres(self, now: float):
+        blocked = self.theatres.n_blocked
+        self.series.theatres_busy.record(now, self.theatres.in_use - blocked)
+        self.series.theatres_blocked.record(now, blocked)
 
     # -------------------------
     # Recovery beds tracking
     # -------------------------
 
-    def _flush_rec(self, now: float):
-        """Update accumulated time when all recovery beds are full."""
-        if not self.observing:
-            self.rec_last_change = now
-            return
-
-        dur = now - self.rec_last_change
-        if dur > 0 and self.rec_count == self.rec_capacity:
-            self.rec_full_time += dur
-
-        self.rec_last_change = now
-
-    def rec_enter(self, now: float):
-        """Record patient entering recovery bed."""
-        self._flush_rec(now)
-        self.rec_count += 1
-        logger.debug(
-            "Recovery enter at %.3f, count=%d/%d",
-            now, self.rec_count, self.rec_capacity
-        )
+    def rec_enter(self, now: float) -> int:
+        """Record patient entering recovery bed; returns the bed index."""
+        return self.beds.acquire(now, BUSY)
 
-    def rec_leave(self, now: float):
+    def rec_leave(self, now: float, bed: int):
         """Record patient leaving recovery bed."""
-        self._flush_rec(now)
-        self.rec_count -= 1
-        logger.debug(
-            "Recovery leave at %.3f, count=%d/%d",
-            now, self.rec_count, self.rec_capacity
-        )
+        self.beds.release(now, bed)
 
     # -------------------------
-    # Sampling
+    # Resource state changes
     # -------------------------
 
-    def record_prep_queue_sample(self, qlen: int):
-        """Record a sample of preparation queue length."""
-        if not self.observing:
-            return
-        self.prep_queue_samples_sum += qlen
-        self.prep_queue_samples_n += 1
+    def prep_changed(self, now: float, queue_len: int, busy: int):
+        """Record a change of the preparation queue or busy rooms."""
+        self.prep_queue.update(now, queue_len)
+        self.prep_idle.update(now, self.prep_capacity - busy)
+        if self.series is not None:
+            self.series.prep_queue.record(now, queue_len)
 
-    def record_prep_idle_sample(self, idle: int):
-        """Record a sample of idle preparation capacity."""
-        if not self.observing:
-            return
-        self.prep_idle_samples_sum += idle
-        self.prep_idle_samples_n += 1
+    def theatre_changed(self, now: float, queue_len: int, busy: int):
+        """Record a change of the queue in front of the operating theatres."""
+        self.theatre_queue.update(now, queue_len)
+
+    def rec_changed(self, now: float, queue_len: int, busy: int):
+        """Record a change of the number of occupied recovery beds."""
+        self.rec_occupancy.update(now, busy)
+        if self.series is not None:
+            self.series.rec_occupancy.record(now, busy)
 
     # -------------------------
     # New metric: recovery waiting time
@@ -151,6 +289,7 @@ class Metrics:
         if self.observing:
             self.rec_wait_sum += wait_time
             self.rec_wait_n += 1
+            self.rec_wait_q.add(wait_time)
 
     # -------------------------
     # Departures and throughput
@@ -162,31 +301,58 @@ class Metrics:
             return
         self.n_done += 1
         self.throughput_sum += (t_exit - t_arrival)
+        self.throughput_q.add(t_exit - t_arrival)
+
+    # -------------------------
+    # Batch means
+    # -------------------------
+
+    def end_batch(self, now: float):
+        """
+        Summarize the batch ending at 'now' and start the next one (system state
+        carries over). If requested, the quantile sketches of the batch are
+        added as dicts under "sketches", to be merged across batches and
+        replications.
+        """
+        res = self.summarize(now)
+        if self.return_sketches:
+            res["sketches"] = self.sketches()
+        self.start_observation(now)
+        return res
+
+    def sketches(self):
+        """Quantile sketches of throughput time and recovery wait, as dicts."""
+        return {
+            "throughput_time": self.throughput_q.to_dict(),
+            "rec_wait": self.rec_wait_q.to_dict(),
+        }
 
     # -------------------------
     # Final summary
     # -------------------------
 
     def summarize(self, now: float):
-        """Summarize all metrics at the end of observation."""
-        self._flush_theatre(now)
-        self._flush_rec(now)
-
+        """
+        Summarize all metrics at the end of observation. Besides the means,
+        the QUANTILES of throughput time and recovery wait are estimated from
+        streaming sketches.
+        """
         total_time = (now - self.obs_start_time) if self.observing else 0.0
 
-        util = self.theatre_busy_time / total_time if total_time > 0 else float("nan")
-        block_rate = self.theatre_blocked_time / total_time if total_time > 0 else float("nan")
-        prob_rec_full = self.rec_full_time / total_time if total_time > 0 else float("nan")
+        # Theatre utilization and blocking are per theatre (averaged over OP)
+        busy, blocked, _ = self.theatres.totals(now)
+        _, _, rec_full = self.beds.totals(now)
+        theatre_time = total_time * self.theatres.n
+
+        util = busy / theatre_time if total_time > 0 else float("nan")
+        block_rate = blocked / theatre_time if total_time > 0 else float("nan")
+        prob_rec_full = rec_full / total_time if total_time > 0 else float("nan")
 
         avg_thr = self.throughput_sum / self.n_done if self.n_done > 0 else float("nan")
-        avg_qprep = (
-            self.prep_queue_samples_sum / self.prep_queue_samples_n
-            if self.prep_queue_samples_n > 0 else float("nan")
-        )
-        avg_prep_idle = (
-            self.prep_idle_samples_sum / self.prep_idle_samples_n
-            if self.prep_idle_samples_n > 0 else float("nan")
-        )
+        avg_qprep = self.prep_queue.mean(now) if self.observing else float("nan")
+        avg_prep_idle = self.prep_idle.mean(now) if self.observing else float("nan")
+        avg_qtheatre = self.theatre_queue.mean(now) if self.observing else float("nan")
+        avg_rec_occ = self.rec_occupancy.mean(now) if self.observing else float("nan")
 
         avg_rec_wait = (
             self.rec_wait_sum / self.rec_wait_n
@@ -200,6 +366,10 @@ class Metrics:
             "avg_throughput_time": avg_thr,
             "avg_prep_queue_length": avg_qprep,
             "avg_prep_idle_capacity": avg_prep_idle,
+            "avg_theatre_queue_length": avg_qtheatre,
+            "avg_recovery_occupancy": avg_rec_occ,
             "prob_recovery_all_busy": prob_rec_full,
             "avg_rec_wait": avg_rec_wait,
+            **{f"p{round(100 * q)}_throughput_time": self.throughput_q.quantile(q) for q in QUANTILES},
+            **{f"p{round(100 * q)}_rec_wait": self.rec_wait_q.quantile(q) for q in QUANTILES},
         }
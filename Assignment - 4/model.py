@@ -1,99 +1,255 @@
+import copy
 import simpy
-import random
 import logging
-from dataclasses import dataclass
+import numpy as np
+from array import array
+from typing import Dict
 
 from metrics import Metrics
 from config import Config
+from variates import PatientStream, VariateStream, exp_transform, unif_transform
+import tracing
+from tracing import EventTrace
 
 logger = logging.getLogger("hospital_sim")
 
 
 # -------------------------
-# Patient dataclass
+# Patient table
 # -------------------------
 
-@dataclass
-class Patient:
-    pid: int
-    ptype: str
-    t_arrival: float
-    prep_time: float
-    op_time: float
-    rec_time: float
-    t_exit: float = None
+# Patient type codes of PatientTable.ptype
+BASE, MILD, SEVERE = 0, 1, 2
+PTYPE_NAMES = ("base", "mild", "severe")
+
+NAN = float("nan")
+
+
+class PatientTable:
+    """
+    Structure-of-arrays record of every patient of a replication: one slot
+    (row) per arrival, in arrival order, with patient id pid = slot + 1.
+    The simulation passes slot indices around instead of patient objects and
+    fills in the times of each stage as it happens; times of stages not
+    reached yet are NaN, theatre and bed (Metrics server indices) -1.
+
+    block_time is the time the patient held a theatre after the operation,
+    waiting for a recovery bed. to_numpy gives the columns as NumPy arrays
+    for vectorized analysis.
+    """
+    COLUMNS = ("ptype", "t_arrival", "prep_time", "op_time", "rec_time",
+               "t_prep_start", "t_op_start", "block_time", "t_exit", "theatre", "bed")
+    __slots__ = COLUMNS
+
+    def __init__(self):
+        self.ptype = array("b")
+        for name in ("t_arrival", "prep_time", "op_time", "rec_time",
+                     "t_prep_start", "t_op_start", "block_time", "t_exit"):
+            setattr(self, name, array("d"))
+        self.theatre = array("i")
+        self.bed = array("i")
+
+    def add(self, t_arrival: float, ptype: int, prep_time: float, op_time: float,
+            rec_time: float) -> int:
+        """Append an arriving patient; returns its slot."""
+        self.ptype.append(ptype)
+        self.t_arrival.append(t_arrival)
+        self.prep_time.append(prep_time)
+        self.op_time.append(op_time)
+        self.rec_time.append(rec_time)
+        self.t_prep_start.append(NAN)
+        self.t_op_start.append(NAN)
+        self.block_time.append(NAN)
+        self.t_exit.append(NAN)
+        self.theatre.append(-1)
+        self.bed.append(-1)
+        return len(self.ptype) - 1
+
+    def __len__(self):
+        return len(self.ptype)
+
+    def copy(self) -> "PatientTable":
+        other = PatientTable.__new__(PatientTable)
+        for name in self.COLUMNS:
+            setattr(other, name, copy.copy(getattr(self, name)))
+        return other
+
+    def to_numpy(self) -> Dict[str, np.ndarray]:
+        """Copy of every column as a NumPy array."""
+        return {name: np.array(getattr(self, name)) for name in self.COLUMNS}
 
 
 # -------------------------
 # Sampling helpers
 # -------------------------
+# Arrivals come from a buffered VariateStream; each patient's own service
+# times come from its PatientStream substream (uniform columns: prep,
+# severity, operation, recovery), so both scenarios read the same uniforms for
+# the same patient. Distributions are resolved once per replication, so no
+# per-patient string comparisons.
+
+def dist_transform(dist: str, mean: float, low: float, high: float):
+    """Return the block transform for an "exp" or "unif" distribution."""
+    if dist == "exp":
+        return exp_transform(mean)
+    else:  # uniform
+        return unif_transform(low, high)
+
+
+def op_transform(cfg: Config):
+    """Return the transform of (severity, operation) uniforms to (operation time, patient type) pairs."""
+    if cfg.scenario == "original":
+        base = exp_transform(cfg.op_mean)
+
+        def transform(u_severity: np.ndarray, u_op: np.ndarray):
+            return [(t, BASE) for t in base(u_op)]
+        return transform
+
+    severe_prob = cfg.severe_prob
+    severe_mean = cfg.severe_op_mean
+    mild_mean = cfg.mild_op_mean
+
+    def transform(u_severity: np.ndarray, u_op: np.ndarray):
+        severe = u_severity < severe_prob
+        means = np.where(severe, severe_mean, mild_mean)
+        times = (-means * np.log1p(-u_op)).tolist()
+        return [(t, SEVERE if s else MILD) for t, s in zip(times, severe.tolist())]
+    return transform
+
+
+def patient_transform(cfg: Config):
+    """Return the transform of per-patient uniforms to (prep, (op, type), rec) records."""
+    prep = dist_transform(cfg.prep_dist, cfg.prep_mean, cfg.prep_low, cfg.prep_high)
+    op = op_transform(cfg)
+    rec = dist_transform(cfg.rec_dist, cfg.rec_mean, cfg.rec_low, cfg.rec_high)
 
-def exp_sample(rng: random.Random, mean: float) -> float:
-    """Sample from an exponential distribution with given mean."""
-    return rng.expovariate(1.0 / mean)
+    def transform(u: np.ndarray):
+        return list(zip(prep(u[:, 0]), op(u[:, 1], u[:, 2]), rec(u[:, 3])))
+    return transform
 
-def unif_sample(rng: random.Random, low: float, high: float) -> float:
-    """Sample from a uniform distribution."""
-    return rng.uniform(low, high)
+
+def make_streams(cfg: Config):
+    """Return the (arrival, patient) streams used for CRN."""
+    return (
+        VariateStream(cfg.seed + 100, dist_transform(      # arrivals
+            cfg.interarrival_dist, cfg.interarrival_mean,
+            cfg.interarrival_low, cfg.interarrival_high), cfg.antithetic),
+        PatientStream(cfg.seed + 200, patient_transform(cfg),  # per-patient substreams
+                      cfg.antithetic),
+    )
+
+
+# -------------------------
+# Input means (control variates)
+# -------------------------
+# Result keys of the recorded input sample means, in stream order
+CONTROL_KEYS = ("cv_interarrival", "cv_prep", "cv_op", "cv_rec")
 
 
-def sample_op_time(cfg: Config, rng: random.Random):
-    """Return sampled operation time and patient type label."""
+def _dist_mean(dist: str, mean: float, low: float, high: float) -> float:
+    return mean if dist == "exp" else 0.5 * (low + high)
+
+
+def expected_input_means(cfg: Config) -> Dict[str, float]:
+    """True means of the input distributions, keyed like input_means."""
     if cfg.scenario == "original":
-        return exp_sample(rng, cfg.op_mean), "base"
+        op_mean = cfg.op_mean
     else:
-        if rng.random() < cfg.severe_prob:
-            return exp_sample(rng, cfg.severe_op_mean), "severe"
-        else:
-            return exp_sample(rng, cfg.mild_op_mean), "mild"
+        op_mean = cfg.severe_prob * cfg.severe_op_mean + (1 - cfg.severe_prob) * cfg.mild_op_mean
+    return dict(zip(CONTROL_KEYS, (
+        _dist_mean(cfg.interarrival_dist, cfg.interarrival_mean,
+                   cfg.interarrival_low, cfg.interarrival_high),
+        _dist_mean(cfg.prep_dist, cfg.prep_mean, cfg.prep_low, cfg.prep_high),
+        op_mean,
+        _dist_mean(cfg.rec_dist, cfg.rec_mean, cfg.rec_low, cfg.rec_high),
+    )))
+
+
+def input_means(cfg: Config) -> Dict[str, float]:
+    """
+    Sample means of the inputs of a replication: the first n interarrival
+    times and the prep, operation and recovery times of patients 1..n, read
+    from fresh copies of the replication's streams. n is fixed per config
+    (the expected number of arrivals during warm-up and observation), so each
+    sample mean has exactly the expectation given by expected_input_means,
+    whereas the number of draws a run actually uses depends on the draws.
+    """
+    n = max(2, int((cfg.warmup + cfg.sim_time) / expected_input_means(cfg)["cv_interarrival"]))
+    arr_stream, patient_stream = make_streams(cfg)
+    arrivals = [arr_stream.next() for _ in range(n)]
+    records = [patient_stream.get(pid) for pid in range(1, n + 1)]
+    return dict(zip(CONTROL_KEYS, (
+        sum(arrivals) / n,
+        sum(prep for prep, _, _ in records) / n,
+        sum(op for _, (op, _), _ in records) / n,
+        sum(rec for _, _, rec in records) / n,
+    )))
+
+
+def new_patient(patients: PatientTable, now: float, patient_stream: PatientStream) -> int:
+    """Add a patient arriving at 'now' with its own service times; returns its slot."""
+    prep_time, (op_time, ptype), rec_time = patient_stream.get(len(patients) + 1)
+    return patients.add(now, ptype, prep_time, op_time, rec_time)
 
 
 # -------------------------
 # Patient flow process
 # -------------------------
 
-def patient_process(env, patient, cfg, prep_res, theatre_res, rec_res, metrics: Metrics):
+def patient_process(env, slot: int, patients: PatientTable, cfg, prep_res, theatre_res, rec_res,
+                    metrics: Metrics, trace: EventTrace = None):
+    # Per-event tracing only happens at the "full" level (trace is None otherwise)
+    pid = slot + 1
+
     # ---- Preparation ----
-    logger.debug("Patient %d enters prep queue at t=%.3f", patient.pid, env.now)
     with prep_res.request() as req_prep:
         yield req_prep
-        logger.debug("Patient %d starts preparation at t=%.3f (dur=%.3f)", patient.pid, env.now, patient.prep_time)
-        yield env.timeout(patient.prep_time)
-        logger.debug("Patient %d finishes preparation at t=%.3f", patient.pid, env.now)
+        patients.t_prep_start[slot] = env.now
+        if trace is not None:
+            trace.emit(tracing.PREP_START, pid, env.now, tracing.PREP)
+        yield env.timeout(patients.prep_time[slot])
+        if trace is not None:
+            trace.emit(tracing.PREP_END, pid, env.now, tracing.PREP)
 
     # ---- Operation ----
     with theatre_res.request() as req_theatre:
         yield req_theatre
-        metrics.set_theatre_state(env.now, "busy")
-        logger.debug("Patient %d starts operation at t=%.3f (dur=%.3f)", patient.pid, env.now, patient.op_time)
-        yield env.timeout(patient.op_time)
-        logger.debug("Patient %d finishes operation at t=%.3f", patient.pid, env.now)
+        patients.t_op_start[slot] = env.now
+        theatre = patients.theatre[slot] = metrics.theatre_start(env.now)
+        if trace is not None:
+            trace.emit(tracing.OP_START, pid, env.now, tracing.THEATRE)
+        yield env.timeout(patients.op_time[slot])
 
         # --- Operating room blocked while waiting for recovery bed ---
-        with rec_res.request() as req_rec:
-            metrics.set_theatre_state(env.now, "blocked")
-            t_start_wait = env.now
-            logger.debug("Patient %d blocks OR at t=%.3f waiting for recovery bed", patient.pid, env.now)
-            yield req_rec
-            wait_time = env.now - t_start_wait
-            metrics.record_rec_wait(wait_time)
-            metrics.rec_enter(env.now)
-            logger.debug("Patient %d gets recovery bed at t=%.3f (wait=%.3f)", patient.pid, env.now, wait_time)
+        # The bed request is held until recovery ends (released below)
+        req_rec = rec_res.request()
+        metrics.theatre_blocked(env.now, theatre)
+        t_start_wait = env.now
+        if trace is not None:
+            trace.emit(tracing.OP_END, pid, env.now, tracing.THEATRE)
+            if not req_rec.triggered:
+                trace.emit(tracing.BLOCK, pid, env.now, tracing.THEATRE)
+        yield req_rec
+        wait_time = patients.block_time[slot] = env.now - t_start_wait
+        metrics.record_rec_wait(wait_time)
+        bed = patients.bed[slot] = metrics.rec_enter(env.now)
 
         # Once bed is obtained, operating room becomes idle
-        metrics.set_theatre_state(env.now, "idle")
-        logger.debug("Operating room idle at t=%.3f after patient %d moved to recovery", env.now, patient.pid)
+        metrics.theatre_release(env.now, theatre)
 
     # ---- Recovery ----
-    logger.debug("Patient %d starts recovery at t=%.3f (dur=%.3f)", patient.pid, env.now, patient.rec_time)
-    yield env.timeout(patient.rec_time)
-    metrics.rec_leave(env.now)
-    logger.debug("Patient %d finishes recovery and releases bed at t=%.3f", patient.pid, env.now)
+    if trace is not None:
+        trace.emit(tracing.REC_START, pid, env.now, tracing.RECOVERY)
+    yield env.timeout(patients.rec_time[slot])
+    metrics.rec_leave(env.now, bed)
+    rec_res.release(req_rec)
 
     # ---- Departure ----
-    patient.t_exit = env.now
-    metrics.record_patient_departure(patient.t_exit, patient.t_arrival)
-    logger.debug("Patient %d leaves system at t=%.3f (total time=%.3f)", patient.pid, patient.t_exit, patient.t_exit - patient.t_arrival)
+    patients.t_exit[slot] = env.now
+    metrics.record_patient_departure(env.now, patients.t_arrival[slot])
+    if trace is not None:
+        trace.emit(tracing.REC_END, pid, env.now, tracing.RECOVERY)
+        trace.emit(tracing.DEPARTURE, pid, env.now)
 
 
 # -------------------------
@@ -101,86 +257,51 @@ def patient_process(env, patient, cfg, prep_res, theatre_res, rec_res, metrics:
 # -------------------------
 
 def source_process(env, cfg, prep_res, theatre_res, rec_res, metrics: Metrics,
-                   rng_arr: random.Random, rng_prep: random.Random,
-                   rng_op: random.Random, rng_rec: random.Random):
-    pid = 0
-
+                   arr_stream: VariateStream, patient_stream: PatientStream,
+                   patients: PatientTable, trace: EventTrace = None):
     while True:
-        # -------------------------
-        # Interarrival time
-        # -------------------------
-        if cfg.interarrival_dist == "exp":
-            ia = exp_sample(rng_arr, cfg.interarrival_mean)
-        else:  # uniform
-            ia = unif_sample(rng_arr, cfg.interarrival_low, cfg.interarrival_high)
-
-        yield env.timeout(ia)
-
-        pid += 1
-
-        # -------------------------
-        # Operation time (exp or twisted)
-        # -------------------------
-        op_time, ptype = sample_op_time(cfg, rng_op)
-
-        # -------------------------
-        # Preparation time
-        # -------------------------
-        if cfg.prep_dist == "exp":
-            prep_time = exp_sample(rng_prep, cfg.prep_mean)
-        else:
-            prep_time = unif_sample(rng_prep, cfg.prep_low, cfg.prep_high)
-
-        # -------------------------
-        # Recovery time
-        # -------------------------
-        if cfg.rec_dist == "exp":
-            rec_time = exp_sample(rng_rec, cfg.rec_mean)
-        else:
-            rec_time = unif_sample(rng_rec, cfg.rec_low, cfg.rec_high)
-        # -------------------------
-        # Create patient
-        # -------------------------
-        p = Patient(
-            pid=pid,
-            ptype=ptype,
-            t_arrival=env.now,
-            prep_time=prep_time,
-            op_time=op_time,
-            rec_time=rec_time,
-        )
+        yield env.timeout(arr_stream.next())
 
-        logger.debug(
-            "Patient %d arrival at t=%.3f: prep=%.3f, op=%.3f, rec=%.3f, type=%s",
-            pid, p.t_arrival, prep_time, op_time, rec_time, p.ptype
-        )
+        slot = new_patient(patients, env.now, patient_stream)
+        if trace is not None:
+            trace.emit(tracing.ARRIVAL, slot + 1, env.now)
 
         env.process(
-            patient_process(env, p, cfg, prep_res, theatre_res, rec_res, metrics)
+            patient_process(env, slot, patients, cfg, prep_res, theatre_res, rec_res, metrics, trace)
         )
 
 
 # -------------------------
-# Continuous monitoring of prep queue
+# Event-driven resource monitoring
 # -------------------------
 
-class Monitor:
-    def __init__(self, env: simpy.Environment, prep_res: simpy.Resource, metrics: Metrics, dt: float):
+class TrackedResource(simpy.Resource):
+    """
+    SimPy resource that reports (now, queue length, busy count) to a listener
+    whenever a request is made or granted or a slot is released, so statistics
+    are updated exactly when the state changes instead of being sampled by a
+    separate monitor process. Only SimPy's public API is used: the request
+    and release calls (also made by the with-statement) and a callback on each
+    request event, which runs when the request is granted.
+    """
+
+    def __init__(self, env: simpy.Environment, capacity: int, listener):
+        super().__init__(env, capacity=capacity)
         self.env = env
-        self.prep_res = prep_res
-        self.metrics = metrics
-        self.dt = dt
-        env.process(self.run())
-
-    def run(self):
-        while True:
-            qlen = len(self.prep_res.queue)
-            idle = self.prep_res.capacity - self.prep_res.count
-
-            self.metrics.record_prep_queue_sample(qlen)
-            self.metrics.record_prep_idle_sample(idle)
-
-            # Optional periodic sampling log (commented to avoid log flooding):
-            # logger.debug("Prep sampling at t=%.3f: qlen=%d, idle=%d", self.env.now, qlen, idle)
-
-            yield self.env.timeout(self.dt)
+        self.listener = listener
+
+    def _report(self, _event=None):
+        self.listener(self.env.now, len(self.queue), self.count)
+
+    def request(self) -> simpy.resources.resource.Request:
+        req = super().request()
+        # Granted at once (count grew) or queued (queue grew); a queued request
+        # is granted when a release is processed and reports through its callback
+        self._report()
+        req.callbacks.append(self._report)
+        return req
+
+    def release(self, request) -> simpy.resources.resource.Release:
+        rel = super().release(request)
+        self._report()
+        return rel
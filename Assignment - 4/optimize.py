@@ -0,0 +1,170 @@
+import logging
+import itertools
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from runner import run_replications
+from stats import PairedStats, RunningStats
+
+logger = logging.getLogger("hospital_sim")
+
+# A capacity point (P, R, OP)
+Point = Tuple[int, int, int]
+
+# Default cost per unit of capacity and search bounds (inclusive)
+DEFAULT_COSTS = {"P": 1.0, "R": 1.0, "OP": 4.0}
+DEFAULT_BOUNDS = {"P": (1, 8), "R": (1, 8), "OP": (1, 3)}
+
+
+class CapacitySearch:
+    """
+    Discrete stochastic search over integer capacities (P, R, OP).
+
+    Every point is estimated from n_rep replications with the same seeds
+    (CRN), so neighbouring points are compared by paired differences. Results
+    are kept per point for the whole search, and the replications of all
+    points still to evaluate in a step run as one parallel batch (through
+    run_replications, which also uses the persistent result cache).
+    """
+
+    def __init__(self, base_cfg: Config, metric: str, base_seed: int, n_rep: int = 20,
+                 costs: Optional[Dict[str, float]] = None,
+                 bounds: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.base_cfg = base_cfg
+        self.metric = metric
+        self.base_seed = base_seed
+        self.n_rep = n_rep
+        self.costs = dict(DEFAULT_COSTS, **(costs or {}))
+        self.bounds = dict(DEFAULT_BOUNDS, **(bounds or {}))
+        self.values: Dict[Point, List[float]] = {}
+
+    # -------------------------
+    # Evaluation
+    # -------------------------
+
+    def cost(self, point: Point) -> float:
+        P, R, OP = point
+        return self.costs["P"] * P + self.costs["R"] * R + self.costs["OP"] * OP
+
+    def in_bounds(self, point: Point) -> bool:
+        return all(lo <= v <= hi for v, (lo, hi) in zip(point, self.bounds.values()))
+
+    def evaluate(self, points: List[Point]):
+        """Run the replications of all points not evaluated yet (one batch)."""
+        new = [p for p in dict.fromkeys(points) if p not in self.values]
+        if not new:
+            return
+        jobs = [
+            (replace(self.base_cfg, P=P, R=R, OP=OP), self.base_seed + r)
+            for P, R, OP in new
+            for r in range(self.n_rep)
+        ]
+        all_res = run_replications(jobs)
+        for j, point in enumerate(new):
+            self.values[point] = [res[self.metric] for res in all_res[j * self.n_rep:(j + 1) * self.n_rep]]
+
+    def stats(self, point: Point) -> RunningStats:
+        return RunningStats.from_samples(self.values[point])
+
+    def better(self, a: Point, b: Point) -> bool:
+        """True if a is significantly better (smaller) than b: 95% CI of a - b below 0."""
+        diff = PairedStats()
+        for x, y in zip(self.values[a], self.values[b]):
+            diff.add(x, y)
+        _, _, (_, hi) = diff.ci(0.95)
+        return hi < 0
+
+    def neighbours(self, point: Point) -> List[Point]:
+        """Points differing by at most one unit in every capacity."""
+        out = []
+        for step in itertools.product((-1, 0, 1), repeat=3):
+            if any(step):
+                cand = tuple(v + s for v, s in zip(point, step))
+                if self.in_bounds(cand):
+                    out.append(cand)
+        return out
+
+    # -------------------------
+    # Searches
+    # -------------------------
+
+    def minimize(self, budget: float, start: Optional[Point] = None) -> Dict:
+        """
+        Minimize the metric subject to cost <= budget by local search: move to
+        the best neighbour within budget while it is significantly better than
+        the current point; stop at a local optimum.
+        """
+        current = start or tuple(lo for lo, _ in self.bounds.values())
+        if self.cost(current) > budget:
+            raise ValueError(f"Start point {current} exceeds the budget {budget}")
+        path = [current]
+
+        while True:
+            cands = [p for p in self.neighbours(current) if self.cost(p) <= budget]
+            self.evaluate([current] + cands)
+            best = min(cands, key=lambda p: self.stats(p).mean, default=None)
+            if best is None or not self.better(best, current):
+                break
+            current = best
+            path.append(current)
+
+        return self._result(current, path)
+
+    def cheapest(self, target: float, start: Optional[Point] = None) -> Dict:
+        """
+        Cheapest point whose metric meets 'target' (upper 95% CI bound <= target).
+
+        Greedy ascent adds the unit of capacity with the largest improvement
+        per unit of cost until the target is met; then single units are removed
+        (cheapest point still meeting the target first) while possible.
+        """
+        def meets(p: Point) -> bool:
+            _, _, (_, hi) = self.stats(p).ci(0.95)
+            return hi <= target
+
+        current = start or tuple(lo for lo, _ in self.bounds.values())
+        path = [current]
+        self.evaluate([current])
+
+        # Add capacity until the target is met
+        while not meets(current):
+            ups = [p for p in self.neighbours(current)
+                   if sum(p) == sum(current) + 1 and min(b - a for a, b in zip(current, p)) >= 0]
+            if not ups:
+                return dict(self._result(current, path), met=False)
+            self.evaluate(ups)
+            mean = self.stats(current).mean
+            current = max(
+                ups, key=lambda p: (mean - self.stats(p).mean) / (self.cost(p) - self.cost(current))
+            )
+            path.append(current)
+
+        # Remove capacity that is not needed
+        while True:
+            downs = [p for p in self.neighbours(current)
+                     if sum(p) == sum(current) - 1 and max(b - a for a, b in zip(current, p)) <= 0]
+            self.evaluate(downs)
+            ok = [p for p in downs if meets(p)]
+            if not ok:
+                break
+            current = min(ok, key=lambda p: (self.cost(p), self.stats(p).mean))
+            path.append(current)
+
+        return dict(self._result(current, path), met=True)
+
+    def _result(self, point: Point, path: List[Point]) -> Dict:
+        m, h, _ = self.stats(point).ci(0.95)
+        logger.info(
+            "Capacity search on %s: P=%d, R=%d, OP=%d (cost %.1f), %d points evaluated",
+            self.metric, *point, self.cost(point), len(self.values)
+        )
+        return {
+            "point": point,
+            "cost": self.cost(point),
+            "mean": m,
+            "half": h,
+            "path": path,
+            "evaluated": len(self.values),
+            "replications": len(self.values) * self.n_rep,
+        }
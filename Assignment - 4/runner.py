@@ -0,0 +1,471 @@
+import os
+import math
+import simpy
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+from metrics import Metrics
+from model import PatientTable, TrackedResource, input_means, make_streams, source_process
+import engine
+import series
+import tracing
+import warmup
+from cache import ResultCache
+from checkpoint import Checkpoint
+from series import SeriesRecorder
+from stats import QuantileSketch, RunningStats
+from tracing import EventTrace
+
+logger = logging.getLogger("hospital_sim")
+
+# Number of worker processes used by run_replications (None -> one per CPU core)
+_workers: Optional[int] = None
+
+
+def set_workers(n: Optional[int]):
+    """Set the default number of worker processes (None or 0 -> one per core)."""
+    global _workers
+    _workers = n if n else None
+
+
+def get_workers() -> int:
+    """Return the effective default number of worker processes."""
+    return _workers or os.cpu_count() or 1
+
+
+# Backend used for configs that do not set Config.backend
+_backend: str = "simpy"
+
+
+def set_backend(name: str):
+    """Set the default simulation backend ("simpy" or "heap")."""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}; expected one of {sorted(BACKENDS)}")
+    _backend = name
+
+
+# Persistent cache of replication results (None -> every replication is simulated)
+_cache: Optional[ResultCache] = None
+
+
+def set_cache(path: Optional[str], max_mb: float = 256.0):
+    """Use the result cache at 'path' (None disables caching)."""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+    _cache = ResultCache(path, int(max_mb * 2 ** 20)) if path else None
+
+
+def _active_cache() -> Optional[ResultCache]:
+    # Full tracing and series recording must run every replication to write their files
+    if tracing.get_level() == tracing.FULL or series.get_dir() is not None:
+        return None
+    return _cache
+
+
+# Append-only checkpoint of finished replications and cells (None -> off)
+_checkpoint: Optional[Checkpoint] = None
+
+
+def set_checkpoint(path: Optional[str]):
+    """Record finished work in the checkpoint file 'path' and resume from it (None disables)."""
+    global _checkpoint
+    if _checkpoint is not None:
+        _checkpoint.close()
+    _checkpoint = Checkpoint(path) if path else None
+
+
+def get_checkpoint() -> Optional[Checkpoint]:
+    return _checkpoint
+
+
+# -------------------------
+# Single replication
+# -------------------------
+
+def _simulate_simpy(cfg: Config, trace: EventTrace = None, series: SeriesRecorder = None,
+                    patients: PatientTable = None) -> List[Dict[str, float]]:
+    """Run one replication with the SimPy process model; one summary per batch."""
+    # Separate streams to maintain CRN across configurations
+    streams = make_streams(cfg)
+
+    env = simpy.Environment()
+
+    metrics = Metrics(rec_capacity=cfg.R, prep_capacity=cfg.P, theatre_capacity=cfg.OP,
+                      verbose=cfg.verbose, series=series, sketches=cfg.sketches)
+
+    # Resources report their state changes directly to the metrics
+    prep_res = TrackedResource(env, cfg.P, metrics.prep_changed)
+    theatre_res = TrackedResource(env, cfg.OP, metrics.theatre_changed)
+    rec_res = TrackedResource(env, cfg.R, metrics.rec_changed)
+
+    # Pass separate streams to the arrival process
+    if patients is None:
+        patients = PatientTable()
+
+    env.process(source_process(
+        env, cfg, prep_res, theatre_res, rec_res, metrics, *streams, patients, trace=trace
+    ))
+
+    def do_warmup(env: simpy.Environment, metrics: Metrics, warmup: float):
+        logger.debug("Starting warm-up period of length %.3f", warmup)
+        yield env.timeout(warmup)
+        logger.debug("Warm-up finished at time %.3f, starting observation", env.now)
+        # Theatre and bed states carry over; only the accumulated times restart
+        metrics.start_observation(env.now)
+
+        logger.debug(
+            "Post-warmup state: theatres held=%d (cap=%d), rec_count=%d (cap=%d)",
+            metrics.theatres.in_use, cfg.OP, metrics.rec_count, metrics.rec_capacity
+        )
+
+    env.process(do_warmup(env, metrics, cfg.warmup))
+
+    batches = []
+    for end in engine.batch_ends(cfg):
+        env.run(until=end)
+        batches.append(metrics.end_batch(env.now))
+    return batches
+
+
+# Simulation backends selectable through Config.backend; each returns the
+# Metrics summary of every batch of the observation period and fills in the
+# PatientTable passed to it, if any
+BACKENDS = {
+    "simpy": _simulate_simpy,
+    "heap": engine.simulate,
+}
+
+
+def combine_batches(batches: List[Dict[str, float]]) -> Dict:
+    """
+    Batch-means estimate from the per-batch summaries of one long run.
+
+    Each metric is the mean over the batches (batches where it is undefined,
+    e.g. no recovery waits, are skipped), except patients_done, which is
+    summed. The result also holds the per-batch summaries under "batches"
+    and the 95% CI (mean, half-width, (lo, hi)) of every metric under
+    "batch_ci", treating the batch values as approximately i.i.d. The
+    quantile sketches of the batches, if returned, are merged into one per
+    quantity.
+    """
+    if len(batches) == 1:
+        return dict(batches[0])
+
+    res = {"patients_done": sum(b["patients_done"] for b in batches)}
+    ci = {}
+    for key in batches[0]:
+        if key in ("patients_done", "sketches"):
+            continue
+        stats = RunningStats.from_samples(b[key] for b in batches if not math.isnan(b[key]))
+        ci[key] = stats.ci(0.95)
+        res[key] = stats.mean if stats.n > 0 else float("nan")
+
+    if "sketches" in batches[0]:
+        res["sketches"] = {
+            name: QuantileSketch.merged(b["sketches"][name] for b in batches).to_dict()
+            for name in batches[0]["sketches"]
+        }
+    res["batches"] = batches
+    res["batch_ci"] = ci
+    return res
+
+
+def run_once(cfg: Config, patients: Optional[PatientTable] = None) -> Dict[str, float]:
+    """
+    Run one replication of cfg. With cfg.batches > 1 the observation period of
+    the run is split into batches and the batch-means estimate is returned
+    (see combine_batches). A warmup of None is detected first (see warmup.py).
+    With cfg.controls the result also records the input sample means used as
+    control variates (see model.input_means). An empty PatientTable passed as 'patients' is
+    filled with the records of every patient of the replication.
+    """
+    if cfg.warmup is None:
+        cfg = warmup.resolve_warmups([cfg])[0]
+
+    backend = cfg.backend or _backend
+    level = tracing.get_level()
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {sorted(BACKENDS)}")
+
+    recording = series.get_dir() is not None
+
+    if level == tracing.OFF and not recording:
+        res = combine_batches(BACKENDS[backend](cfg, patients=patients))
+        res.update({"P": cfg.P, "R": cfg.R, "scenario": cfg.scenario})
+        if cfg.controls:
+            res.update(input_means(cfg))
+        return res
+
+    logger.debug(
+        "Running one replication: P=%d, R=%d, OP=%d, sim_time=%.3f, warmup=%.3f, seed=%d, scenario=%s, backend=%s",
+        cfg.P, cfg.R, cfg.OP, cfg.sim_time, cfg.warmup, cfg.seed, cfg.scenario, backend
+    )
+
+    # Full tracing: binary per-event trace, one file per replication
+    trace = EventTrace() if level == tracing.FULL else None
+    # Time series of the levels, one set of .npy files per replication
+    recorder = SeriesRecorder() if recording else None
+
+    res = combine_batches(BACKENDS[backend](cfg, trace, recorder, patients))
+    res.update({"P": cfg.P, "R": cfg.R, "scenario": cfg.scenario})
+    if cfg.controls:
+        res.update(input_means(cfg))
+
+    if trace is not None:
+        os.makedirs(tracing.get_trace_dir(), exist_ok=True)
+        path = tracing.trace_path(cfg)
+        trace.write(path)
+        logger.debug("Wrote %d trace events to %s", len(trace), path)
+
+    if recorder is not None:
+        os.makedirs(series.get_dir(), exist_ok=True)
+        stem = series.series_stem(cfg)
+        recorder.write(stem)
+        logger.debug("Wrote %d series records to %s.*.npy", len(recorder), stem)
+
+    logger.debug(
+        "Replication finished: P=%d, R=%d, scenario=%s, block_rate=%.6f, avg_qprep=%.6f, avg_prep_idle=%.6f, prob_rec_full=%.6f, avg_rec_wait=%.6f",
+        cfg.P, cfg.R, cfg.scenario,
+        res["theatre_block_rate"],
+        res["avg_prep_queue_length"],
+        res["avg_prep_idle_capacity"],
+        res["prob_recovery_all_busy"],
+        res["avg_rec_wait"]
+    )
+
+    return res
+
+
+def _init_worker(level: str, trace_dir: str, series_dir: Optional[str]):
+    # Worker processes start with the module defaults; copy the parent's settings
+    tracing.set_level(level, trace_dir)
+    series.set_dir(series_dir)
+
+
+def _worker_args() -> Tuple:
+    return tracing.get_level(), tracing.get_trace_dir(), series.get_dir()
+
+
+# -------------------------
+# Replication executor
+# -------------------------
+
+def run_replications(jobs: Iterable[Tuple[Config, int]],
+                     workers: Optional[int] = None) -> List[Dict[str, float]]:
+    """
+    Run a batch of (cfg, seed) jobs and return their results in job order.
+
+    Each job runs on a copy of cfg with its own seed, so the caller's Config
+    objects are never modified. Jobs are fanned out over a process pool; since
+    every replication depends only on (cfg, seed) and results come back in
+    submission order, the output is identical for any number of workers.
+    Jobs found in the result cache or the checkpoint are not simulated again,
+    and every finished replication is checkpointed as soon as it comes back.
+    """
+    # Private copy of each config with its seed (and the default backend and
+    # warm-up resolved here, so worker processes do not depend on module state)
+    cfgs = [replace(cfg, seed=seed, backend=cfg.backend or _backend) for cfg, seed in jobs]
+    cfgs = warmup.resolve_warmups(cfgs)
+
+    results = _lookup(cfgs)
+    missing = [i for i, res in enumerate(results) if res is None]
+    if len(missing) < len(cfgs):
+        logger.debug("%d of %d replications already done", len(cfgs) - len(missing), len(cfgs))
+
+    for i, res in zip(missing, _iter_results([cfgs[i] for i in missing], workers)):
+        results[i] = res
+        if _checkpoint is not None:
+            _checkpoint.add_replication(cfgs[i], res)
+
+    cache = _active_cache()
+    if cache is not None:
+        cache.put_many((cfgs[i], results[i]) for i in missing)
+    return results
+
+
+def antithetic_jobs(jobs: Iterable[Tuple[Config, int]]) -> List[Tuple[Config, int]]:
+    """
+    Every (cfg, seed) job followed by its antithetic partner (same seed,
+    Config.antithetic=True), to be run with run_replications and combined
+    with pair_averages.
+    """
+    return [(replace(cfg, antithetic=anti), seed) for cfg, seed in jobs for anti in (False, True)]
+
+
+def pair_averages(results: List[Dict]) -> List[Dict]:
+    """
+    Average the results of consecutive (replication, antithetic partner)
+    pairs. The pair averages are independent across pairs, so they go through
+    the usual CI machinery as one observation each; for metrics that are
+    monotone in the inputs the partners are negatively correlated and a pair
+    average has less than half the variance of a single replication.
+
+    Differing numeric metrics are averaged and the quantile sketches (if any)
+    merged; other entries are taken from the first replication of the pair.
+    """
+    out = []
+    for a, b in zip(results[0::2], results[1::2]):
+        avg = {}
+        for key, val in a.items():
+            if key == "sketches":
+                avg[key] = {
+                    name: QuantileSketch.merged([sketch, b[key][name]]).to_dict()
+                    for name, sketch in val.items()
+                }
+            elif val == b[key] or not isinstance(val, (int, float)):
+                avg[key] = val
+            else:
+                avg[key] = 0.5 * (val + b[key])
+        out.append(avg)
+    return out
+
+
+def _lookup(cfgs: List[Config]) -> List[Optional[Dict[str, float]]]:
+    """Results of prepared configs already in the cache or the checkpoint (else None)."""
+    cache = _active_cache()
+    results = cache.get_many(cfgs) if cache is not None else [None] * len(cfgs)
+
+    if _checkpoint is not None:
+        missing = [i for i, res in enumerate(results) if res is None]
+        for i, res in zip(missing, _checkpoint.get_many([cfgs[i] for i in missing])):
+            results[i] = res
+    return results
+
+
+def _iter_results(cfgs: List[Config], workers: Optional[int] = None) -> Iterator[Dict[str, float]]:
+    """Run prepared configs (seed, backend and warm-up set); yield results in order."""
+    n_workers = min(workers or get_workers(), len(cfgs))
+
+    if n_workers <= 1:
+        yield from (run_once(cfg) for cfg in cfgs)
+        return
+
+    logger.debug("Running %d replications on %d worker processes", len(cfgs), n_workers)
+
+    # A few chunks per worker keeps IPC overhead low while balancing load
+    chunksize = max(1, len(cfgs) // (4 * n_workers))
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=_init_worker,
+        initargs=_worker_args(),
+    ) as pool:
+        yield from pool.map(run_once, cfgs, chunksize=chunksize)
+
+
+# Jobs summarized together by one worker in accumulate_replications. Fixed,
+# so the merge order (and thus the result) does not depend on the pool size.
+ACCUMULATE_CHUNK = 16
+
+
+def _empty_summary(keys: Tuple[str, ...], sketches: Tuple[str, ...]) -> Dict:
+    summary = {key: RunningStats() for key in keys}
+    summary.update({name: QuantileSketch() for name in sketches})
+    return summary
+
+
+def _add_result(summary: Dict, res: Dict, keys: Tuple[str, ...], sketches: Tuple[str, ...]):
+    for key in keys:
+        summary[key].add(res[key])
+    for name in sketches:
+        summary[name].merge(QuantileSketch.from_dict(res["sketches"][name]))
+
+
+def _accumulate_chunk(cfgs: List[Config], keys: Tuple[str, ...], sketches: Tuple[str, ...] = (),
+                      keep: bool = False) -> Tuple[Dict, Optional[List[Dict]]]:
+    # keep=True also returns the results of the chunk (for the cache/checkpoint)
+    summary = _empty_summary(keys, sketches)
+    results = [] if keep else None
+    for cfg in cfgs:
+        res = run_once(cfg)
+        _add_result(summary, res, keys, sketches)
+        if keep:
+            results.append(res)
+    return summary, results
+
+
+def _summarize_chunk(results: List[Dict], keys: Tuple[str, ...],
+                     sketches: Tuple[str, ...] = ()) -> Dict:
+    # Same additions in the same order as _accumulate_chunk
+    summary = _empty_summary(keys, sketches)
+    for res in results:
+        _add_result(summary, res, keys, sketches)
+    return summary
+
+
+def accumulate_replications(jobs: Iterable[Tuple[Config, int]], keys: Iterable[str],
+                            workers: Optional[int] = None,
+                            sketches: Iterable[str] = ()) -> Dict:
+    """
+    Run a batch of (cfg, seed) jobs and return running statistics of the
+    result metrics in 'keys' instead of the per-replication results, plus
+    for every name in 'sketches' (e.g. "throughput_time", "rec_wait") one
+    QuantileSketch pooling the observations of all replications.
+
+    The jobs run with Config.sketches set when sketches are requested. Each
+    worker summarizes chunks of ACCUMULATE_CHUNK jobs and the parent
+    merges the chunk summaries in job order, so only O(1) values per metric
+    (and one bounded sketch per quantity) travel between processes and the
+    result is the same for any pool size.
+
+    With a result cache or checkpoint, chunks whose results are all known are
+    summarized in the parent, and the other chunks send their results back to
+    be stored.
+    """
+    keys = tuple(keys)
+    sketches = tuple(sketches)
+    cfgs = [replace(cfg, seed=seed, backend=cfg.backend or _backend, sketches=bool(sketches))
+            for cfg, seed in jobs]
+    cfgs = warmup.resolve_warmups(cfgs)
+    chunks = [cfgs[i:i + ACCUMULATE_CHUNK] for i in range(0, len(cfgs), ACCUMULATE_CHUNK)]
+
+    cache = _active_cache()
+    keep = cache is not None or _checkpoint is not None
+    parts = [None] * len(chunks)
+    if keep:
+        for j, chunk in enumerate(chunks):
+            known = _lookup(chunk)
+            if all(res is not None for res in known):
+                parts[j] = _summarize_chunk(known, keys, sketches)
+
+    todo = [j for j, part in enumerate(parts) if part is None]
+    for j, (part, results) in zip(todo, _iter_chunks([chunks[j] for j in todo], keys, sketches, keep, workers)):
+        parts[j] = part
+        if results is not None:
+            if _checkpoint is not None:
+                for cfg, res in zip(chunks[j], results):
+                    _checkpoint.add_replication(cfg, res)
+            if cache is not None:
+                cache.put_many(zip(chunks[j], results))
+
+    summary = _empty_summary(keys, sketches)
+    for part in parts:
+        for name, acc in summary.items():
+            acc.merge(part[name])
+    return summary
+
+
+def _iter_chunks(chunks: List[List[Config]], keys: Tuple[str, ...], sketches: Tuple[str, ...],
+                 keep: bool, workers: Optional[int] = None):
+    """Summarize chunks of prepared configs; yield (stats, results) in order."""
+    n_workers = min(workers or get_workers(), len(chunks))
+
+    if n_workers <= 1:
+        yield from (_accumulate_chunk(chunk, keys, sketches, keep) for chunk in chunks)
+        return
+
+    logger.debug("Accumulating %d chunks on %d worker processes", len(chunks), n_workers)
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=_init_worker,
+        initargs=_worker_args(),
+    ) as pool:
+        yield from pool.map(
+            _accumulate_chunk, chunks, [keys] * len(chunks), [sketches] * len(chunks),
+            [keep] * len(chunks)
+        )
@@ -0,0 +1,121 @@
+import logging
+from typing import Dict
+
+import numpy as np
+
+from config import Config
+from runner import run_replications
+
+logger = logging.getLogger("hospital_sim")
+
+
+def kn_select(cfgs: Dict[str, Config], metric: str, delta: float, base_seed: int,
+              alpha: float = 0.05, n0: int = 10, batch: int = 10,
+              max_rep: int = 2000, minimize: bool = True) -> Dict:
+    """
+    Kim-Nelson (KN) fully sequential indifference-zone selection of the best
+    config, i.e. the one with the smallest (or largest) mean of 'metric'.
+
+    All configs use the same seeds in every replication (CRN), which KN allows
+    because it works with the variances of pairwise differences. After n0
+    first-stage replications, config i is eliminated at stage r as soon as
+    some surviving config l is better by more than
+        W_il(r) = max(0, delta / (2r) * (h^2 * S_il^2 / delta^2 - r))
+    where S_il^2 is the first-stage variance of X_i - X_l. If the best mean is
+    at least delta better than all others, it is selected with probability
+    >= 1 - alpha.
+
+    Replications are run 'batch' at a time for the survivors (in parallel);
+    the elimination rule is still checked after every single replication.
+    If max_rep replications per config are reached with several survivors,
+    the best sample mean is returned without the guarantee.
+
+    Returns best config name, replications per config, the stage at which
+    each config was eliminated, duplicates (config -> identical earlier
+    config), sample means and total replications.
+    """
+    names = list(cfgs)
+    k = len(names)
+    if k < 2:
+        raise ValueError("Selection needs at least two configs")
+    sign = -1.0 if minimize else 1.0  # KN below selects the largest mean
+
+    eta = 0.5 * ((2 * alpha / (k - 1)) ** (-2.0 / (n0 - 1)) - 1)
+    h2 = 2 * eta * (n0 - 1)
+
+    # Observations per config (sign-adjusted), one per replication/seed
+    obs = {name: [] for name in names}
+
+    def run(survivors, r_from, r_to):
+        jobs = [(cfgs[name], base_seed + r) for r in range(r_from, r_to) for name in survivors]
+        all_res = run_replications(jobs)
+        for j, res in enumerate(all_res):
+            obs[survivors[j % len(survivors)]].append(sign * res[metric])
+
+    run(names, 0, n0)
+
+    first = {name: np.array(obs[name]) for name in names}
+    s2 = {
+        (i, l): float(np.var(first[i] - first[l], ddof=1))
+        for i in names for l in names if i != l
+    }
+
+    # Configs with identical first-stage results (e.g. R or OP does not affect
+    # the prep queue) cannot be told apart; only the first of them is kept
+    duplicates = {}
+    for j, i in enumerate(names):
+        for l in names[:j]:
+            if l not in duplicates and np.array_equal(first[i], first[l]):
+                duplicates[i] = l
+                break
+
+    survivors = [name for name in names if name not in duplicates]
+    eliminated = {name: n0 for name in duplicates}
+    r = n0
+    sums = {name: sum(obs[name]) for name in names}
+
+    while True:
+        # Screening after replication r
+        out = set()
+        for i in survivors:
+            for l in survivors:
+                if i == l:
+                    continue
+                w = max(0.0, delta / (2 * r) * (h2 * s2[(i, l)] / delta ** 2 - r))
+                if sums[i] / r < sums[l] / r - w:
+                    out.add(i)
+                    break
+        for i in out:
+            eliminated[i] = r
+        survivors = [name for name in survivors if name not in out]
+
+        if len(survivors) == 1 or r >= max_rep:
+            break
+
+        # Next replication: taken from the observations already run, or run a new batch
+        if len(obs[survivors[0]]) <= r:
+            run(survivors, r, min(r + batch, max_rep))
+        for name in survivors:
+            sums[name] += obs[name][r]
+        r += 1
+
+    means = {name: sign * sums[name] / (eliminated.get(name, r)) for name in names}
+    best = max(survivors, key=lambda name: sums[name])
+    n_rep = {name: len(obs[name]) for name in names}
+
+    logger.info(
+        "KN selection on %s: best=%s after %d stages, %d replications in total",
+        metric, best, r, sum(n_rep.values())
+    )
+
+    return {
+        "best": best,
+        "guaranteed": len(survivors) == 1,
+        "stages": r,
+        "eliminated": eliminated,
+        "duplicates": duplicates,
+        "n_rep": n_rep,
+        "means": means,
+        "total_rep": sum(n_rep.values()),
+        "h2": h2,
+    }
@@ -0,0 +1,171 @@
+import os
+import argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import Config
+import tracing
+
+# -------------------------
+# Time-series recording
+# -------------------------
+# Off by default. When a directory is set, every replication records the
+# piecewise-constant trajectories below (warm-up included) and writes one
+# .npy file per series; the files are read back memory-mapped, so a slice
+# of a long trajectory only touches the pages it needs.
+
+SERIES = ("prep_queue", "theatres_busy", "theatres_blocked", "rec_occupancy")
+
+# One record per level change: the level holds from 'time' to the next record
+DTYPE = np.dtype([("time", "<f8"), ("level", "<i4")])
+
+INITIAL_CAPACITY = 4096
+
+_series_dir: Optional[str] = None
+
+
+def set_dir(path: Optional[str]):
+    """Record the time series of every replication into 'path' (None disables)."""
+    global _series_dir
+    _series_dir = path
+
+
+def get_dir() -> Optional[str]:
+    return _series_dir
+
+
+class SeriesBuffer:
+    """
+    Preallocated (time, level) columns of one piecewise-constant series.
+    The capacity doubles when full; a record is only added when the level
+    changes, so repeated notifications of the same level cost nothing.
+    Several changes at the same instant (e.g. a bed released and handed to
+    the next patient) leave only the final level, so both backends record
+    the same trajectory.
+    """
+    __slots__ = ("time", "level", "n", "last")
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.time = np.empty(capacity, dtype="<f8")
+        self.level = np.empty(capacity, dtype="<i4")
+        self.n = 0
+        self.last = None
+
+    def record(self, now: float, level: int):
+        if level == self.last:
+            return
+        n = self.n
+        if n and self.time[n - 1] == now:
+            # The previous level lasted zero time: replace it
+            n -= 1
+            if n and self.level[n - 1] == level:
+                self.n = n
+                self.last = level
+                return
+        if n == len(self.time):
+            self.time = np.resize(self.time, 2 * n)
+            self.level = np.resize(self.level, 2 * n)
+        self.time[n] = now
+        self.level[n] = level
+        self.n = n + 1
+        self.last = level
+
+    def __len__(self):
+        return self.n
+
+    def write(self, path: str):
+        """Write the records to a memory-mapped .npy file of DTYPE."""
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=DTYPE, shape=(self.n,))
+        out["time"] = self.time[:self.n]
+        out["level"] = self.level[:self.n]
+        out.flush()
+        del out
+
+
+class SeriesRecorder:
+    """The SERIES of one replication, fed by Metrics on every state change."""
+    __slots__ = SERIES
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        for name in SERIES:
+            setattr(self, name, SeriesBuffer(capacity))
+
+    def __len__(self):
+        return sum(len(getattr(self, name)) for name in SERIES)
+
+    def write(self, stem: str) -> List[str]:
+        """Write every series to '<stem>.<series>.npy'; returns the paths."""
+        paths = []
+        for name in SERIES:
+            path = f"{stem}.{name}.npy"
+            getattr(self, name).write(path)
+            paths.append(path)
+        return paths
+
+
+def series_stem(cfg: Config) -> str:
+    """Path prefix of the series files of one replication of cfg."""
+    return os.path.join(_series_dir or ".", tracing.run_name(cfg))
+
+
+# -------------------------
+# Reading
+# -------------------------
+
+def load_series(stem: str) -> Dict[str, np.ndarray]:
+    """Memory-map the series files written for 'stem' (read-only)."""
+    return {name: np.load(f"{stem}.{name}.npy", mmap_mode="r") for name in SERIES}
+
+
+def window(series: np.ndarray, t0: float, t1: float) -> np.ndarray:
+    """
+    Records of 'series' covering [t0, t1): the record in force at t0 plus the
+    changes before t1. Found by binary search, so only a few pages are read.
+    """
+    times = series["time"]
+    lo = max(int(np.searchsorted(times, t0, side="right")) - 1, 0)
+    hi = int(np.searchsorted(times, t1, side="left"))
+    return series[lo:hi]
+
+
+def level_at(series: np.ndarray, t: float) -> int:
+    """Level of 'series' at time t (0 before the first record)."""
+    i = int(np.searchsorted(series["time"], t, side="right")) - 1
+    return int(series["level"][i]) if i >= 0 else 0
+
+
+def time_average(series: np.ndarray, t0: float, t1: float) -> float:
+    """Exact time-average of the level over [t0, t1]."""
+    if t1 <= t0:
+        return float("nan")
+    rec = window(series, t0, t1)
+    if len(rec) == 0:
+        return 0.0
+    starts = np.maximum(rec["time"], t0)
+    ends = np.append(starts[1:], t1)
+    return float(np.dot(rec["level"], ends - starts) / (t1 - t0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize recorded time series of one replication")
+    parser.add_argument("stem", help="path prefix of the .npy files (without .<series>.npy)")
+    parser.add_argument("--start", type=float, default=0.0, help="window start time")
+    parser.add_argument("--end", type=float, default=None, help="window end time (default: last change)")
+    args = parser.parse_args()
+
+    data = load_series(args.stem)
+    end = args.end
+    if end is None:
+        end = max(float(s["time"][-1]) for s in data.values() if len(s))
+
+    for name, s in data.items():
+        rec = window(s, args.start, end)
+        print(
+            f"{name:18s} {len(s):9d} changes, {len(rec):9d} in window, "
+            f"mean={time_average(s, args.start, end):8.4f}, max={int(rec['level'].max()) if len(rec) else 0:4d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
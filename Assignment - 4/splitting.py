@@ -0,0 +1,242 @@
+import math
+import heapq
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import warmup
+from config import Config
+from engine import HeapSimulation, OP_END, PREP_END, REC_END
+from model import BASE, MILD, SEVERE
+from runner import get_workers
+from stats import RunningStats
+
+logger = logging.getLogger("hospital_sim")
+
+
+def occupancy(sim: HeapSimulation) -> int:
+    """
+    Importance function: beds in use plus patients holding a theatre while
+    waiting for a bed. A theatre is blocked exactly when it exceeds R.
+    """
+    return sim.rec_busy + len(sim.rec_queue)
+
+
+# -------------------------
+# Resampling the future of a forked trajectory
+# -------------------------
+# A fork copies the pre-drawn service times of the patients in the system, so
+# without resampling all retrials would release beds at the same moments.
+# Activities in progress get a new residual time from the distribution
+# conditional on the time already spent; activities not started yet get a new
+# duration.
+
+def _duration(rng: np.random.Generator, dist: str, mean: float, low: float, high: float,
+              age: float = 0.0) -> float:
+    """Total duration given that 'age' has already elapsed (exponential: memoryless)."""
+    u = rng.random()
+    if dist == "exp":
+        return age - mean * math.log1p(-u)
+    start = max(low, age)
+    return start + (high - start) * u
+
+
+def _op(rng: np.random.Generator, cfg: Config, ptype: int = None, age: float = 0.0):
+    """(operation time, patient type); the type is drawn when not given."""
+    if cfg.scenario == "original":
+        return age - cfg.op_mean * math.log1p(-rng.random()), BASE
+    if ptype is None:
+        ptype = SEVERE if rng.random() < cfg.severe_prob else MILD
+    mean = cfg.severe_op_mean if ptype == SEVERE else cfg.mild_op_mean
+    return age - mean * math.log1p(-rng.random()), ptype
+
+
+def _resample(sim: HeapSimulation, rng: np.random.Generator):
+    """Redraw the not yet elapsed service times of every patient in the system."""
+    cfg = sim.cfg
+    patients = sim.patients
+
+    def prep(age=0.0):
+        return _duration(rng, cfg.prep_dist, cfg.prep_mean, cfg.prep_low, cfg.prep_high, age)
+
+    def rec(age=0.0):
+        return _duration(rng, cfg.rec_dist, cfg.rec_mean, cfg.rec_low, cfg.rec_high, age)
+
+    def fresh_op(s):
+        patients.op_time[s], patients.ptype[s] = _op(rng, cfg)
+        patients.rec_time[s] = rec()
+
+    events = []
+    for t, seq, kind, s in sim.events:
+        if kind == PREP_END:
+            age = sim.now - (t - patients.prep_time[s])
+            patients.prep_time[s] = prep(age)
+            fresh_op(s)
+            t = sim.now + patients.prep_time[s] - age
+        elif kind == OP_END:
+            age = sim.now - (t - patients.op_time[s])
+            patients.op_time[s], _ = _op(rng, cfg, patients.ptype[s], age)
+            patients.rec_time[s] = rec()
+            t = sim.now + patients.op_time[s] - age
+        elif kind == REC_END:
+            age = sim.now - (t - patients.rec_time[s])
+            patients.rec_time[s] = rec(age)
+            t = sim.now + patients.rec_time[s] - age
+        events.append((t, seq, kind, s))
+    heapq.heapify(events)
+    sim.events = events
+
+    for s in sim.prep_queue:
+        patients.prep_time[s] = prep()
+        fresh_op(s)
+    for s in sim.theatre_queue:
+        fresh_op(s)
+    for s, _ in sim.rec_queue:
+        patients.rec_time[s] = rec()
+
+
+def default_thresholds(R: int, levels: int = 5) -> List[int]:
+    """Up to 'levels' consecutive occupancy thresholds, the last one R + 1 (blocking)."""
+    return list(range(max(1, R + 2 - levels), R + 2))
+
+
+def restart_replication(cfg: Config, thresholds: Sequence[int], splits: Sequence[int]) -> Dict:
+    """
+    One RESTART replication estimating the fraction of observed time during
+    which a theatre is blocked, P(block OR) for a single theatre.
+
+    After the warm-up the main trajectory runs over the observation period.
+    Whenever a trajectory crosses threshold T_j upwards it is joined by
+    splits[j] - 1 retrials, copies of the current state with fresh random
+    numbers (HeapSimulation.fork) and redrawn remaining service times. A
+    retrial of level j stops as soon as the occupancy falls below T_j again
+    (or at the end of the period); the main trajectory always runs to the
+    end. A trajectory that starts above thresholds of its level (the main
+    one, after the warm-up) splits there at once. Time spent blocked (occupancy >= the last threshold, which must be
+    R + 1) is weighted by 1 / prod(splits), the expected number of
+    trajectories in that region per main trajectory. The config must have a
+    single theatre (OP = 1); a warmup of None is detected first.
+
+    Returns the estimate, the events simulated, the number of trajectories and
+    the simulated time summed over all trajectories (the computing effort).
+    """
+    if cfg.OP != 1:
+        raise ValueError(f"RESTART estimates P(block OR) for a single theatre, got OP = {cfg.OP}")
+    if len(thresholds) != len(splits):
+        raise ValueError("Need one splitting factor per threshold")
+    if thresholds[-1] != cfg.R + 1:
+        raise ValueError(f"The last threshold must be R + 1 = {cfg.R + 1} (blocking)")
+    if cfg.warmup is None:
+        cfg = warmup.resolve_warmups([cfg])[0]
+    weight = 1.0 / float(np.prod(splits))
+    end = cfg.warmup + cfg.sim_time
+
+    main = HeapSimulation(replace(cfg, batches=1))
+    main.run(cfg.warmup)
+
+    # Seeds of the retrials, drawn in a fixed (depth-first) order
+    seeder = np.random.default_rng([cfg.seed, 1])
+
+    blocked_time = 0.0
+    simulated = cfg.warmup
+    events = 0
+    trajectories = 1
+    stack = [(main, 0)]
+
+    def split(sim: HeapSimulation, j: int):
+        """Add the splits[j] - 1 retrials of level j + 1 started by crossing T_j."""
+        nonlocal trajectories
+        for _ in range(splits[j] - 1):
+            seed = int(seeder.integers(2 ** 63))
+            clone = sim.fork(seed)
+            _resample(clone, np.random.default_rng([seed, 2]))
+            stack.append((clone, j + 1))
+            trajectories += 1
+
+    while stack:
+        sim, level = stack.pop()
+        kill = thresholds[level - 1] if level > 0 else None
+        phi = occupancy(sim)
+        start = sim.now
+
+        # A trajectory can start above thresholds of its own level or higher
+        # (the main one at the end of the warm-up): it splits there at once, as
+        # if it had just crossed them, or the blocked time would be underweighted
+        for j in range(level, len(thresholds)):
+            if thresholds[j] <= phi:
+                split(sim, j)
+
+        queue = sim.events
+        handlers = sim.handlers
+        while True:
+            t = queue[0][0] if queue and queue[0][0] < end else end
+            if phi >= thresholds[-1]:
+                blocked_time += (t - sim.now) * weight
+            if t >= end:
+                sim.now = end
+                break
+
+            _, _, kind, patient = heapq.heappop(queue)
+            sim.now = t
+            handlers[kind](patient)
+            events += 1
+
+            new_phi = occupancy(sim)
+            if kill is not None and new_phi < kill:
+                break
+            for j in range(len(thresholds)):
+                if phi < thresholds[j] <= new_phi:
+                    split(sim, j)
+            phi = new_phi
+        simulated += sim.now - start
+
+    return {
+        "estimate": blocked_time / cfg.sim_time,
+        "events": events,
+        "trajectories": trajectories,
+        "simulated_time": simulated,
+    }
+
+
+def _restart_job(args):
+    return restart_replication(*args)
+
+
+def restart_estimate(cfg: Config, n_rep: int, base_seed: int,
+                     thresholds: Optional[Sequence[int]] = None,
+                     splits: Optional[Sequence[int]] = None,
+                     workers: Optional[int] = None) -> Dict:
+    """
+    Run n_rep independent RESTART replications (seeds base_seed + r) over a
+    process pool and return the running statistics of the estimates together
+    with the totals of events, trajectories and simulated time. By default
+    the thresholds are R - 3, ..., R + 1, each splitting into 3 trajectories.
+    """
+    thresholds = list(thresholds or default_thresholds(cfg.R))
+    splits = list(splits or [3] * len(thresholds))
+    cfgs = warmup.resolve_warmups([replace(cfg, seed=base_seed + r) for r in range(n_rep)])
+    jobs = [(c, thresholds, splits) for c in cfgs]
+
+    n_workers = min(workers or get_workers(), n_rep)
+    if n_workers <= 1:
+        results = [_restart_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_restart_job, jobs))
+
+    stats = RunningStats.from_samples(res["estimate"] for res in results)
+    logger.info(
+        "RESTART for P=%d, R=%d: P(block OR)=%.3e over %d replications, %d trajectories",
+        cfg.P, cfg.R, stats.mean, n_rep, sum(res["trajectories"] for res in results)
+    )
+    return {
+        "stats": stats,
+        "events": sum(res["events"] for res in results),
+        "trajectories": sum(res["trajectories"] for res in results),
+        "simulated_time": sum(res["simulated_time"] for res in results),
+        "thresholds": thresholds,
+        "splits": splits,
+    }
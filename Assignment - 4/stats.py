@@ -0,0 +1,405 @@
+import math
+from functools import lru_cache
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+
+
+# -------------------------
+# Student-t quantiles
+# -------------------------
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Continued fraction for the incomplete beta function (modified Lentz)."""
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c = 1.0
+    d = 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 1000):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-15:
+            break
+    return h
+
+
+def betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function I_x(a, b)."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    ln_front = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return math.exp(ln_front) * _betacf(a, b, x) / a
+    return 1.0 - math.exp(ln_front) * _betacf(b, a, 1.0 - x) / b
+
+
+def t_cdf(t: float, df: float) -> float:
+    """CDF of the Student-t distribution with df degrees of freedom."""
+    tail = 0.5 * betainc(0.5 * df, 0.5, df / (df + t * t))
+    return 1.0 - tail if t > 0 else tail
+
+
+@lru_cache(maxsize=None)
+def t_quantile(p: float, df: float) -> float:
+    """Quantile of the Student-t distribution (inverse of t_cdf, by bisection)."""
+    if not 0.0 < p < 1.0:
+        raise ValueError(f"p must be in (0, 1), got {p}")
+    if p < 0.5:
+        return -t_quantile(1.0 - p, df)
+    if p == 0.5:
+        return 0.0
+
+    lo, hi = 0.0, 1.0
+    while t_cdf(hi, df) < p:
+        lo, hi = hi, 2.0 * hi
+    for _ in range(200):
+        mid = 0.5 * (lo + hi)
+        if t_cdf(mid, df) < p:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo <= 1e-13 * hi:
+            break
+    return 0.5 * (lo + hi)
+
+
+# -------------------------
+# Online accumulators
+# -------------------------
+
+class RunningStats:
+    """
+    Streaming mean, variance, min and max (Welford's algorithm).
+
+    Uses O(1) memory however many values are added. Two accumulators built on
+    disjoint samples (e.g. in different worker processes) can be combined with
+    merge(), which gives the same result as adding all values to one of them.
+    """
+    __slots__ = ("n", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0    # sum of squared deviations from the mean
+        self.min = math.inf
+        self.max = -math.inf
+
+    @classmethod
+    def from_samples(cls, samples: Iterable[float]) -> "RunningStats":
+        stats = cls()
+        for x in samples:
+            stats.add(x)
+        return stats
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """Add the values summarized by 'other' to this accumulator (Chan et al.)."""
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean, self.m2 = other.n, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (n - 1 denominator); nan for fewer than 2 values."""
+        return self.m2 / (self.n - 1) if self.n > 1 else float("nan")
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def ci(self, level: float = 0.95) -> Tuple[float, float, Tuple[float, float]]:
+        """
+        Mean and confidence interval with the Student-t quantile for df = n-1.
+        Returns (mean, half-width, (lo, hi)), like analysis.mean_ci_95.
+        """
+        nan = float("nan")
+        if self.n == 0:
+            return nan, nan, (nan, nan)
+        if self.n == 1:
+            return self.mean, nan, (self.mean, self.mean)
+
+        t_crit = t_quantile(0.5 + level / 2, self.n - 1)
+        half = t_crit * self.std / math.sqrt(self.n)
+        return self.mean, half, (self.mean - half, self.mean + half)
+
+
+class PairedStats:
+    """
+    Streaming paired comparison of two systems run on the same random numbers:
+    running statistics of x, of y and of the differences x - y.
+    """
+    __slots__ = ("x", "y", "diff")
+
+    def __init__(self):
+        self.x = RunningStats()
+        self.y = RunningStats()
+        self.diff = RunningStats()
+
+    def add(self, x: float, y: float):
+        self.x.add(x)
+        self.y.add(y)
+        self.diff.add(x - y)
+
+    def merge(self, other: "PairedStats") -> "PairedStats":
+        self.x.merge(other.x)
+        self.y.merge(other.y)
+        self.diff.merge(other.diff)
+        return self
+
+    def __len__(self):
+        return self.diff.n
+
+    def ci(self, level: float = 0.95) -> Tuple[float, float, Tuple[float, float]]:
+        """Confidence interval for the mean difference E[x - y]."""
+        return self.diff.ci(level)
+
+
+# -------------------------
+# Streaming quantiles
+# -------------------------
+
+class QuantileSketch:
+    """
+    Streaming quantile estimate in bounded memory (merging t-digest,
+    Dunning & Ertl).
+
+    Values are collected in a small buffer and periodically merged into a
+    sorted list of centroids (mean, weight). The k1 scale function
+        k(q) = compression / (2 pi) * asin(2q - 1)
+    limits every centroid to one unit of k, so centroids are small in the
+    tails (where the quantiles of interest are) and there are never more
+    than about 'compression' of them, however many values are added. The
+    number of values equal to the minimum is counted exactly, so a point mass
+    there (e.g. the zero recovery wait of patients who were not blocked)
+    gives exact quantiles inside it. Two sketches of disjoint samples (e.g.
+    replications, batches or worker chunks) are combined with merge().
+    Sketches travel in results as plain dicts (to_dict / from_dict).
+    """
+    __slots__ = ("compression", "means", "weights", "buffer", "n", "min", "n_min", "max")
+
+    def __init__(self, compression: float = 100.0):
+        self.compression = compression
+        self.means = []      # centroid means, sorted
+        self.weights = []
+        self.buffer = []     # values not merged into the centroids yet
+        self.n = 0
+        self.min = math.inf
+        self.n_min = 0       # values equal to min
+        self.max = -math.inf
+
+    def add(self, x: float):
+        self.buffer.append(x)
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Add the values summarized by 'other' to this sketch."""
+        other._compress()
+        self._compress(other.means, other.weights)
+        self.n += other.n
+        self._update_min(other.min, other.n_min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _update_min(self, low: float, count: int):
+        if low < self.min:
+            self.min, self.n_min = low, count
+        elif low == self.min:
+            self.n_min += count
+
+    def _compress(self, means: Sequence[float] = (), weights: Sequence[float] = ()):
+        # Merge the buffer and the given centroids into the current centroids
+        if not self.buffer and not means:
+            return
+        if self.buffer:
+            self.n += len(self.buffer)
+            low = min(self.buffer)
+            self._update_min(low, self.buffer.count(low))
+            self.max = max(self.max, max(self.buffer))
+        items = sorted(
+            list(zip(self.means, self.weights)) + list(zip(means, weights))
+            + [(x, 1.0) for x in self.buffer]
+        )
+        self.buffer = []
+
+        total = sum(w for _, w in items)
+        if total * math.pi < 2.0 * self.compression:
+            # dk/dq >= compression / pi, so no two values fit in one unit of k
+            self.means = [m for m, _ in items]
+            self.weights = [w for _, w in items]
+            return
+        scale = self.compression / (2.0 * math.pi)
+
+        def q_limit(q0: float) -> float:
+            # Largest q whose k is at most one unit above k(q0)
+            k = scale * math.asin(2.0 * q0 - 1.0) + 1.0
+            return 1.0 if k >= scale * math.pi / 2 else 0.5 * (math.sin(k / scale) + 1.0)
+
+        out_means, out_weights = [], []
+        cur_m, cur_w = items[0]
+        done = 0.0
+        limit = q_limit(0.0)
+        for m, w in items[1:]:
+            if (done + cur_w + w) / total <= limit:
+                cur_w += w
+                cur_m += (m - cur_m) * w / cur_w
+            else:
+                out_means.append(cur_m)
+                out_weights.append(cur_w)
+                done += cur_w
+                limit = q_limit(done / total)
+                cur_m, cur_w = m, w
+        out_means.append(cur_m)
+        out_weights.append(cur_w)
+        self.means, self.weights = out_means, out_weights
+
+    def __len__(self):
+        return self.n + len(self.buffer)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimated q-quantile: linear interpolation of the cumulative weight
+        between the centroid centres, starting from the point mass at the
+        minimum and ending at the exact maximum; nan for an empty sketch.
+        While every centroid is a single value this is the sample quantile
+        with plotting positions (i - 0.5) / n.
+        """
+        self._compress()
+        if self.n == 0:
+            return float("nan")
+
+        target = q * self.n
+        if target <= self.n_min:
+            return self.min
+
+        # Walk the knots (cumulative weight, value) of the piecewise-linear
+        # inverse CDF: (n_min, min), the centroid centres beyond it, (n, max)
+        c0, v0 = self.n_min, self.min
+        cum = 0.0
+        for m, w in zip(self.means, self.weights):
+            centre = cum + 0.5 * w
+            cum += w
+            if centre <= c0:
+                continue
+            m = max(m, v0)
+            if target <= centre:
+                return v0 + (m - v0) * (target - c0) / (centre - c0)
+            c0, v0 = centre, m
+        return v0 + (self.max - v0) * (target - c0) / (self.n - c0) if self.n > c0 else self.max
+
+    def copy(self) -> "QuantileSketch":
+        other = QuantileSketch(self.compression)
+        other.means, other.weights = list(self.means), list(self.weights)
+        other.buffer = list(self.buffer)
+        other.n, other.min, other.n_min, other.max = self.n, self.min, self.n_min, self.max
+        return other
+
+    def to_dict(self) -> Dict:
+        """Compact, picklable and JSON-serializable form (see from_dict)."""
+        self._compress()
+        return {
+            "compression": self.compression, "means": list(self.means),
+            "weights": list(self.weights), "min": self.min, "n_min": self.n_min, "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "QuantileSketch":
+        sketch = cls(data["compression"])
+        sketch.means, sketch.weights = list(data["means"]), list(data["weights"])
+        sketch.n = int(round(sum(sketch.weights)))
+        sketch.min, sketch.n_min, sketch.max = data["min"], data["n_min"], data["max"]
+        return sketch
+
+    @classmethod
+    def merged(cls, dicts: Iterable[Dict], compression: float = 100.0) -> "QuantileSketch":
+        """One sketch of all values summarized by the given to_dict forms."""
+        sketch = cls(compression)
+        for data in dicts:
+            sketch.merge(cls.from_dict(data))
+        return sketch
+
+
+# -------------------------
+# Control variates
+# -------------------------
+
+def control_variates(y: Sequence[float], controls: Sequence[Sequence[float]],
+                     means: Sequence[float], level: float = 0.95) -> Dict:
+    """
+    Multiple control-variate estimate of E[y] from n replications.
+
+    controls holds one row of q control observations per replication, whose
+    expectations 'means' are known. Regressing y on the centered controls,
+        y_i = b0 + beta . (x_i - mu) + e_i,
+    the intercept b0 = mean(y) - beta . (mean(x) - mu) is the estimator. Its
+    variance is the (0, 0) entry of s^2 (A'A)^-1 with residual variance s^2 on
+    n - q - 1 degrees of freedom, which gives the Student-t CI.
+
+    Returns mean, half-width, CI, beta, df and the variance reduction factor
+    Var(mean(y)) / Var(b0) as estimated from the same replications.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(controls, dtype=float) - np.asarray(means, dtype=float)
+    n, q = x.shape
+    df = n - q - 1
+    if df < 1:
+        raise ValueError(f"{n} replications are too few for {q} control variates")
+
+    a = np.column_stack([np.ones(n), x])
+    coef, *_ = np.linalg.lstsq(a, y, rcond=None)
+    resid = y - a @ coef
+    s2 = float(resid @ resid) / df
+    var = s2 * float(np.linalg.pinv(a.T @ a)[0, 0])
+
+    mean = float(coef[0])
+    half = t_quantile(0.5 + level / 2, df) * math.sqrt(var)
+    plain_var = float(np.var(y, ddof=1)) / n
+    return {
+        "mean": mean,
+        "half": half,
+        "ci": (mean - half, mean + half),
+        "beta": coef[1:].tolist(),
+        "df": df,
+        "vrf": plain_var / var if var > 0 else float("nan"),
+    }
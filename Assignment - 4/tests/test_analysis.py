@@ -0,0 +1,42 @@
+import pytest
+
+import runner
+from analysis import relative_half_width, run_until_precision
+from config import Config
+from stats import RunningStats
+
+CFG = Config(P=3, R=4)
+
+
+@pytest.fixture(autouse=True)
+def serial_runs(monkeypatch):
+    monkeypatch.setattr(runner, "_workers", 1)
+    monkeypatch.setattr(runner, "_cache", None)
+
+
+def test_run_until_precision_reaches_target():
+    targets = {"avg_prep_idle_capacity": 0.03, "theatre_utilization": 0.05}
+    samples, n = run_until_precision(CFG, targets, 500, max_rep=1000)
+    assert 10 < n < 1000
+    for key, target in targets.items():
+        assert samples[key].n == n
+        assert relative_half_width(samples[key]) <= target
+
+    # Replication r uses seed base_seed + r
+    results = runner.run_replications([(CFG, 500 + r) for r in range(n)])
+    expected = RunningStats.from_samples(res["theatre_utilization"] for res in results)
+    assert samples["theatre_utilization"].mean == pytest.approx(expected.mean)
+    assert samples["theatre_utilization"].variance == pytest.approx(expected.variance)
+
+
+def test_run_until_precision_stops_at_max_rep():
+    samples, n = run_until_precision(CFG, {"theatre_block_rate": 0.001}, 500, max_rep=35)
+    assert n == 35
+    assert samples["theatre_block_rate"].n == 35
+    assert relative_half_width(samples["theatre_block_rate"]) > 0.001
+
+
+def test_run_until_precision_runs_min_rep_first():
+    # A loose target is met by the first min_rep replications
+    samples, n = run_until_precision(CFG, {"avg_prep_idle_capacity": 10.0}, 500, min_rep=12)
+    assert n == 12
@@ -0,0 +1,47 @@
+import math
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+import runner
+from config import Config
+from model import PatientTable
+
+CONFIGS = [
+    Config(P=3, R=4),
+    Config(P=2, R=2),
+    Config(P=4, R=4, OP=2),
+    Config(P=3, R=5, scenario="twisted"),
+    Config(P=3, R=3, batches=4),
+    Config(P=3, R=4, antithetic=True),
+    Config(P=3, R=4, sketches=True),
+]
+
+
+def _same(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+@pytest.mark.parametrize("cfg", CONFIGS, ids=repr)
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_backends_give_identical_results(cfg, seed):
+    tables = {}
+    results = {}
+    for backend in ("simpy", "heap"):
+        tables[backend] = PatientTable()
+        results[backend] = runner.run_once(replace(cfg, seed=seed, backend=backend), tables[backend])
+
+    assert _same(results["simpy"], results["heap"])
+    assert results["simpy"]["patients_done"] > 0
+
+    simpy_cols = tables["simpy"].to_numpy()
+    heap_cols = tables["heap"].to_numpy()
+    for name, col in simpy_cols.items():
+        np.testing.assert_array_equal(col, heap_cols[name], err_msg=name)
@@ -0,0 +1,57 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+import runner
+from analysis import mean_ci_95
+from batched import run_batch
+from config import Config
+
+N_REP = 8
+
+CONFIGS = [
+    Config(P=3, R=4),
+    Config(P=2, R=2),
+    Config(P=4, R=4, OP=2),
+    Config(P=3, R=5, scenario="twisted"),
+    Config(P=3, R=3, batches=4),
+    Config(P=3, R=4, antithetic=True),
+    Config(P=3, R=4, controls=True),
+]
+
+
+def _run_once_arrays(cfg: Config, n_rep: int):
+    results = [runner.run_once(replace(cfg, seed=cfg.seed + r)) for r in range(n_rep)]
+    return {key: np.array([res[key] for res in results], dtype=float)
+            for key in results[0] if key not in ("P", "R", "scenario", "batches", "batch_ci")}
+
+
+@pytest.mark.parametrize("cfg", CONFIGS, ids=repr)
+def test_batch_matches_run_once_per_replication(cfg):
+    batch = run_batch(cfg, N_REP)
+    ref = _run_once_arrays(cfg, N_REP)
+    assert batch.keys() == ref.keys()
+    for key in ref:
+        assert batch[key].shape == (N_REP,)
+        np.testing.assert_allclose(batch[key], ref[key], rtol=1e-9, atol=1e-12, equal_nan=True,
+                                   err_msg=key)
+
+
+def test_batch_resolves_detected_warmup():
+    cfg = Config(P=3, R=4, warmup=None)
+    batch = run_batch(cfg, N_REP)
+    ref = _run_once_arrays(cfg, N_REP)
+    np.testing.assert_allclose(batch["avg_throughput_time"], ref["avg_throughput_time"], rtol=1e-9)
+
+
+def test_batch_arrays_feed_mean_ci_95():
+    cfg = Config(P=3, R=4, seed=100)
+    batch = run_batch(cfg, 40)
+    # Independent replications of run_once (other seeds) cover the batched mean
+    ref = _run_once_arrays(replace(cfg, seed=1000), 40)
+    for key in ("avg_throughput_time", "theatre_block_rate", "avg_recovery_occupancy"):
+        mean, half, _ = mean_ci_95(list(batch[key]))
+        ref_mean, ref_half, _ = mean_ci_95(list(ref[key]))
+        assert half > 0
+        assert abs(mean - ref_mean) <= 2 * np.hypot(half, ref_half), key
@@ -0,0 +1,83 @@
+import itertools
+import os
+import subprocess
+import sys
+from dataclasses import replace
+
+import cache
+from cache import ResultCache, result_key
+from config import Config
+
+CFG = Config(P=3, R=4, seed=7)
+
+
+def _stored(store: ResultCache, cfgs):
+    """Which configs have an entry (without touching their last use)."""
+    keys = {key for key, in store.conn.execute("SELECT key FROM results")}
+    return [result_key(cfg) in keys for cfg in cfgs]
+
+
+def test_key_is_stable_across_processes():
+    code = "from cache import result_key; from config import Config; print(result_key(Config(P=3, R=4, seed=7)))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.strip() == result_key(CFG)
+    assert result_key(Config(P=3, R=4, seed=7)) == result_key(CFG)
+
+
+def test_key_depends_on_fields_and_version(monkeypatch):
+    key = result_key(CFG)
+    assert result_key(replace(CFG, seed=8)) != key
+    assert result_key(replace(CFG, R=5)) != key
+    assert result_key(replace(CFG, antithetic=True)) != key
+    # Both engines give identical results, so they share entries
+    assert result_key(replace(CFG, backend="heap")) == result_key(replace(CFG, backend="simpy")) == key
+
+    monkeypatch.setattr(cache, "MODEL_VERSION", cache.MODEL_VERSION + "-next")
+    assert result_key(CFG) != key
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    res = {"avg_throughput_time": 123.5, "avg_rec_wait": float("nan"), "batch_ci": {"x": (1.0, 0.5, (0.5, 1.5))}}
+
+    store = ResultCache(path)
+    assert store.get_many([CFG]) == [None]
+    store.put_many([(CFG, res)])
+    store.close()
+
+    store = ResultCache(path)
+    other = replace(CFG, seed=8)
+    got, other_res = store.get_many([CFG, other])
+    store.close()
+    assert other_res is None
+    assert got["avg_throughput_time"] == 123.5
+    assert got["avg_rec_wait"] != got["avg_rec_wait"]
+    assert got["batch_ci"] == res["batch_ci"]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(cache.time, "time", lambda: float(next(clock)))
+
+    res = {"payload": "x" * 1000}
+    size = len(cache.pickle.dumps(res, protocol=cache.pickle.HIGHEST_PROTOCOL))
+    cfgs = [replace(CFG, seed=seed) for seed in range(4)]
+
+    store = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=3 * size)
+    for cfg in cfgs[:3]:
+        store.put_many([(cfg, res)])
+    assert store.size() == 3 * size
+
+    # Touch the oldest entry; adding a fourth evicts the least recently used one
+    store.get_many([cfgs[0]])
+    store.put_many([(cfgs[3], res)])
+    assert store.size() <= 3 * size
+    assert _stored(store, cfgs) == [True, False, True, True]
+
+    # Reopening with a smaller limit evicts down to it
+    store.close()
+    store = ResultCache(str(tmp_path / "cache.sqlite"), max_bytes=size)
+    assert store.size() == size
+    assert _stored(store, cfgs) == [False, False, False, True]
+    store.close()
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+import analysis
+import runner
+from checkpoint import Checkpoint
+from config import Config
+from design import FactorialDesign
+
+JOBS = [(Config(P=3, R=4, batches=3), seed) for seed in (1, 2, 3)]
+
+
+@pytest.fixture
+def counted_runs(monkeypatch):
+    """Serial runs without a result cache; returns the list of simulated configs."""
+    calls = []
+    run_once = runner.run_once
+
+    def counting(cfg, patients=None):
+        calls.append(cfg)
+        return run_once(cfg, patients)
+
+    monkeypatch.setattr(runner, "run_once", counting)
+    monkeypatch.setattr(runner, "_workers", 1)
+    monkeypatch.setattr(runner, "_cache", None)
+    yield calls
+    runner.set_checkpoint(None)
+
+
+def test_replications_are_reused(tmp_path, counted_runs):
+    path = str(tmp_path / "run.ckpt")
+    runner.set_checkpoint(path)
+    first = runner.run_replications(JOBS)
+    assert len(counted_runs) == len(JOBS)
+
+    # A new run on the same file simulates nothing and restores equal results
+    runner.set_checkpoint(path)
+    second = runner.run_replications(JOBS)
+    assert len(counted_runs) == len(JOBS)
+    assert second == first
+    for res in second:
+        assert all(isinstance(ci, tuple) and isinstance(ci[2], tuple) for ci in res["batch_ci"].values())
+
+
+def test_torn_last_record_is_dropped(tmp_path, counted_runs):
+    path = tmp_path / "run.ckpt"
+    runner.set_checkpoint(str(path))
+    first = runner.run_replications(JOBS)
+    runner.set_checkpoint(None)
+
+    # Interrupted in the middle of writing the last record
+    data = path.read_bytes()
+    last = data.rstrip(b"\n").rfind(b"\n") + 1
+    path.write_bytes(data[:last + (len(data) - last) // 2])
+
+    ckpt = Checkpoint(str(path))
+    assert len(ckpt.reps) == len(JOBS) - 1
+    ckpt.close()
+    assert path.read_bytes() == data[:last]
+
+    # Only the lost replication runs again; the file is valid JSON lines afterwards
+    runner.set_checkpoint(str(path))
+    assert runner.run_replications(JOBS) == first
+    assert len(counted_runs) == len(JOBS) + 1
+    runner.set_checkpoint(None)
+    assert [json.loads(line)["kind"] for line in path.read_text().splitlines()] == ["rep"] * len(JOBS)
+
+
+def test_design_cells_are_reused(tmp_path, counted_runs):
+    design = FactorialDesign({"R": ({"R": 3}, {"R": 5})})
+    base = Config(P=3, R=4)
+    keys = ["avg_throughput_time", "theatre_block_rate"]
+
+    runner.set_checkpoint(str(tmp_path / "run.ckpt"))
+    first = analysis.run_design(design, base, 2, 10, keys, "cells")
+    assert len(counted_runs) == 4
+
+    # Reopened with replication records removed: the cells alone are enough
+    ckpt = runner.get_checkpoint()
+    ckpt.close()
+    lines = (tmp_path / "run.ckpt").read_text().splitlines()
+    cells = [line for line in lines if json.loads(line)["kind"] == "cell"]
+    assert len(cells) == 2
+    (tmp_path / "run.ckpt").write_text("\n".join(cells) + "\n")
+    runner._checkpoint = None
+
+    runner.set_checkpoint(str(tmp_path / "run.ckpt"))
+    second = analysis.run_design(design, base, 2, 10, keys, "cells")
+    assert len(counted_runs) == 4
+    assert second == first
+
+    # A different experiment name is a different cell
+    analysis.run_design(design, base, 2, 10, keys, "other")
+    assert len(counted_runs) == 8
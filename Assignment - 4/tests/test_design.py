@@ -0,0 +1,108 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from config import Config
+from design import FactorialDesign, fit_effects, fractional_design, yates
+
+
+def _factors(k: int):
+    # Factor names A, B, C, ...; the overrides are irrelevant for the design itself
+    return {chr(ord("A") + j): ({"seed": 2 * j}, {"seed": 2 * j + 1}) for j in range(k)}
+
+
+def _column(design: FactorialDesign, word) -> np.ndarray:
+    return np.prod([design.matrix[:, design.names.index(f)] for f in word], axis=0)
+
+
+def test_full_factorial_standard_order():
+    design = FactorialDesign(_factors(3))
+    expected = np.array(list(itertools.product((-1, 1), repeat=3)))
+    np.testing.assert_array_equal(design.matrix, expected)
+    assert design.resolution is None
+
+
+@pytest.mark.parametrize("k, resolution", [(4, 4), (5, 3), (5, 5), (6, 4), (7, 4), (8, 4), (10, 4)])
+def test_fractional_design_properties(k, resolution):
+    design = fractional_design(_factors(k), resolution=resolution)
+    assert design.resolution is None or design.resolution >= resolution
+
+    # Generated columns are the products of their basic columns
+    for name, word in design.generators.items():
+        np.testing.assert_array_equal(_column(design, [name]), _column(design, word))
+
+    # Every word of the defining relation is the identity column
+    for word in design.defining_relation():
+        assert (_column(design, word) == 1).all()
+
+    # Main effects are balanced and mutually orthogonal
+    x = design.matrix
+    np.testing.assert_array_equal(x.sum(axis=0), 0)
+    np.testing.assert_array_equal(x.T @ x, design.n_runs * np.eye(k, dtype=int))
+
+
+def test_fractional_design_is_smallest_tabulated():
+    # 2^(6-2) resolution IV beats the 2^(6-1) fraction and the full factorial
+    design = fractional_design(_factors(6), resolution=4)
+    assert design.n_runs == 16
+    assert design.resolution == 4
+
+
+def test_aliases_share_columns():
+    design = fractional_design(_factors(5), resolution=3)
+    for effect in (("A",), ("A", "B"), ("C", "D")):
+        for alias in design.aliases(effect):
+            np.testing.assert_array_equal(_column(design, alias), _column(design, effect))
+
+
+def test_configs_apply_levels():
+    design = FactorialDesign({"P": ({"P": 3}, {"P": 4}), "R": ({"R": 4}, {"R": 5})})
+    cfgs = design.configs(Config(P=0, R=0))
+    assert [(c.P, c.R) for c in cfgs] == [(3, 4), (3, 5), (4, 4), (4, 5)]
+
+
+# -------------------------
+# Yates algorithm and metamodel
+# -------------------------
+
+def _model_matrix(design: FactorialDesign, words):
+    return np.column_stack([_column(design, w) if w else np.ones(design.n_runs) for w in words])
+
+
+def test_yates_matches_least_squares():
+    rng = np.random.default_rng(1)
+    design = FactorialDesign(_factors(4))
+    y = rng.normal(size=design.n_runs)
+
+    # Entry t of the Yates result belongs to the factors whose bits are set in t
+    words = [[f for j, f in enumerate(design.names) if t >> (3 - j) & 1] for t in range(design.n_runs)]
+    coef, *_ = np.linalg.lstsq(_model_matrix(design, words), y, rcond=None)
+    np.testing.assert_allclose(yates(y), design.n_runs * coef, atol=1e-12)
+
+
+@pytest.mark.parametrize("k, resolution", [(3, 5), (5, 3), (6, 4)])
+def test_fit_effects_matches_least_squares(k, resolution):
+    rng = np.random.default_rng(k)
+    design = fractional_design(_factors(k), resolution=resolution)
+    n_rep = 3
+    y = rng.normal(size=(design.n_runs, n_rep)) + 0.5 * design.matrix[:, :1]
+
+    fit = fit_effects(design, y)
+    words = [sorted(e.word) for e in fit["effects"]]
+    x = np.repeat(_model_matrix(design, words), n_rep, axis=0)
+    coef, *_ = np.linalg.lstsq(x, y.ravel(), rcond=None)
+    np.testing.assert_allclose([e.coef for e in fit["effects"]], coef, atol=1e-12)
+
+    # Saturated model: the residual mean square is the pure error
+    resid = y.ravel() - x @ coef
+    df = design.n_runs * (n_rep - 1)
+    assert fit["df"] == df
+    assert fit["mse"] == pytest.approx(float(resid @ resid) / df)
+    se = np.sqrt(fit["mse"] * np.diag(np.linalg.inv(x.T @ x)))
+    np.testing.assert_allclose([e.se for e in fit["effects"]], se)
+
+    # Pruning drops terms but leaves the kept coefficients unchanged
+    coefs = {e.word: e.coef for e in fit["effects"]}
+    for e in fit["pruned"]:
+        assert e.coef == coefs[e.word]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import runner
+from config import Config
+from metrics import BLOCKED, BUSY, IDLE, ServerStates
+from model import PatientTable
+
+
+def test_server_states_with_three_servers():
+    s = ServerStates(3)
+    a = s.acquire(0.0)            # a busy from 0
+    b = s.acquire(1.0)            # b busy from 1
+    assert (a, b) == (0, 1)       # lowest free index first
+    s.set(3.0, a, BLOCKED)        # a blocked from 3
+    c = s.acquire(4.0)            # all three in use from 4
+    assert c == 2 and s.in_use == 3 and s.n_blocked == 1
+    s.release(6.0, b)             # b free at 6; all in use for 4..6
+    s.release(7.0, a)             # a unblocked and free at 7
+    assert s.n_blocked == 0
+    assert s.acquire(8.0, BLOCKED) == 0  # freed servers are reused, lowest first
+    assert list(s.state) == [BLOCKED, IDLE, BUSY]
+
+    busy, blocked, full = s.totals(10.0)
+    assert busy == pytest.approx(3.0 + 5.0 + 6.0)   # a 0..3, b 1..6, c 4..10
+    assert blocked == pytest.approx(4.0 + 2.0)      # a 3..7 and 8..10
+    assert full == pytest.approx(2.0)
+
+    # A copy evolves independently
+    other = s.copy()
+    other.release(10.0, c)
+    assert s.state[c] == BUSY and other.state[c] == IDLE
+
+    # Reset keeps the states but restarts the clocks
+    s.reset(10.0)
+    assert s.totals(10.0) == (0.0, 0.0, 0.0)
+    assert s.totals(12.0) == pytest.approx((2.0, 2.0, 0.0))
+
+
+def _overlap(start, end, lo, hi):
+    return np.clip(np.minimum(end, hi) - np.maximum(start, lo), 0.0, None)
+
+
+@pytest.mark.parametrize("backend", ["simpy", "heap"])
+def test_theatre_state_matches_patient_records(backend):
+    cfg = Config(P=4, R=3, OP=3, seed=8, backend=backend)
+    patients = PatientTable()
+    res = runner.run_once(cfg, patients)
+    col = patients.to_numpy()
+    lo, hi = cfg.warmup, cfg.warmup + cfg.sim_time
+
+    op_end = col["t_op_start"] + col["op_time"]
+    block_end = op_end + np.nan_to_num(col["block_time"])
+    started = ~np.isnan(col["t_op_start"])
+    # Operations still running at the end count up to the end of the run
+    busy = _overlap(col["t_op_start"][started], op_end[started], lo, hi).sum()
+    blocked = _overlap(op_end[started], block_end[started], lo, hi).sum()
+    assert blocked > 0
+    assert res["theatre_utilization"] == pytest.approx(busy / (cfg.sim_time * cfg.OP), rel=1e-9)
+    assert res["theatre_block_rate"] == pytest.approx(blocked / (cfg.sim_time * cfg.OP), rel=1e-9)
+
+    # Every theatre serves at most one patient at a time, and all are used
+    theatre = col["theatre"][started]
+    assert set(theatre.tolist()) == set(range(cfg.OP))
+    for i in range(cfg.OP):
+        starts = col["t_op_start"][started][theatre == i]
+        ends = block_end[started][theatre == i]
+        order = np.argsort(starts)
+        assert (starts[order][1:] >= ends[order][:-1] - 1e-9).all()
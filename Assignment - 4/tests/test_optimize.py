@@ -0,0 +1,75 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import optimize
+from config import Config
+from optimize import CapacitySearch
+
+BOUNDS = {"P": (1, 5), "R": (1, 5), "OP": (1, 2)}
+
+
+def _true_mean(P, R, OP):
+    # Decreasing in every capacity, with diminishing returns
+    return 10.0 / P + 10.0 / R + 5.0 / OP
+
+
+def _fake_replications(jobs):
+    """Stand-in for run_replications: known mean plus CRN noise (per seed) and a little own noise."""
+    out = []
+    for cfg, seed in jobs:
+        z = np.random.default_rng(seed).standard_normal()
+        e = np.random.default_rng([seed, cfg.P, cfg.R, cfg.OP]).standard_normal()
+        out.append({"m": _true_mean(cfg.P, cfg.R, cfg.OP) + 0.3 * z + 0.05 * e})
+    return out
+
+
+@pytest.fixture
+def search(monkeypatch):
+    monkeypatch.setattr(optimize, "run_replications", _fake_replications)
+    return CapacitySearch(Config(P=1, R=1), "m", 100, n_rep=20, bounds=BOUNDS)
+
+
+def _grid():
+    return list(itertools.product(*(range(lo, hi + 1) for lo, hi in BOUNDS.values())))
+
+
+@pytest.mark.parametrize("budget", [8.0, 10.0, 12.0])
+def test_minimize_finds_best_point_within_budget(search, budget):
+    feasible = [p for p in _grid() if search.cost(p) <= budget]
+    expected = min(feasible, key=lambda p: _true_mean(*p))
+
+    res = search.minimize(budget)
+    assert res["point"] == expected
+    assert res["cost"] <= budget
+    assert res["path"][0] == (1, 1, 1)
+    assert res["replications"] == 20 * res["evaluated"]
+    assert res["mean"] == pytest.approx(_true_mean(*expected), abs=1.5)
+
+
+@pytest.mark.parametrize("target", [12.0, 9.0])
+def test_cheapest_meets_target_at_least_cost(search, target):
+    res = search.cheapest(target)
+    assert res["met"]
+    assert res["mean"] + res["half"] <= target
+
+    # No point of lower cost meets the target (true means, with a margin for the CI)
+    cheaper = [p for p in _grid() if search.cost(p) < res["cost"]]
+    assert all(_true_mean(*p) > target - 0.1 for p in cheaper)
+
+
+def test_unreachable_target_is_reported(search):
+    res = search.cheapest(1.0)
+    assert not res["met"]
+    assert res["point"] == (5, 5, 2)
+
+
+def test_points_share_seeds(search):
+    # CRN: every point uses seeds base_seed .. base_seed + n_rep - 1, so the
+    # common noise cancels and a difference of 0.1 is significant
+    search.evaluate([(5, 5, 2), (5, 4, 2)])
+    assert search.better((5, 5, 2), (5, 4, 2))
+    assert not search.better((5, 4, 2), (5, 5, 2))
+    with pytest.raises(ValueError):
+        search.minimize(5.0)
@@ -0,0 +1,67 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from config import Config
+from runner import combine_batches, run_once
+from stats import QuantileSketch, RunningStats
+
+
+def _batch(done, util, wait, sketch_values):
+    sketch = QuantileSketch()
+    for x in sketch_values:
+        sketch.add(x)
+    return {"patients_done": done, "theatre_utilization": util, "avg_rec_wait": wait,
+            "sketches": {"rec_wait": sketch.to_dict()}}
+
+
+def test_combine_batches():
+    batches = [
+        _batch(10, 0.5, 2.0, [1.0, 2.0]),
+        _batch(12, 0.7, float("nan"), []),  # no recovery waits in this batch
+        _batch(8, 0.6, 4.0, [3.0, 5.0, 7.0]),
+    ]
+    res = combine_batches(batches)
+
+    assert res["patients_done"] == 30
+    assert res["theatre_utilization"] == pytest.approx(0.6)
+    assert res["avg_rec_wait"] == pytest.approx(3.0)  # mean over the batches where it is defined
+    assert res["batches"] is batches
+
+    # Per-batch CIs: Student-t over the defined batch values
+    assert res["batch_ci"].keys() == {"theatre_utilization", "avg_rec_wait"}
+    assert res["batch_ci"]["theatre_utilization"] == RunningStats.from_samples([0.5, 0.7, 0.6]).ci(0.95)
+    mean, half, (lo, hi) = res["batch_ci"]["avg_rec_wait"]
+    assert (mean, lo, hi) == pytest.approx((3.0, 3.0 - half, 3.0 + half))
+    # Two values 2 and 4: s = sqrt(2), half = t(0.975, 1) s / sqrt(2)
+    assert half == pytest.approx(12.706204736174698)
+
+    # Sketches are merged over all batches
+    merged = QuantileSketch.from_dict(res["sketches"]["rec_wait"])
+    assert merged.n == 5
+    assert merged.quantile(0.5) == pytest.approx(3.0)
+
+
+def test_single_batch_is_returned_as_is():
+    batch = _batch(10, 0.5, 2.0, [1.0])
+    res = combine_batches([batch])
+    assert res == batch
+    assert "batch_ci" not in res
+
+
+def test_batches_of_one_run():
+    cfg = Config(P=3, R=4, seed=3)
+    whole = run_once(cfg)
+    res = run_once(replace(cfg, batches=4))
+
+    batches = res["batches"]
+    assert len(batches) == 4
+    assert sum(b["patients_done"] for b in batches) == res["patients_done"] == whole["patients_done"]
+    # Batches of equal length: the mean of the batch time averages is the time average of the run
+    for key in ("theatre_utilization", "avg_prep_queue_length", "prob_recovery_all_busy"):
+        assert res[key] == pytest.approx(whole[key], rel=1e-12)
+        assert res[key] == pytest.approx(np.mean([b[key] for b in batches]), rel=1e-12)
+        mean, half, (lo, hi) = res["batch_ci"][key]
+        assert mean == pytest.approx(res[key])
+        assert half > 0 and lo == pytest.approx(mean - half) and hi == pytest.approx(mean + half)
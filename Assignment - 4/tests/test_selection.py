@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+import pytest
+
+import runner
+import selection
+from config import Config
+from selection import kn_select
+
+# Systems told apart by P; the synthetic metric is mean + common + own noise
+CFGS = {"a": Config(P=1, R=1), "b": Config(P=2, R=1), "c": Config(P=3, R=1)}
+
+
+class _Simulator:
+    """Stands in for run_replications with a normal metric and CRN noise."""
+
+    def __init__(self, means, common=1.0, own=0.3):
+        self.means = means
+        self.common = common
+        self.own = own
+        self.jobs = []
+
+    def __call__(self, jobs):
+        jobs = list(jobs)
+        self.jobs.extend(jobs)
+        out = []
+        for cfg, seed in jobs:
+            # The common part depends on the seed only, as common random numbers do
+            z = np.random.default_rng(seed).standard_normal()
+            e = np.random.default_rng([seed, cfg.P]).standard_normal()
+            out.append({"m": self.means[cfg.P] + self.common * z + self.own * e})
+        return out
+
+
+def test_eta_and_h2(monkeypatch):
+    monkeypatch.setattr(selection, "run_replications", _Simulator({1: 0.0, 2: 0.0, 3: 0.0}))
+    # KN constant: eta = ((2 alpha / (k - 1))^(-2 / (n0 - 1)) - 1) / 2, h^2 = 2 eta (n0 - 1)
+    res = kn_select(CFGS, "m", 1.0, 0, alpha=0.05, n0=10, max_rep=10)
+    assert res["h2"] == pytest.approx(2 * 9 * 0.5 * (0.05 ** (-2 / 9) - 1))
+    assert res["h2"] == pytest.approx(8.512989458187498)
+
+
+def test_dominating_system_is_selected(monkeypatch):
+    sim = _Simulator({1: 0.0, 2: 3.0, 3: 3.5})
+    monkeypatch.setattr(selection, "run_replications", sim)
+    res = kn_select(CFGS, "m", 1.0, 100)
+    assert res["best"] == "a"
+    assert res["guaranteed"]
+    assert res["eliminated"].keys() == {"b", "c"}
+    assert res["means"]["a"] < res["means"]["b"] < res["means"]["c"]
+
+    # Maximizing selects the other end
+    assert kn_select(CFGS, "m", 1.0, 100, minimize=False)["best"] == "c"
+
+
+def test_common_random_numbers(monkeypatch):
+    sim = _Simulator({1: 0.0, 2: 0.5, 3: 0.8})
+    monkeypatch.setattr(selection, "run_replications", sim)
+    res = kn_select(CFGS, "m", 0.2, 100)
+
+    # Every replication r runs all survivors with the same seed base_seed + r
+    seeds = {}
+    for cfg, seed in sim.jobs:
+        seeds.setdefault(cfg.P, []).append(seed)
+    for P, name in ((1, "a"), (2, "b"), (3, "c")):
+        assert seeds[P] == list(range(100, 100 + res["n_rep"][name]))
+    # With CRN the noise cancels in the differences, so few stages suffice
+    # although the metric itself has a standard deviation of over 1
+    assert res["best"] == "a" and res["guaranteed"]
+    assert res["stages"] < 100
+
+
+def test_tied_systems(monkeypatch):
+    # a and b have the same mean: KN stops once W is zero, with either one
+    sim = _Simulator({1: 0.0, 2: 0.0, 3: 2.0})
+    monkeypatch.setattr(selection, "run_replications", sim)
+    delta = 0.5
+    res = kn_select(CFGS, "m", delta, 100)
+    assert res["best"] in ("a", "b")
+    assert res["eliminated"]["c"] <= res["stages"]
+    # Beyond h^2 S^2 / delta^2 stages the continuation region is empty
+    s2_max = 2 * sim.own ** 2 * 4  # generous bound on the variance of a - b
+    assert res["stages"] <= math.ceil(res["h2"] * s2_max / delta ** 2) + 1
+
+
+def test_identical_systems_are_duplicates(monkeypatch):
+    # R does not change the prep queue: with CRN both give identical results
+    monkeypatch.setattr(runner, "_workers", 1)
+    monkeypatch.setattr(runner, "_cache", None)
+    cfgs = {"3P4R": Config(P=3, R=4), "3P5R": Config(P=3, R=5), "4P5R": Config(P=4, R=5)}
+    res = kn_select(cfgs, "avg_prep_queue_length", 0.05, 1, n0=10, max_rep=100)
+    assert res["duplicates"] == {"3P5R": "3P4R"}
+    assert res["eliminated"]["3P5R"] == 10
+    assert res["best"] == "4P5R"
@@ -0,0 +1,71 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+import runner
+import series
+from config import Config
+from engine import batch_ends
+from series import SERIES, SeriesBuffer, level_at, load_series, time_average, window
+
+# Series -> (result key, divisor) of the same time average in Metrics
+METRICS = {
+    "prep_queue": ("avg_prep_queue_length", lambda cfg: 1),
+    "theatres_busy": ("theatre_utilization", lambda cfg: cfg.OP),
+    "theatres_blocked": ("theatre_block_rate", lambda cfg: cfg.OP),
+    "rec_occupancy": ("avg_recovery_occupancy", lambda cfg: 1),
+}
+
+
+def test_buffer_grows_and_merges_same_instant_changes(tmp_path):
+    buf = SeriesBuffer(capacity=2)
+    buf.record(0.0, 1)
+    buf.record(1.0, 1)   # same level: no record
+    buf.record(2.0, 3)
+    buf.record(2.0, 2)   # same instant: replaces the level
+    buf.record(3.0, 4)
+    buf.record(4.0, 5)   # beyond the initial capacity
+    buf.record(4.0, 4)   # back to the previous level at once: nothing changed
+    assert len(buf) == 3
+
+    path = str(tmp_path / "x.npy")
+    buf.write(path)
+    rec = np.load(path, mmap_mode="r")
+    assert isinstance(rec, np.memmap)
+    assert rec["time"].tolist() == [0.0, 2.0, 3.0]
+    assert rec["level"].tolist() == [1, 2, 4]
+
+    assert level_at(rec, -1.0) == 0
+    assert level_at(rec, 2.5) == 2
+    assert window(rec, 2.5, 3.0)["time"].tolist() == [2.0]
+    assert time_average(rec, 1.0, 5.0) == pytest.approx((1 * 1 + 2 * 1 + 4 * 2) / 4)
+
+
+@pytest.mark.parametrize("cfg", [
+    Config(P=3, R=4, seed=4),
+    Config(P=4, R=3, OP=2, seed=5, batches=4),
+], ids=repr)
+def test_round_trip_matches_metrics(cfg, tmp_path, monkeypatch):
+    monkeypatch.setattr(series, "_series_dir", str(tmp_path))
+    loaded = {}
+    for backend in ("simpy", "heap"):
+        run_cfg = replace(cfg, backend=backend)
+        res = runner.run_once(run_cfg)
+        loaded[backend] = load_series(series.series_stem(run_cfg))
+
+        # Averages of the memory-mapped series over the observation period
+        # (and over every batch) are the time averages of Metrics
+        bounds = [cfg.warmup] + batch_ends(cfg)
+        for name, (key, divisor) in METRICS.items():
+            data = loaded[backend][name]
+            assert isinstance(data, np.memmap)
+            avg = time_average(data, bounds[0], bounds[-1]) / divisor(cfg)
+            assert avg == pytest.approx(res[key], rel=1e-9), name
+            for k, batch in enumerate(res.get("batches", [])):
+                avg = time_average(data, bounds[k], bounds[k + 1]) / divisor(cfg)
+                assert avg == pytest.approx(batch[key], rel=1e-9), (name, k)
+
+    # Both backends record the same trajectories
+    for name in SERIES:
+        np.testing.assert_array_equal(loaded["simpy"][name], loaded["heap"][name])
@@ -0,0 +1,52 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+import runner
+from config import Config
+from splitting import restart_estimate, restart_replication
+from stats import RunningStats
+
+CFG = Config(P=3, R=3)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_without_splitting_equals_the_main_run(seed):
+    # Splitting factors of 1: only the main trajectory, i.e. the heap backend run
+    cfg = replace(CFG, seed=seed, backend="heap")
+    res = restart_replication(cfg, [2, 3, 4], [1, 1, 1])
+    assert res["trajectories"] == 1
+    assert res["estimate"] == pytest.approx(runner.run_once(cfg)["theatre_block_rate"], rel=1e-12)
+
+
+def test_main_trajectory_splits_when_starting_above_thresholds():
+    # Seed 12 ends the warm-up blocked (occupancy R + 1): over a vanishing
+    # observation period every one of the 2^4 trajectories is blocked, and
+    # the weighted estimate must be the crude indicator 1
+    cfg = replace(CFG, seed=12, sim_time=1e-6)
+    res = restart_replication(cfg, [1, 2, 3, 4], [2, 2, 2, 2])
+    assert res["trajectories"] == 16
+    assert res["estimate"] == pytest.approx(1.0)
+
+
+def test_restart_agrees_with_crude_monte_carlo():
+    # Blocking is not rare for R = 3, so crude Monte Carlo is precise enough;
+    # the main trajectory often starts above the first threshold
+    rs = restart_estimate(CFG, 200, 500, thresholds=[3, 4], splits=[2, 2], workers=1)
+    assert rs["trajectories"] > 200
+    crude = runner.run_replications([(CFG, 10_000 + r) for r in range(400)], workers=1)
+    crude_stats = RunningStats.from_samples(res["theatre_block_rate"] for res in crude)
+
+    m, h, _ = rs["stats"].ci(0.95)
+    mc, hc, _ = crude_stats.ci(0.95)
+    assert abs(m - mc) <= np.hypot(h, hc)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError, match="single theatre"):
+        restart_replication(replace(CFG, OP=2), [3, 4], [2, 2])
+    with pytest.raises(ValueError, match="one splitting factor"):
+        restart_replication(CFG, [3, 4], [2])
+    with pytest.raises(ValueError, match="R \\+ 1"):
+        restart_replication(CFG, [2, 3], [2, 2])
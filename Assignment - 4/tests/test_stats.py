@@ -0,0 +1,177 @@
+import math
+
+import numpy as np
+import pytest
+
+from config import Config
+from model import PatientTable
+from runner import accumulate_replications, run_once
+from stats import QuantileSketch, RunningStats, control_variates, t_cdf, t_quantile
+
+# Student-t quantiles from standard tables (scipy.stats.t.ppf)
+T_TABLE = [
+    (0.975, 1, 12.706204736174698),
+    (0.975, 2, 4.302652729749464),
+    (0.975, 5, 2.570581835636314),
+    (0.975, 10, 2.2281388519862744),
+    (0.975, 30, 2.0422724563012373),
+    (0.975, 100, 1.9839715184496334),
+    (0.95, 4, 2.131846786326649),
+    (0.995, 20, 2.8453397097861),
+    (0.9, 3, 1.6377443536962102),
+]
+
+
+@pytest.mark.parametrize("p, df, expected", T_TABLE)
+def test_t_quantile_matches_tables(p, df, expected):
+    assert t_quantile(p, df) == pytest.approx(expected, rel=1e-9)
+    assert t_quantile(1.0 - p, df) == pytest.approx(-expected, rel=1e-9)
+
+
+@pytest.mark.parametrize("df", [1, 3, 9, 49])
+@pytest.mark.parametrize("p", [0.6, 0.9, 0.99, 0.999])
+def test_t_quantile_inverts_t_cdf(p, df):
+    assert t_cdf(t_quantile(p, df), df) == pytest.approx(p, abs=1e-12)
+
+
+def test_t_quantile_tends_to_normal():
+    assert t_quantile(0.975, 1e7) == pytest.approx(1.959963984540054, rel=1e-6)
+
+
+def test_t_quantile_rejects_bad_p():
+    with pytest.raises(ValueError):
+        t_quantile(1.0, 5)
+
+
+def test_ci_uses_exact_t_quantile():
+    samples = [1.0, 2.0, 4.0, 7.0, 11.0]
+    m, h, (lo, hi) = RunningStats.from_samples(samples).ci(0.95)
+    sd = math.sqrt(sum((x - 5.0) ** 2 for x in samples) / 4)
+    assert m == pytest.approx(5.0)
+    assert h == pytest.approx(2.7764451051977987 * sd / math.sqrt(5))
+    assert (lo, hi) == pytest.approx((m - h, m + h))
+
+
+# -------------------------
+# Quantile sketches
+# -------------------------
+
+def _samples(kind: str, rng: np.random.Generator, n: int) -> np.ndarray:
+    if kind == "exp":
+        return rng.exponential(50.0, n)
+    if kind == "lognormal":
+        return rng.lognormal(3.0, 1.0, n)
+    # Recovery-wait-like: most values exactly zero
+    return np.where(rng.random(n) < 0.93, 0.0, rng.exponential(5.0, n))
+
+
+def _sketch(values) -> QuantileSketch:
+    sketch = QuantileSketch()
+    for x in values:
+        sketch.add(float(x))
+    return sketch
+
+
+@pytest.mark.parametrize("kind", ["exp", "lognormal", "zeros"])
+def test_merged_sketches_match_pooled_quantiles(kind):
+    rng = np.random.default_rng(7)
+    parts = [_samples(kind, rng, int(rng.integers(10, 3000))) for _ in range(40)]
+    pooled = np.sort(np.concatenate(parts))
+
+    merged = QuantileSketch.merged(_sketch(x).to_dict() for x in parts)
+    assert len(merged) == len(pooled)
+    assert merged.min == pooled[0] and merged.max == pooled[-1]
+    assert len(merged.means) <= 2 * merged.compression
+
+    for q in (0.5, 0.9, 0.95, 0.99):
+        est = merged.quantile(q)
+        # Rank error: fraction of the pooled values below the estimate
+        rank = np.searchsorted(pooled, est) / len(pooled)
+        assert abs(rank - q) < 0.003 or est == np.quantile(pooled, q), (q, rank)
+
+    if kind == "zeros":
+        # The point mass at the minimum is counted exactly
+        assert merged.quantile(0.9) == 0.0
+
+
+def test_merge_equals_merged_dicts():
+    rng = np.random.default_rng(3)
+    parts = [_samples("exp", rng, 500) for _ in range(8)]
+    total = QuantileSketch()
+    for x in parts:
+        total.merge(_sketch(x))
+    merged = QuantileSketch.merged(_sketch(x).to_dict() for x in parts)
+    for q in (0.9, 0.95):
+        assert total.quantile(q) == pytest.approx(merged.quantile(q))
+
+
+def test_sketch_round_trips_through_dict():
+    sketch = _sketch(_samples("zeros", np.random.default_rng(5), 2000))
+    copy = QuantileSketch.from_dict(sketch.to_dict())
+    assert len(copy) == len(sketch)
+    for q in (0.5, 0.9, 0.95, 0.99):
+        assert copy.quantile(q) == sketch.quantile(q)
+
+
+def test_pooled_replication_sketches_match_patient_records():
+    cfgs = [Config(P=3, R=4, seed=seed) for seed in range(1, 9)]
+    acc = accumulate_replications([(cfg, cfg.seed) for cfg in cfgs], ["p90_throughput_time"],
+                                  workers=1, sketches=["throughput_time"])
+
+    # Exact throughput times of the patients that left during observation
+    times = []
+    for cfg in cfgs:
+        patients = PatientTable()
+        run_once(cfg, patients)
+        col = patients.to_numpy()
+        done = (col["t_exit"] >= cfg.warmup) & (col["t_exit"] <= cfg.warmup + cfg.sim_time)
+        times.append((col["t_exit"] - col["t_arrival"])[done])
+    pooled = np.concatenate(times)
+
+    sketch = acc["throughput_time"]
+    assert len(sketch) == len(pooled)
+    for q in (0.9, 0.95):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(pooled, q), rel=0.02)
+
+    # Same pooled sketch whatever the number of workers
+    acc2 = accumulate_replications([(cfg, cfg.seed) for cfg in cfgs], ["p90_throughput_time"],
+                                   workers=2, sketches=["throughput_time"])
+    assert acc2["throughput_time"].to_dict() == sketch.to_dict()
+
+
+def _controlled_sample(rng: np.random.Generator, n: int):
+    # y = 5 + 3 (x1 - 2) - 2 (x2 - 0.5) + noise, E[x1] = 2, E[x2] = 0.5: E[y] = 5
+    x = np.column_stack([rng.exponential(2.0, n), rng.random(n)])
+    y = 5.0 + 3.0 * (x[:, 0] - 2.0) - 2.0 * (x[:, 1] - 0.5) + 0.5 * rng.standard_normal(n)
+    return y, x
+
+
+def test_control_variates_recover_known_mean():
+    rng = np.random.default_rng(5)
+    y, x = _controlled_sample(rng, 200)
+    res = control_variates(y, x, [2.0, 0.5])
+    assert res["df"] == 197
+    assert res["ci"][0] < 5.0 < res["ci"][1]
+    np.testing.assert_allclose(res["beta"], [3.0, -2.0], atol=0.2)
+    # Almost all of the variance of y is explained by the controls
+    assert res["vrf"] > 20
+    assert res["half"] < RunningStats.from_samples(y).ci(0.95)[1] / 4
+
+
+def test_control_variates_reduce_variance_and_cover():
+    rng = np.random.default_rng(6)
+    plain, controlled, covered = [], [], 0
+    for _ in range(300):
+        y, x = _controlled_sample(rng, 30)
+        res = control_variates(y, x, [2.0, 0.5])
+        plain.append(y.mean())
+        controlled.append(res["mean"])
+        covered += res["ci"][0] <= 5.0 <= res["ci"][1]
+    assert abs(np.mean(controlled) - 5.0) < 0.02
+    assert np.var(controlled) < np.var(plain) / 20
+    assert 0.9 <= covered / 300 <= 0.99
+
+
+def test_control_variates_need_enough_replications():
+    with pytest.raises(ValueError, match="too few"):
+        control_variates([1.0, 2.0, 3.0], [[0.0, 1.0], [1.0, 0.0], [1.0, 1.0]], [0.5, 0.5])
@@ -0,0 +1,84 @@
+import math
+from dataclasses import replace
+
+import numpy as np
+
+import runner
+from config import Config
+from model import MILD, SEVERE, PatientTable
+from variates import (FIRST_BLOCK, BLOCK_SIZE, PATIENT_DRAWS, PatientStream, VariateStream,
+                      antithetic_uniforms, exp_transform)
+
+
+def _identity(u: np.ndarray):
+    return u.tolist()
+
+
+def test_antithetic_stream_gives_one_minus_u():
+    n = FIRST_BLOCK + BLOCK_SIZE  # spans several blocks
+    plain = VariateStream(11, _identity)
+    anti = VariateStream(11, _identity, antithetic=True)
+    u = np.array([plain.next() for _ in range(n)])
+    v = np.array([anti.next() for _ in range(n)])
+    np.testing.assert_allclose(v, 1.0 - u, rtol=0, atol=1e-15)
+
+
+def test_antithetic_patient_stream_gives_one_minus_u():
+    plain = PatientStream(12, _identity)
+    anti = PatientStream(12, _identity, antithetic=True)
+    for pid in (1, 2, 70, 5000, 3):
+        np.testing.assert_allclose(anti.get(pid), 1.0 - np.array(plain.get(pid)), rtol=0, atol=1e-15)
+        assert len(plain.get(pid)) == PATIENT_DRAWS
+
+
+def test_antithetic_uniforms_stay_in_open_interval():
+    v = antithetic_uniforms(np.array([0.0, 1e-300, 0.5, np.nextafter(1.0, 0.0)]))
+    assert (v > 0.0).all() and (v < 1.0).all()
+    # U = 0 must not give an infinite exponential variate
+    assert all(math.isfinite(x) for x in exp_transform(20.0)(v))
+
+
+class _ZeroGenerator:
+    def random(self, n):
+        return np.zeros(n)
+
+
+def test_antithetic_exponentials_are_finite_when_u_is_zero():
+    stream = VariateStream(1, exp_transform(20.0), antithetic=True)
+    stream._gen = _ZeroGenerator()
+    assert math.isfinite(stream.next())
+
+
+def _patients(cfg: Config):
+    patients = PatientTable()
+    runner.run_once(cfg, patients)
+    return patients.to_numpy()
+
+
+def test_patients_get_the_same_variates_across_configs():
+    # Same seed, different capacities and scenarios: patient i (in arrival
+    # order) must draw the same prep, severity, operation and recovery variates
+    base = Config(P=3, R=4, seed=21)
+    ref = _patients(base)
+    twisted = _patients(replace(base, scenario="twisted"))
+    assert len(ref["t_arrival"]) > 20
+
+    for cfg in (replace(base, P=4, R=5), replace(base, P=2, R=3, OP=2), replace(base, R=2, batches=3)):
+        col = _patients(cfg)
+        np.testing.assert_array_equal(col["t_arrival"], ref["t_arrival"])
+        for name in ("ptype", "prep_time", "op_time", "rec_time"):
+            np.testing.assert_array_equal(col[name], ref[name], err_msg=name)
+
+        # Severity (patient type) and operation variates in the twisted scenario
+        col = _patients(replace(cfg, scenario="twisted"))
+        for name in ("ptype", "prep_time", "op_time", "rec_time"):
+            np.testing.assert_array_equal(col[name], twisted[name], err_msg=name)
+
+    # Across scenarios only the operation mean differs: the same operation
+    # uniform gives times in the ratio of the means
+    np.testing.assert_array_equal(twisted["prep_time"], ref["prep_time"])
+    np.testing.assert_array_equal(twisted["rec_time"], ref["rec_time"])
+    severe = twisted["ptype"] == SEVERE
+    assert severe.any() and (twisted["ptype"][~severe] == MILD).all()
+    means = np.where(severe, base.severe_op_mean, base.mild_op_mean)
+    np.testing.assert_allclose(twisted["op_time"], ref["op_time"] * means / base.op_mean, rtol=1e-12)
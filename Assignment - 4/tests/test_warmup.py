@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import warmup
+from config import Config
+from runner import run_once
+
+
+def test_mser_finds_known_transient():
+    rng = np.random.default_rng(4)
+    n, transient = 400, 60
+    # Linear decay from 10 to the steady level 0 over the first 'transient' points
+    y = rng.normal(0.0, 1.0, n)
+    y[:transient] += np.linspace(10.0, 0.0, transient)
+    d = warmup.mser(y)
+    assert d % warmup.MSER_BATCH == 0
+    assert transient - 20 <= d <= transient + 20
+
+
+def test_mser_keeps_stationary_series():
+    y = np.random.default_rng(5).normal(3.0, 1.0, 400)
+    assert warmup.mser(y) <= 40
+    assert warmup.mser(np.ones(7)) == 0  # fewer than two batches
+
+
+def test_warmup_none_is_resolved_from_pilots():
+    cfg = Config(P=3, R=4, warmup=None, seed=3)
+    resolved = warmup.resolve_warmups([cfg, Config(P=3, R=4, seed=3)])
+    detected = resolved[0].warmup
+    assert detected is not None and 0.0 <= detected <= warmup.PILOT_HORIZON / 2
+    assert detected % warmup.PILOT_DT == 0
+    assert resolved[1].warmup == 200.0
+
+    # Cached per config, independent of seed and run length
+    assert warmup.detect_warmup(Config(P=3, R=4, seed=99, sim_time=50.0)) == detected
+
+    # run_once detects the same warm-up as the executor
+    res = run_once(cfg)
+    assert res == pytest.approx(run_once(Config(P=3, R=4, warmup=detected, seed=3)), nan_ok=True)
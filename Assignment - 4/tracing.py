@@ -0,0 +1,168 @@
+import os
+import sys
+import struct
+import argparse
+import hashlib
+from array import array
+from dataclasses import astuple
+from typing import Dict, Optional
+
+import numpy as np
+
+from config import Config
+
+# -------------------------
+# Tracing levels
+# -------------------------
+# off     -> no tracing calls in the per-event hot path, INFO logging only
+# summary -> one DEBUG log record per replication (simulation.log)
+# full    -> summary + a binary per-event trace file per replication
+
+OFF = "off"
+SUMMARY = "summary"
+FULL = "full"
+LEVELS = (OFF, SUMMARY, FULL)
+
+_level = SUMMARY
+_trace_dir = "traces"
+
+
+def set_level(level: str, trace_dir: Optional[str] = None):
+    """Set the process-wide tracing level (and directory for full traces)."""
+    global _level, _trace_dir
+    if level not in LEVELS:
+        raise ValueError(f"Unknown tracing level {level!r}; expected one of {LEVELS}")
+    _level = level
+    if trace_dir is not None:
+        _trace_dir = trace_dir
+
+
+def get_level() -> str:
+    return _level
+
+
+def get_trace_dir() -> str:
+    return _trace_dir
+
+
+# -------------------------
+# Event and resource codes
+# -------------------------
+
+ARRIVAL = 0
+PREP_START = 1
+PREP_END = 2
+OP_START = 3
+OP_END = 4
+BLOCK = 5        # operation finished but no recovery bed free
+REC_START = 6
+REC_END = 7
+DEPARTURE = 8
+
+EVENT_NAMES = (
+    "arrival", "prep_start", "prep_end", "op_start", "op_end",
+    "block", "rec_start", "rec_end", "departure",
+)
+
+NO_RESOURCE = 0
+PREP = 1
+THEATRE = 2
+RECOVERY = 3
+
+RESOURCE_NAMES = ("-", "prep", "theatre", "recovery")
+
+
+# -------------------------
+# Binary columnar trace
+# -------------------------
+# File layout (little-endian):
+#   header  : magic b"HSTR", version u2, event count u8
+#   columns : time f8[n], pid u4[n], event code u1[n], resource u1[n]
+
+MAGIC = b"HSTR"
+VERSION = 1
+_HEADER = struct.Struct("<4sHQ")
+
+
+class EventTrace:
+    """Per-replication event trace held as fixed-width typed columns."""
+    __slots__ = ("times", "pids", "codes", "resources")
+
+    def __init__(self):
+        self.times = array("d")
+        self.pids = array("I")
+        self.codes = array("B")
+        self.resources = array("B")
+
+    def emit(self, code: int, pid: int, time: float, resource: int = NO_RESOURCE):
+        self.times.append(time)
+        self.pids.append(pid)
+        self.codes.append(code)
+        self.resources.append(resource)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def write(self, path: str):
+        """Write the trace to 'path' in the columnar binary format."""
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(self)))
+            for col in (self.times, self.pids, self.codes, self.resources):
+                if sys.byteorder != "little" and col.itemsize > 1:
+                    col = array(col.typecode, col)
+                    col.byteswap()
+                col.tofile(f)
+
+
+def run_name(cfg: Config) -> str:
+    """Readable, unique file name stem for one replication of cfg."""
+    digest = hashlib.sha1(repr(astuple(cfg)).encode()).hexdigest()[:10]
+    return f"P{cfg.P}R{cfg.R}OP{cfg.OP}_{cfg.scenario}_seed{cfg.seed}_{digest}"
+
+
+def trace_path(cfg: Config) -> str:
+    """File name for the full trace of one replication of cfg."""
+    return os.path.join(_trace_dir, run_name(cfg) + ".trc")
+
+
+def read_trace(path: str) -> Dict[str, np.ndarray]:
+    """Read a binary trace into NumPy columns: time, pid, code, resource."""
+    with open(path, "rb") as f:
+        magic, version, n = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} event trace")
+        return {
+            "time": np.fromfile(f, dtype="<f8", count=n),
+            "pid": np.fromfile(f, dtype="<u4", count=n),
+            "code": np.fromfile(f, dtype="u1", count=n),
+            "resource": np.fromfile(f, dtype="u1", count=n),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a binary event trace")
+    parser.add_argument("path", help="trace file (.trc)")
+    parser.add_argument("--limit", type=int, default=None, help="print at most this many events")
+    parser.add_argument("--pid", type=int, default=None, help="only events of this patient")
+    args = parser.parse_args()
+
+    tr = read_trace(args.path)
+    mask = np.ones(len(tr["time"]), dtype=bool)
+    if args.pid is not None:
+        mask &= tr["pid"] == args.pid
+    idx = np.nonzero(mask)[0][:args.limit]
+
+    for i in idx:
+        print(
+            f"t={tr['time'][i]:12.3f}  pid={tr['pid'][i]:6d}  "
+            f"{EVENT_NAMES[tr['code'][i]]:10s}  {RESOURCE_NAMES[tr['resource'][i]]}"
+        )
+
+    counts = np.bincount(tr["code"], minlength=len(EVENT_NAMES))
+    print(f"\n{len(tr['time'])} events: " + ", ".join(
+        f"{name}={c}" for name, c in zip(EVENT_NAMES, counts)
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import numpy as np
+from typing import Any, Callable, List
+
+# Largest double below 1: antithetic uniforms 1 - U are clipped to it, so
+# U = 0 cannot give 1 - U = 1 (an infinite exponential variate)
+MAX_UNIFORM = float(np.nextafter(1.0, 0.0))
+
+
+def antithetic_uniforms(u: np.ndarray) -> np.ndarray:
+    """The antithetic uniforms 1 - U, kept in the open interval (0, 1)."""
+    return np.minimum(1.0 - u, MAX_UNIFORM)
+
+
+# Size of the first block and upper bound for later blocks. Blocks double in
+# size, so short runs do not pay for thousands of unused variates while long
+# runs amortize each NumPy call over BLOCK_SIZE draws.
+FIRST_BLOCK = 256
+BLOCK_SIZE = 4096
+
+
+class VariateStream:
+    """
+    Buffered random-variate stream.
+
+    Uniforms are drawn from a private NumPy generator in blocks, turned into
+    variates by a vectorized transform (inverse CDF) and handed out one at a
+    time by index. Each stream owns its generator, so streams stay independent
+    and a stream is consumed in exactly the same order whatever the block
+    sizes are (needed for Common Random Numbers). An antithetic stream hands
+    out the variates of 1 - U for the same uniforms U.
+    """
+    __slots__ = ("_gen", "_transform", "_antithetic", "_buf", "_i", "_n", "_block")
+
+    def __init__(self, seed: int, transform: Callable[[np.ndarray], List[Any]],
+                 antithetic: bool = False):
+        self._gen = np.random.default_rng(seed)
+        self._transform = transform
+        self._antithetic = antithetic
+        self._buf = []
+        self._i = 0
+        self._n = 0
+        self._block = FIRST_BLOCK
+
+    def next(self):
+        """Return the next variate of the stream."""
+        i = self._i
+        if i == self._n:
+            self._refill()
+            i = 0
+        self._i = i + 1
+        return self._buf[i]
+
+    def _refill(self):
+        u = self._gen.random(self._block)
+        if self._antithetic:
+            u = antithetic_uniforms(u)
+        self._buf = self._transform(u)
+        self._n = len(self._buf)
+        self._i = 0
+        self._block = min(2 * self._block, BLOCK_SIZE)
+
+
+# Uniforms per patient substream (one Philox counter block)
+PATIENT_DRAWS = 4
+
+
+class PatientStream:
+    """
+    Per-patient random-number substreams from a counter-based generator.
+
+    Patient pid owns the PATIENT_DRAWS uniforms of Philox counter block pid
+    (under the stream's key), however many of them it uses and whatever other
+    patients consume. Configs and scenarios that draw differently per patient
+    thus still give the same randomness to the same patient, which keeps
+    Common Random Numbers synchronized.
+
+    Substreams of consecutive patients are generated in blocks; a vectorized
+    transform turns the (patients x PATIENT_DRAWS) uniforms into one record
+    per patient (from 1 - U for an antithetic stream).
+    """
+    __slots__ = ("_key", "_transform", "_antithetic", "_buf", "_first", "_n", "_block")
+
+    def __init__(self, key: int, transform: Callable[[np.ndarray], List[Any]],
+                 antithetic: bool = False):
+        self._key = key
+        self._transform = transform
+        self._antithetic = antithetic
+        self._buf = []
+        self._first = 0
+        self._n = 0
+        self._block = FIRST_BLOCK // PATIENT_DRAWS
+
+    def get(self, pid: int):
+        """Return the record of patient pid."""
+        i = pid - self._first
+        if not 0 <= i < self._n:
+            self._refill(pid)
+            i = 0
+        return self._buf[i]
+
+    def _refill(self, pid: int):
+        # The counter of the first draw is incremented from 'counter', so
+        # patient pid always reads counter block pid + 1
+        gen = np.random.Generator(np.random.Philox(key=self._key, counter=pid))
+        u = gen.random((self._block, PATIENT_DRAWS))
+        if self._antithetic:
+            u = antithetic_uniforms(u)
+        self._buf = self._transform(u)
+        self._first = pid
+        self._n = len(self._buf)
+        self._block = min(2 * self._block, BLOCK_SIZE // PATIENT_DRAWS)
+
+
+# -------------------------
+# Vectorized transforms: U(0,1) block -> list of variates
+# -------------------------
+
+def exp_transform(mean: float) -> Callable[[np.ndarray], List[float]]:
+    """Exponential variates with the given mean (inverse CDF)."""
+    def transform(u: np.ndarray) -> List[float]:
+        return (-mean * np.log1p(-u)).tolist()
+    return transform
+
+
+def unif_transform(low: float, high: float) -> Callable[[np.ndarray], List[float]]:
+    """Uniform variates on [low, high)."""
+    width = high - low
+
+    def transform(u: np.ndarray) -> List[float]:
+        return (low + width * u).tolist()
+    return transform
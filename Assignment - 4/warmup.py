@@ -0,0 +1,129 @@
+import logging
+from dataclasses import astuple, replace
+from typing import Dict, List
+
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger("hospital_sim")
+
+# -------------------------
+# Pilot runs
+# -------------------------
+# Configs with warmup=None get their warm-up from N_PILOT pilot replications
+# started empty at time 0 and observed over PILOT_HORIZON in intervals of
+# PILOT_DT. Pilot seeds are fixed, so the detected warm-up depends only on the
+# config, not on the seeds of the production replications.
+
+N_PILOT = 10
+PILOT_HORIZON = 2000.0
+PILOT_DT = 5.0
+PILOT_SEED = 900_000
+
+# MSER-5: truncation is chosen on means of 5 consecutive observations
+MSER_BATCH = 5
+
+# Detected warm-up per config (see _cache_key)
+_cache: Dict[tuple, float] = {}
+
+
+def _cache_key(cfg: Config) -> tuple:
+    # Everything that changes the model, but not run length, seed or logging
+    return astuple(replace(cfg, warmup=None, sim_time=0.0, batches=1, seed=0, antithetic=False,
+                           controls=False, sketches=False, verbose=False))
+
+
+def pilot_series(results: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Time series of the pilot replications, one row per replication:
+    - prep_queue: time-average prep queue length in each interval
+    - theatre_state: fraction of each interval the theatre is held (busy or blocked)
+    """
+    return {
+        "prep_queue": np.array([[b["avg_prep_queue_length"] for b in res["batches"]] for res in results]),
+        "theatre_state": np.array([
+            [b["theatre_utilization"] + b["theatre_block_rate"] for b in res["batches"]]
+            for res in results
+        ]),
+    }
+
+
+def mser(y: np.ndarray, batch: int = MSER_BATCH) -> int:
+    """
+    MSER truncation point of the series y, in observations.
+
+    y is grouped into means of 'batch' observations z_1..z_m, and the number of
+    deleted batches d minimizes the marginal standard error
+        sum_{i>d} (z_i - mean(z_{d+1..m}))^2 / (m - d)^2
+    over d <= m/2 (later minima are not trusted).
+    """
+    m = len(y) // batch
+    if m < 2:
+        return 0
+    z = y[:m * batch].reshape(m, batch).mean(axis=1)
+
+    # Sums over the kept part z_{d+1..m} for every d
+    s1 = np.cumsum(z[::-1])[::-1]
+    s2 = np.cumsum((z * z)[::-1])[::-1]
+    n = np.arange(m, 0, -1)
+
+    stat = (s2 - s1 * s1 / n) / (n * n)
+    d = int(np.argmin(stat[:m // 2 + 1]))
+    return d * batch
+
+
+def truncation_point(series: Dict[str, np.ndarray]) -> int:
+    """
+    Truncation point over all pilot series: MSER-5 on each replication, the
+    median over the replications per series, and the latest of those.
+
+    The prep queue is zero most of the time, so MSER applied to a single
+    Welch ensemble average tends to lock on to a few late queue bursts; the
+    median of the per-replication points is much more stable.
+    """
+    return max(
+        int(np.median([mser(row) for row in rows])) for rows in series.values()
+    )
+
+
+def resolve_warmups(cfgs: List[Config]) -> List[Config]:
+    """
+    Return cfgs with every warmup=None replaced by the detected warm-up.
+    Pilot replications of all configs still to be detected run as one batch.
+    """
+    pending = {}
+    for cfg in cfgs:
+        if cfg.warmup is None:
+            key = _cache_key(cfg)
+            if key not in _cache and key not in pending:
+                pending[key] = cfg
+
+    if pending:
+        n_points = int(round(PILOT_HORIZON / PILOT_DT))
+        pilots = [
+            replace(cfg, warmup=0.0, sim_time=PILOT_HORIZON, batches=n_points)
+            for cfg in pending.values()
+        ]
+        jobs = [(pilot, PILOT_SEED + i) for pilot in pilots for i in range(N_PILOT)]
+        # Imported here: runner resolves warm-ups through this module
+        from runner import run_replications
+        all_res = run_replications(jobs)
+
+        for j, (key, cfg) in enumerate(pending.items()):
+            series = pilot_series(all_res[j * N_PILOT:(j + 1) * N_PILOT])
+            _cache[key] = truncation_point(series) * PILOT_DT
+            logger.info(
+                "Detected warm-up for P=%d, R=%d, OP=%d, scenario=%s: %.1f",
+                cfg.P, cfg.R, cfg.OP, cfg.scenario, _cache[key]
+            )
+
+    return [
+        replace(cfg, warmup=_cache[_cache_key(cfg)]) if cfg.warmup is None else cfg
+        for cfg in cfgs
+    ]
+
+
+def detect_warmup(cfg: Config) -> float:
+    """Warm-up length detected for cfg from pilot replications (cached per config)."""
+    return resolve_warmups([replace(cfg, warmup=None)])[0].warmup